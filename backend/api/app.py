@@ -3,39 +3,58 @@ import os
 import sys
 import uuid
 import datetime
-import tempfile
 import json
-from fastapi import FastAPI, UploadFile, File, Form, Request, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
+import asyncio
+import struct
+from functools import partial
+from fastapi import FastAPI, UploadFile, File, Form, Header, Request, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-import whisper
 import numpy as np
 import soundfile as sf
 from typing import Optional
-import shutil
-import debugpy
-# Enable debugging - with safety check
-try:
-    debugpy.listen(("0.0.0.0", 5678))
-    print("⏳ Waiting for debugger to attach...")
-    debugpy.wait_for_client()
-    print("🔍 Debugger attached!")
-except RuntimeError as e:
-    # If debugpy is already listening, just print a message
-    if "already been called" in str(e):
-        print("Debugger is already configured - continuing execution")
-    else:
-        # Re-raise if it's a different RuntimeError
-        raise
-
 
+# Remote debugging is opt-in so normal startup never blocks on a debugger
+DEBUGPY_LISTEN = os.environ.get("DEBUGPY_LISTEN")  # e.g. "0.0.0.0:5678"
+if DEBUGPY_LISTEN:
+    import debugpy
+    try:
+        host, _, port = DEBUGPY_LISTEN.rpartition(":")
+        debugpy.listen((host or "0.0.0.0", int(port)))
+        if os.environ.get("DEBUGPY_WAIT", "").lower() in ("1", "true", "yes"):
+            print("⏳ Waiting for debugger to attach...")
+            debugpy.wait_for_client()
+            print("🔍 Debugger attached!")
+    except RuntimeError as e:
+        # If debugpy is already listening, just print a message
+        if "already been called" in str(e):
+            print("Debugger is already configured - continuing execution")
+        else:
+            # Re-raise if it's a different RuntimeError
+            raise
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.audio_processing import noise_reduction, voice_isolation
-from utils.hipaa_compliance import encrypt_data, secure_storage
-from utils.summarization import generate_medical_summary
+from utils.audio_processing import prepare_speech_for_whisper, dsp_config, WHISPER_SAMPLE_RATE, PROCESSING_SAMPLE_RATE
+from utils.hipaa_compliance import encrypt_data, decrypt_data, access_control
+from utils.summarization import (
+    summarize_visit, summary_config, summarizer_info, ner_batcher, summary_batcher, MedicalTerms, NO_SPEECH_SUMMARY
+)
+from utils.transcription import TranscriptionExecutor, QueueFullError
+from utils.jobs import JobStore
+from utils.streaming import StreamingSessionManager
+from utils.session_store import SessionAudioStore, SequenceGap, chunk_decoder
+from utils.models import model_registry
+from utils.summary_store import SummaryStore
+from utils.ingest import (
+    ingest_upload, decode_file, decoder_config, decoder_available, UploadTooLarge, InvalidUpload, DecodeError,
+    DecoderUnavailable
+)
+from utils.result_cache import ResultCache, cache_key, digest_file
+from utils.audit import audit_log
+from utils.metrics import metrics, start_trace, timed, DURATION_BUCKETS, RTF_BUCKETS
 
 app = FastAPI(title="Patient Visit Summarizer API")
 
@@ -52,13 +71,101 @@ app.add_middleware(
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'uploads')
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'ogg', 'm4a'}
 MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50MB max upload
+MAX_FORM_OVERHEAD = 64 * 1024  # Room for form fields and multipart headers around the file
+UPLOAD_PATHS = {'/api/process-audio', '/api/jobs/process-audio'}
+
+# Keep intermediate WAVs (processed audio) on disk for debugging
+RETAIN_INTERMEDIATE_AUDIO = os.environ.get("RETAIN_INTERMEDIATE_AUDIO", "").lower() in ("1", "true", "yes")
+
+# Most frequent terms per category returned with each summary
+MEDICAL_TERMS_LIMIT = int(os.environ.get("MEDICAL_TERMS_LIMIT", 20))
+
+JOB_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'jobs')
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache')
+SUMMARY_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'summaries')
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(JOB_FOLDER, exist_ok=True)
+
+# Persistent job state for asynchronous processing
+job_store = JobStore(os.path.join(JOB_FOLDER, 'jobs.db'))
+
+# Encrypted visit summaries, indexed by patient and visit date
+summary_store = SummaryStore(SUMMARY_FOLDER)
+
+# Encrypted stage outputs, so repeated uploads of a recording skip the pipeline
+result_cache = ResultCache(CACHE_FOLDER)
+
+# Whisper runs in worker processes so decoding never blocks the event loop
+transcription_executor = TranscriptionExecutor()
+TRANSCRIPTION_RETRY_AFTER = 10  # Seconds clients should wait when the queue is full
+
+# Whisper loads in the worker processes, readiness waits for all of them
+model_registry.register("whisper", transcription_executor.warm_up)
+
+# Load models in the background at startup instead of on the first request
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "true").lower() in ("1", "true", "yes")
+
+@app.on_event("startup")
+def start_model_warm_up():
+    if MODEL_WARMUP:
+        print("Warming up models in the background...")
+        model_registry.warm_up()
+
+@app.on_event("shutdown")
+def stop_transcription_workers():
+    transcription_executor.shutdown()
+    summary_store.close()
+    audit_log.close()
+
+def decoder_unavailable(error):
+    # The server is missing a dependency, the upload itself may be fine
+    return HTTPException(status_code=503, detail=str(error))
+
+def authorize(patient_id, user_id):
+    # Reads of patient data are checked and audited as the requesting user
+    if not user_id:
+        raise HTTPException(status_code=401, detail="X-User-ID header is required")
+    if not access_control(patient_id, user_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+
+def transcription_queue_full():
+    return HTTPException(
+        status_code=503,
+        detail="Transcription queue is full, please retry later",
+        headers={"Retry-After": str(TRANSCRIPTION_RETRY_AFTER)}
+    )
+
+async def transcribe_stream_window(audio, prompt):
+    # Live sessions wait for a worker rather than dropping audio
+    result = await transcription_executor.transcribe(audio, wait=True, initial_prompt=prompt or None)
+    return result["text"]
+
+# Streaming session audio is appended to one file per session
+session_audio = SessionAudioStore(UPLOAD_FOLDER)
+
+def expire_session_audio(idle_seconds, live_session_ids):
+    # Abandoned sessions' audio is removed off the event loop, the sweep walks the session directories
+    asyncio.get_running_loop().run_in_executor(None, session_audio.expire_idle, idle_seconds, live_session_ids)
 
-# Load models
-print("Loading Whisper model...")
-speech_model = whisper.load_model("tiny")  # Use tiny model for demo, medical fine-tuned in production
+# Live sessions are transcribed window by window as chunks arrive
+streaming_sessions = StreamingSessionManager(transcribe_stream_window, on_sweep=expire_session_audio)
+STREAM_KEEPALIVE_SECONDS = 15
+# WebSocket audio frames start with the chunk's sequence number
+STREAM_FRAME_HEADER = struct.Struct('<I')
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    # Declared sizes are rejected before any of the body is read
+    if request.url.path in UPLOAD_PATHS:
+        try:
+            content_length = int(request.headers.get('content-length', 0))
+        except ValueError:
+            content_length = 0
+        if content_length > MAX_UPLOAD_SIZE + MAX_FORM_OVERHEAD:
+            return JSONResponse(status_code=413, content={"detail": f"Upload exceeds the {MAX_UPLOAD_SIZE // (1024 * 1024)}MB limit"})
+    return await call_next(request)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -70,116 +177,654 @@ except RuntimeError:
     print("Warning: Frontend static files not found. API will run without serving frontend.")
 
 @app.get('/api/health')
+@app.get('/api/health/live')
 def health_check():
     return {'status': 'ok', 'message': 'Patient Visit Summarizer API is running'}
 
-@app.post('/api/process-audio')
-async def process_audio(
-    audio: UploadFile = File(...),
-    patientId: str = Form('UNKNOWN'),
-    visitDate: Optional[str] = Form(None)
-):
+@app.get('/api/health/ready')
+def readiness_check():
+    """
+    Report whether every model is loaded and the audio decoder is installed,
+    with per-model state and load time
+    """
+    ready = model_registry.ready and decoder_available()
+    body = {
+        'status': 'ready' if ready else 'not_ready',
+        'models': model_registry.status(),
+        'decoder': {'available': decoder_available()},
+        'summarizer': summarizer_info()
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get('/api/transcription/stats')
+def transcription_stats():
+    return transcription_executor.stats()
+
+@app.get('/api/cache/stats')
+def cache_stats():
+    return result_cache.stats()
+
+# Per-visit metrics, stage latencies are recorded where the work happens
+AUDIO_SECONDS = metrics.histogram("visit_audio_seconds", "Length of processed recordings", buckets=DURATION_BUCKETS)
+VISIT_SECONDS = metrics.histogram("visit_seconds", "End-to-end processing time of a visit", ["endpoint"])
+VISIT_RTF = metrics.histogram("visit_real_time_factor", "Processing seconds per second of audio", ["endpoint"], buckets=RTF_BUCKETS)
+QUEUE_DEPTH = metrics.gauge("queue_depth", "Items waiting in each queue", ["queue"])
+RUNNING = metrics.gauge("transcription_running", "Transcription jobs running in workers")
+CACHE_BYTES = metrics.gauge("result_cache_bytes", "Size of the result cache entries")
+STREAM_SESSIONS = metrics.gauge("stream_sessions", "Live streaming sessions")
+STREAM_BUFFERED = metrics.gauge("stream_buffered_seconds", "Streamed audio waiting to be transcribed")
+
+def collect_queue_metrics():
+    transcription = transcription_executor.stats()
+    QUEUE_DEPTH.set(transcription["queue_depth"], queue="transcription")
+    RUNNING.set(transcription["running"])
+    QUEUE_DEPTH.set(ner_batcher.stats()["queued"], queue="ner")
+    QUEUE_DEPTH.set(summary_batcher.stats()["queued"], queue="summary")
+    QUEUE_DEPTH.set(audit_log.stats()["queued"], queue="audit")
+    STREAM_SESSIONS.set(len(streaming_sessions))
+    STREAM_BUFFERED.set(streaming_sessions.buffered_seconds())
+    CACHE_BYTES.set(result_cache.stats()["bytes"])
+
+metrics.register_collector(collect_queue_metrics)
+
+@app.get('/metrics')
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def finish_trace(trace, speech, endpoint):
+    """
+    Record a finished visit's duration and real-time factor
+    
+    Args:
+        trace: Trace started for the request
+        speech: Speech statistics of the recording
+        endpoint: Endpoint label for the metrics
+        
+    Returns:
+        Timing breakdown for the response
+    """
+    audio_seconds = speech["totalSeconds"]
+    timing = trace.to_dict(audio_seconds)
+    VISIT_SECONDS.observe(timing["totalSeconds"], endpoint=endpoint)
+    if audio_seconds:
+        AUDIO_SECONDS.observe(audio_seconds)
+        VISIT_RTF.observe(timing["realTimeFactor"], endpoint=endpoint)
+    return timing
+
+def retain_audio(audio_data, sample_rate, name):
+    """
+    Write an intermediate recording to the upload folder if retention is enabled
+    
+    Args:
+        audio_data: numpy array of audio data
+        sample_rate: sampling rate of audio data
+        name: File name prefix
+    """
+    if RETAIN_INTERMEDIATE_AUDIO:
+        sf.write(os.path.join(UPLOAD_FOLDER, f"{name}_{uuid.uuid4()}.wav"), audio_data, sample_rate)
+
+async def transcribe_speech(audio_data, speech_map, wait_for_worker=False):
+    """
+    Transcribe speech-only audio, skipping Whisper when no speech was found
+    
+    Args:
+        audio_data: 16 kHz float32 speech audio
+        speech_map: SpeechMap of the regions the audio was cut from
+        wait_for_worker: Wait for a transcription worker instead of failing when the queue is full
+        
+    Returns:
+        Tuple of (transcription text, segments timed in the original recording)
+    """
+    if speech_map.speech_samples == 0:
+        return "", []
+    result = await transcription_executor.transcribe(audio_data, wait=wait_for_worker)
+    segments = [
+        {"start": segment["start"], "end": segment["end"], "text": segment["text"].strip()}
+        for segment in result.get("segments", [])
+    ]
+    # Whisper timed the speech-only audio, the silence it never saw is added back
+    return result["text"], speech_map.map_segments(segments)
+
+async def transcribe_recording(audio_key, load_audio, on_stage=None, wait_for_worker=False, name="processed"):
+    """
+    Denoise and transcribe a recording, reusing a cached transcript
+    
+    The transcript is cached under the recording, DSP settings and Whisper
+    model. The processed audio is not cached: it is many times the size of
+    the transcript and would only save the denoising when the model changes.
+    
+    Args:
+        audio_key: Digest of the recording's audio
+        load_audio: Callable returning (audio samples, sample rate), only called on a cache miss
+        on_stage: Optional callback called with each stage name as it starts
+        wait_for_worker: Wait for a transcription worker instead of failing when the queue is full
+        name: File name prefix for retained intermediate audio
+        
+    Returns:
+        Tuple of (transcription text, speech statistics, segments timed in the original recording)
+    """
+    processed_key = cache_key(audio_key, dsp_config())
+    transcript_key = cache_key(processed_key, {"whisper": transcription_executor.model_name})
+    
+    if on_stage:
+        on_stage("denoise")
+    cached = await run_in_threadpool(result_cache.get_json, transcript_key, "transcript")
+    # Transcripts cached before segments were kept are transcribed again
+    if cached is not None and "segments" in cached:
+        return cached["text"], cached["speech"], cached["segments"]
+    
+    audio_data, sample_rate = await run_in_threadpool(load_audio)
+    
+    # Silence is dropped and the denoised 16 kHz speech goes straight to Whisper
+    audio_data, speech_map = await run_in_threadpool(prepare_speech_for_whisper, audio_data, sample_rate)
+    retain_audio(audio_data, WHISPER_SAMPLE_RATE, name)
+    speech = speech_map.stats()
+    
+    if on_stage:
+        on_stage("transcribe")
+    transcription, segments = await transcribe_speech(audio_data, speech_map, wait_for_worker)
+    await run_in_threadpool(
+        result_cache.put_json, transcript_key, "transcript",
+        {"text": transcription, "speech": speech, "segments": segments}
+    )
+    return transcription, speech, segments
+
+async def summarize_transcription(transcription, on_stage=None, raise_errors=False):
+    """
+    Summarize a transcript and rank its medical terms, reusing cached results
+    
+    Args:
+        transcription: Transcription text
+        on_stage: Optional callback called with 'ner' and 'summarize' as each step starts
+        raise_errors: Raise when summarization fails instead of reporting it in the summary text
+        
+    Returns:
+        Tuple of (summary text, ranked medical terms per category)
+    """
+    if not transcription.strip():
+        # Nothing was said, so there is nothing to look up or summarize
+        return NO_SPEECH_SUMMARY, MedicalTerms().to_dict(MEDICAL_TERMS_LIMIT)
+    
+    try:
+        summary_key = cache_key(transcription, await run_in_threadpool(summary_config))
+        summary = await run_in_threadpool(result_cache.get, summary_key, "summary")
+        medical_terms = await run_in_threadpool(result_cache.get_json, summary_key, "entities")
+        if summary is not None and medical_terms is not None:
+            return summary, medical_terms
+        
+        summary, terms = await run_in_threadpool(summarize_visit, transcription, on_stage=on_stage)
+    except Exception as e:
+        # Reported in the summary text and never cached
+        print(f"Error generating summary: {str(e)}")
+        if raise_errors:
+            raise RuntimeError(f"Error generating summary: {str(e)}") from e
+        return f"Error generating summary: {str(e)}", {}
+    
+    medical_terms = terms.to_dict(MEDICAL_TERMS_LIMIT)
+    await run_in_threadpool(result_cache.put, summary_key, "summary", summary)
+    await run_in_threadpool(result_cache.put_json, summary_key, "entities", medical_terms)
+    return summary, medical_terms
+
+async def run_visit_pipeline(audio_key, load_audio, patient_id, visit_date, on_stage=None, wait_for_worker=False,
+                             trace=None, timing=False, ingest=None, fail_on_summary_error=False):
+    """
+    Denoise, transcribe, summarize and store a visit recording
+    
+    Args:
+        audio_key: Cache key of the decoded recording
+        load_audio: Callable returning (audio samples, sample rate), only called on a cache miss
+        patient_id: ID of the patient
+        visit_date: Date of the visit
+        on_stage: Optional callback called with each stage name as it starts
+        wait_for_worker: Wait for a transcription worker instead of failing when the queue is full
+        trace: Trace started by the caller (a new one is started if not given)
+        timing: Add the per-stage timing breakdown to the response
+        ingest: Optional upload statistics (size, decoded length, peak memory) for the response
+        fail_on_summary_error: Raise when summarization fails rather than storing the error as the summary
+        
+    Returns:
+        Response dictionary with transcription and summary
+    """
+    trace = trace or start_trace()
+    
+    # Process audio (noise reduction and voice isolation) and transcribe
+    transcription, speech, segments = await transcribe_recording(
+        audio_key,
+        load_audio,
+        on_stage=on_stage,
+        wait_for_worker=wait_for_worker
+    )
+    
+    # Generate summary
+    summary, medical_terms = await summarize_transcription(
+        transcription, on_stage=on_stage, raise_errors=fail_on_summary_error
+    )
+    
+    # Save encrypted summary
+    if on_stage:
+        on_stage("store")
+    summary_id = await run_in_threadpool(summary_store.put, patient_id, visit_date, summary, medical_terms)
+    
+    response = {
+        'status': 'success',
+        'patientId': patient_id,
+        'visitDate': visit_date,
+        'transcription': transcription,
+        'segments': segments,
+        'speechDetected': bool(transcription.strip()),
+        'summary': summary,
+        'summaryId': summary_id,
+        'medicalTerms': medical_terms,
+        'speech': speech,
+        'summarizer': summarizer_info()
+    }
+    if ingest is not None:
+        response['ingest'] = ingest
+    timing_breakdown = finish_trace(trace, speech, "process_audio")
+    if timing:
+        response['timing'] = timing_breakdown
+    return response
+
+def validate_upload(audio):
     if not audio.filename:
         raise HTTPException(status_code=400, detail="No selected file")
     
     if not allowed_file(audio.filename):
         raise HTTPException(status_code=400, 
                            detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}")
+
+def upload_key(digest):
+    """Cache key of an upload decoded for the pipeline"""
+    return cache_key(digest, decoder_config(PROCESSING_SAMPLE_RATE))
+
+def form_flag(value):
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+@app.post('/api/process-audio')
+async def process_audio(request: Request):
+    """
+    Process an uploaded visit recording
     
-    if visitDate is None:
-        visitDate = datetime.datetime.now().strftime('%Y-%m-%d')
+    Multipart form with an `audio` file and optional `patientId`, `visitDate`
+    and `timing` fields. The file is decoded while it is received, straight
+    to mono float32 at the processing rate.
+    """
+    trace = start_trace()
+    try:
+        upload = await ingest_upload(
+            request.headers.get('content-type'),
+            request.stream(),
+            PROCESSING_SAMPLE_RATE,
+            MAX_UPLOAD_SIZE,
+            ALLOWED_EXTENSIONS
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DecodeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except DecoderUnavailable as e:
+        raise decoder_unavailable(e)
+    
+    patient_id = upload.fields.get('patientId', 'UNKNOWN')
+    visit_date = upload.fields.get('visitDate') or datetime.datetime.now().strftime('%Y-%m-%d')
     
     try:
-        # Save the uploaded file to a temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-        temp_filename = temp_file.name
-        temp_file.close()
-        
-        with open(temp_filename, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
+        return await run_visit_pipeline(
+            upload_key(upload.digest),
+            lambda: (upload.audio, upload.sample_rate),
+            patient_id,
+            visit_date,
+            trace=trace,
+            timing=form_flag(upload.fields.get('timing')),
+            ingest=upload.stats
+        )
+    
+    except QueueFullError:
+        raise transcription_queue_full()
+    
+    except DecoderUnavailable as e:
+        raise decoder_unavailable(e)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def job_response(job):
+    return {
+        'jobId': job['job_id'],
+        'status': job['status'],
+        'stage': job['stage'],
+        'patientId': job['patient_id'],
+        'visitDate': job['visit_date'],
+        'error': job['error'],
+        'createdAt': job['created_at'],
+        'updatedAt': job['updated_at']
+    }
+
+async def run_job(job_id):
+    """
+    Run the visit pipeline for a queued job, recording each stage
+    
+    Args:
+        job_id: ID of the job
+    """
+    job = await run_in_threadpool(job_store.get, job_id)
+    input_path = job['input_path']
+    try:
+        # Identical uploads are recognized by their bytes
+        with timed("hash"):
+            audio_key = upload_key(await run_in_threadpool(digest_file, input_path))
         
-        # Process audio (noise reduction and voice isolation)
-        audio_data, sample_rate = sf.read(temp_filename)
+        def load_audio():
+            with timed("decode"):
+                return decode_file(input_path, PROCESSING_SAMPLE_RATE)
         
-        # Apply noise reduction and voice isolation if the audio is not too short
-        if len(audio_data) > sample_rate * 0.5:  # At least 0.5 seconds of audio
-            audio_data = noise_reduction(audio_data.reshape(-1, 1), sample_rate)
-            audio_data = voice_isolation(audio_data, sample_rate)
-            
-            # Save processed audio
-            processed_filename = os.path.join(UPLOAD_FOLDER, f"processed_{uuid.uuid4()}.wav")
-            sf.write(processed_filename, audio_data, sample_rate)
+        result = await run_visit_pipeline(
+            audio_key,
+            load_audio,
+            job['patient_id'],
+            job['visit_date'],
+            on_stage=lambda stage: job_store.set_stage(job_id, stage),
+            wait_for_worker=True,
+            timing=True,
+            # A job whose summary failed is reported as failed, not completed with an error for a summary
+            fail_on_summary_error=True
+        )
+        # Results contain PHI, so they are kept encrypted in the job store
+        encrypted = await run_in_threadpool(encrypt_data, json.dumps(result))
+        await run_in_threadpool(job_store.complete, job_id, encrypted)
+    except Exception as e:
+        await run_in_threadpool(job_store.fail, job_id, str(e))
+    finally:
+        if input_path and os.path.exists(input_path):
+            os.remove(input_path)
+
+@app.on_event("startup")
+async def resume_unfinished_jobs():
+    for job in await run_in_threadpool(job_store.unfinished):
+        if job['input_path'] and os.path.exists(job['input_path']):
+            print(f"Resuming job {job['job_id']} from stage '{job['stage']}'")
+            asyncio.create_task(run_job(job['job_id']))
         else:
-            processed_filename = temp_filename
-        
-        # Transcribe audio
-        result = speech_model.transcribe(processed_filename)
-        transcription = result["text"]
-        
-        # Generate summary
-        summary = generate_medical_summary(transcription)
-        
-        # Save encrypted summary
-        summary_filename = os.path.join(UPLOAD_FOLDER, f"{patientId}_{uuid.uuid4()}.enc")
-        encrypted_summary = encrypt_data(summary)
-        secure_storage(encrypted_summary, summary_filename, patientId)
-        
-        # Clean up temporary file
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
+            await run_in_threadpool(job_store.fail, job['job_id'], "Input audio was lost before the job could run")
+
+def copy_upload(source, path, max_bytes):
+    """Copy an upload to disk, stopping as soon as it exceeds max_bytes"""
+    copied = 0
+    with open(path, "wb") as buffer:
+        for block in iter(lambda: source.read(1024 * 1024), b""):
+            copied += len(block)
+            if copied > max_bytes:
+                break
+            buffer.write(block)
+    if copied > max_bytes:
+        os.remove(path)
+        raise UploadTooLarge(f"Upload exceeds the {max_bytes // (1024 * 1024)}MB limit")
+
+@app.post('/api/jobs/process-audio', status_code=202)
+async def submit_process_audio_job(
+    background_tasks: BackgroundTasks,
+    audio: UploadFile = File(...),
+    patientId: str = Form('UNKNOWN'),
+    visitDate: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None)
+):
+    """
+    Queue a visit recording for processing and return a job ID immediately
+    
+    Retries that send the same Idempotency-Key header get the original job back.
+    """
+    validate_upload(audio)
+    
+    if visitDate is None:
+        visitDate = datetime.datetime.now().strftime('%Y-%m-%d')
+    
+    # Keep the upload next to the job store so the job can resume after a restart
+    extension = audio.filename.rsplit('.', 1)[1].lower()
+    input_path = os.path.join(JOB_FOLDER, f"{uuid.uuid4()}.{extension}")
+    try:
+        await run_in_threadpool(copy_upload, audio.file, input_path, MAX_UPLOAD_SIZE)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    job, created = await run_in_threadpool(job_store.create, patientId, visitDate, input_path, idempotency_key)
+    if created:
+        background_tasks.add_task(run_job, job['job_id'])
+    else:
+        await run_in_threadpool(os.remove, input_path)
+    
+    return job_response(job)
+
+@app.get('/api/summaries/{summary_id}')
+def get_summary(summary_id: str, x_user_id: Optional[str] = Header(None)):
+    patient_id = summary_store.patient_id(summary_id)
+    if patient_id is None:
+        raise HTTPException(status_code=404, detail="Summary not found")
+    authorize(patient_id, x_user_id)
+    summary = summary_store.get(summary_id, user=x_user_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Summary not found")
+    return summary
+
+@app.get('/api/patients/{patient_id}/summaries')
+def get_patient_summaries(patient_id: str, limit: int = 20, before: Optional[str] = None,
+                          include_summaries: bool = False, x_user_id: Optional[str] = Header(None)):
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    authorize(patient_id, x_user_id)
+    visits, next_cursor = summary_store.history(
+        patient_id, limit=limit, before=before, include_summaries=include_summaries, user=x_user_id
+    )
+    return {
+        "patientId": patient_id,
+        "visits": visits,
+        # Pass as `before` for the next page
+        "next": next_cursor
+    }
+
+@app.get('/api/patients/{patient_id}/audit')
+def get_audit_history(patient_id: str, limit: int = 100, before: Optional[int] = None,
+                      x_user_id: Optional[str] = Header(None)):
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    authorize(patient_id, x_user_id)
+    entries = audit_log.history(patient_id, limit=limit, before=before)
+    # Reading the trail is itself recorded in it
+    audit_log.record("audit_read", patient_id, user=x_user_id, entries=len(entries))
+    return {
+        "patientId": patient_id,
+        "entries": entries,
+        # Pass as `before` to page further back
+        "next": entries[0]["seq"] if len(entries) == limit else None
+    }
+
+@app.get('/api/jobs/{job_id}')
+def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job)
+
+@app.get('/api/jobs/{job_id}/result')
+def get_job_result(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if job['status'] == 'failed':
+        # The server is fine, the job has no result to return
+        raise HTTPException(status_code=409, detail=f"Job failed (stage: {job['stage']}): {job['error']}")
+    
+    if job['status'] != 'completed':
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']} (stage: {job['stage']})")
+    
+    return json.loads(decrypt_data(job['result']))
+
+def live_stream_session(session_id, stream_format):
+    """
+    Get the live transcriber of a session, creating it if needed
+    
+    Args:
+        session_id: ID of the streaming session
+        stream_format: Negotiated codec and sampleRate of the session
         
-        # Return response
-        return {
-            'status': 'success',
-            'patientId': patientId,
-            'visitDate': visitDate,
-            'transcription': transcription,
-            'summary': summary,
-            'summaryId': os.path.basename(summary_filename)
-        }
+    Returns:
+        StreamingSession
+    """
+    return streaming_sessions.get_or_create(
+        session_id, sample_rate=stream_format['sampleRate'],
+        decoder_factory=partial(chunk_decoder, stream_format) if stream_format['codec'] != 'f32' else None
+    )
+
+async def receive_stream_chunk(session_id, audio_data, seq=None, codec=None, sample_rate=None):
+    """
+    Store a sequenced chunk and feed it to the live transcriber
     
-    except Exception as e:
-        # Clean up temporary file in case of error
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
+    Args:
+        session_id: ID of the streaming session
+        audio_data: Chunk bytes in the session's codec
+        seq: Sequence number of the chunk, or None for the next one
+        codec: Optional chunk codec, fixed by the session's first chunk
+        sample_rate: Optional sample rate, fixed by the session's first chunk
         
-        raise HTTPException(status_code=500, detail=str(e))
+    Returns:
+        Acknowledgement with the chunk's seq, the nextSeq expected and whether it was a duplicate
+    """
+    stream_format = await run_in_threadpool(session_audio.negotiate, session_id, codec, sample_rate)
+    session = live_stream_session(session_id, stream_format)
+    async with session.receive_lock:
+        try:
+            if session.received_bytes == 0:
+                # A session recreated after a restart or an idle drop catches up on what is stored;
+                # encoded streams can't be decoded from the middle anyway
+                stored = await run_in_threadpool(session_audio.read_stored, session_id)
+                if stored:
+                    await session.receive(stored)
+            
+            # Resent chunks were already transcribed. New ones are decoded before they are
+            # stored, so a chunk the decoder rejects never becomes part of the recording
+            if not await run_in_threadpool(session_audio.check_chunk, session_id, audio_data, seq):
+                await session.receive(audio_data)
+        except DecodeError:
+            # A decoder that rejected its input can't continue, the next chunk starts a new one
+            if streaming_sessions.get(session_id) is session:
+                streaming_sessions.pop(session_id)
+            session.close()
+            raise
+        receipt = await run_in_threadpool(session_audio.append_chunk, session_id, audio_data, seq)
+    return {
+        'seq': receipt['seq'],
+        'nextSeq': receipt['nextSeq'],
+        'duplicate': receipt['duplicate'],
+        'transcript': session.status()
+    }
 
 @app.post('/api/stream-audio')
 async def stream_audio(request: Request):
     """
     Handle streaming audio chunks
+    
+    Send the chunk's sequence number in X-Chunk-Seq so retries are
+    recognized; chunks without it are appended in arrival order. The first
+    chunk may pick the session's format with X-Chunk-Codec ("f32", "s16"
+    or "opus" for WebM/Opus) and X-Sample-Rate; the default is float32 PCM
+    at 44.1 kHz.
     """
     # Get the session ID from headers or create a new one
     session_id = request.headers.get('X-Session-ID', str(uuid.uuid4()))
     
-    # Create session directory if it doesn't exist
-    session_dir = os.path.join(UPLOAD_FOLDER, session_id)
-    os.makedirs(session_dir, exist_ok=True)
-    
     try:
+        seq = request.headers.get('X-Chunk-Seq')
+        seq = int(seq) if seq is not None else None
+        codec = request.headers.get('X-Chunk-Codec')
+        sample_rate = request.headers.get('X-Sample-Rate')
+        
         # Get raw audio data from request
         audio_data = await request.body()
         
-        # Save this chunk
-        chunk_file = os.path.join(session_dir, f"chunk_{int(datetime.datetime.now().timestamp()*1000)}.raw")
-        with open(chunk_file, 'wb') as f:
-            f.write(audio_data)
-        
+        ack = await receive_stream_chunk(session_id, audio_data, seq, codec, sample_rate)
+        stream_format = await run_in_threadpool(session_audio.stream_format, session_id)
         return {
             'status': 'success',
             'session_id': session_id,
-            'message': 'Audio chunk received'
+            'message': 'Audio chunk received',
+            **stream_format,
+            **ack
         }
     
+    except SequenceGap as e:
+        raise HTTPException(status_code=409, detail={'message': str(e), 'expectedSeq': e.expected})
+    
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    except (ValueError, DecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    except DecoderUnavailable as e:
+        raise decoder_unavailable(e)
+    
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.websocket('/api/stream-audio/{session_id}/ws')
+async def stream_audio_socket(websocket: WebSocket, session_id: str, codec: Optional[str] = None,
+                              sampleRate: Optional[int] = None):
+    """
+    Stream audio chunks over one connection
+    
+    The codec and sampleRate query parameters pick the session's format,
+    as the headers of /api/stream-audio do. The server first sends
+    {"type": "ready", "nextSeq": n, "codec": ..., "sampleRate": ...}, so a
+    client reconnecting after a drop resends from chunk n. Each binary frame
+    is a little-endian uint32 sequence number followed by the chunk in the
+    session's codec, and is answered with an "ack" or, for a gap, an "error"
+    naming the expectedSeq.
+    """
+    try:
+        stream_format = await run_in_threadpool(session_audio.negotiate, session_id, codec, sampleRate)
+        next_seq = await run_in_threadpool(session_audio.next_seq, session_id)
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    await websocket.send_json({'type': 'ready', 'sessionId': session_id, 'nextSeq': next_seq, **stream_format})
+    
+    try:
+        while True:
+            frame = await websocket.receive_bytes()
+            if len(frame) < STREAM_FRAME_HEADER.size:
+                await websocket.send_json({'type': 'error', 'code': 'invalid', 'message': 'Frame has no header'})
+                continue
+            
+            seq, = STREAM_FRAME_HEADER.unpack_from(frame)
+            try:
+                ack = await receive_stream_chunk(session_id, frame[STREAM_FRAME_HEADER.size:], seq)
+            except SequenceGap as e:
+                await websocket.send_json({'type': 'error', 'code': 'gap', 'seq': seq, 'expectedSeq': e.expected})
+                continue
+            except DecoderUnavailable as e:
+                await websocket.send_json({'type': 'error', 'code': 'unavailable', 'seq': seq, 'message': str(e)})
+                continue
+            except (ValueError, RuntimeError, DecodeError, UploadTooLarge) as e:
+                await websocket.send_json({'type': 'error', 'code': 'invalid', 'seq': seq, 'message': str(e)})
+                continue
+            
+            await websocket.send_json({'type': 'ack', **ack})
+    
+    except WebSocketDisconnect:
+        pass
+
 @app.post('/api/complete-stream')
 async def complete_stream(request: Request):
     """
     Process completed audio stream
+    
+    Send "timing": true to get the per-stage timing breakdown in the response.
     """
+    trace = start_trace()
     data = await request.json()
     session_id = data.get('sessionId')
     patient_id = data.get('patientId', 'UNKNOWN')
@@ -188,73 +833,123 @@ async def complete_stream(request: Request):
     if not session_id:
         raise HTTPException(status_code=400, detail="No session ID provided")
     
-    session_dir = os.path.join(UPLOAD_FOLDER, session_id)
-    if not os.path.exists(session_dir):
-        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        if not await run_in_threadpool(session_audio.exists, session_id):
+            raise HTTPException(status_code=404, detail="Session not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     try:
-        # Combine all audio chunks
-        chunk_files = sorted([os.path.join(session_dir, f) for f in os.listdir(session_dir) if f.startswith('chunk_')])
-        
-        if not chunk_files:
+        stream = await run_in_threadpool(session_audio.stats, session_id)
+        if stream['storedBytes'] == 0 and not await run_in_threadpool(session_audio.num_samples, session_id):
             raise HTTPException(status_code=400, detail="No audio chunks found for this session")
         
-        # Combine chunks into a single file
-        combined_file = os.path.join(UPLOAD_FOLDER, f"{session_id}_combined.wav")
-        
-        # This is a simplified approach - in production would need to handle sample rates correctly
-        sample_rate = 44100
-        combined_data = np.array([], dtype=np.float32)
-        
-        for chunk_file in chunk_files:
-            with open(chunk_file, 'rb') as f:
-                # Assuming raw PCM 32-bit float data
-                chunk_data = np.frombuffer(f.read(), dtype=np.float32)
-                combined_data = np.append(combined_data, chunk_data)
-        
-        # Save combined audio
-        sf.write(combined_file, combined_data, sample_rate)
-        
-        # Process audio
-        if len(combined_data) > sample_rate * 0.5:
-            processed_data = noise_reduction(combined_data.reshape(-1, 1), sample_rate)
-            processed_data = voice_isolation(processed_data, sample_rate)
+        session = streaming_sessions.pop(session_id)
+        if session is not None:
+            # Earlier windows were transcribed while recording, only the tail is left
+            try:
+                with timed("finalize_stream"):
+                    async with session.receive_lock:
+                        transcription = await session.finalize()
+                speech = session.speech_stats()
+                # Windows are timed in the recording already
+                segments = [segment for segment in session.segments if segment["text"]]
+            except DecodeError as e:
+                # The stored chunks are decoded from scratch below
+                print(f"Live decoding of session {session_id} failed, processing the stored audio: {str(e)}")
+                session = None
+        if session is None:
+            # No live session (e.g. after a restart), process the whole recording
+            stream_format = await run_in_threadpool(session_audio.stream_format, session_id)
+            sample_rate = stream_format['sampleRate']
             
-            # Save processed audio
-            processed_file = os.path.join(UPLOAD_FOLDER, f"{session_id}_processed.wav")
-            sf.write(processed_file, processed_data, sample_rate)
-        else:
-            processed_file = combined_file
-        
-        # Transcribe audio
-        result = speech_model.transcribe(processed_file)
-        transcription = result["text"]
+            with timed("hash"):
+                digest = await run_in_threadpool(session_audio.digest, session_id)
+                audio_key = cache_key(stream_format, digest)
+            
+            def load_audio():
+                # float32 sessions are memory-mapped, no per-chunk copying
+                combined_data = session_audio.load(session_id)
+                retain_audio(combined_data, sample_rate, f"{session_id}_combined")
+                return combined_data, sample_rate
+            
+            # Process and transcribe audio
+            transcription, speech, segments = await transcribe_recording(
+                audio_key, load_audio, name=f"{session_id}_processed"
+            )
         
         # Generate summary
-        summary = generate_medical_summary(transcription)
+        summary, medical_terms = await summarize_transcription(transcription)
         
         # Save encrypted summary
-        summary_filename = os.path.join(UPLOAD_FOLDER, f"{patient_id}_{uuid.uuid4()}.enc")
-        encrypted_summary = encrypt_data(summary)
-        secure_storage(encrypted_summary, summary_filename, patient_id)
+        summary_id = await run_in_threadpool(summary_store.put, patient_id, visit_date, summary, medical_terms)
         
         # Clean up session files
-        for chunk_file in chunk_files:
-            os.remove(chunk_file)
+        await run_in_threadpool(session_audio.delete, session_id)
         
         # Return response
-        return {
+        response = {
             'status': 'success',
             'patientId': patient_id,
             'visitDate': visit_date,
             'transcription': transcription,
+            'segments': segments,
+            'speechDetected': bool(transcription.strip()),
             'summary': summary,
-            'summaryId': os.path.basename(summary_filename)
+            'summaryId': summary_id,
+            'medicalTerms': medical_terms,
+            'speech': speech,
+            'stream': stream,
+            'summarizer': summarizer_info()
         }
+        timing = finish_trace(trace, speech, "complete_stream")
+        if data.get('timing'):
+            response['timing'] = timing
+        return response
+    
+    except HTTPException:
+        raise
+    
+    except QueueFullError:
+        raise transcription_queue_full()
+    
+    except DecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    except DecoderUnavailable as e:
+        raise decoder_unavailable(e)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get('/api/stream-audio/{session_id}/transcript')
+async def stream_transcript(session_id: str):
+    """
+    Server-sent events with each partial transcript segment as it is decoded
+    """
+    session = streaming_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    async def events():
+        known = 0
+        while True:
+            segments = await session.wait_for_segments(known, timeout=STREAM_KEEPALIVE_SECONDS)
+            for segment in segments:
+                yield f"data: {json.dumps(segment)}\n\n"
+            known += len(segments)
+            
+            if session.finished and known >= len(session.segments):
+                yield "event: complete\ndata: {}\n\n"
+                break
+            if not session.finished and streaming_sessions.get(session_id) is not session:
+                # Session expired without being completed
+                break
+            if not segments:
+                yield ": keep-alive\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 if __name__ == '__main__':
     import uvicorn
     uvicorn.run(app, host='0.0.0.0', port=5000, log_level="debug")
\ No newline at end of file
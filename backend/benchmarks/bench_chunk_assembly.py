@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark for assembling streaming session audio from chunks
+
+Compares the previous np.append loop over chunk files against reading the
+chunk files into a preallocated array and against appending to a single
+memory-mapped session file.
+
+Usage:
+    python -m benchmarks.bench_chunk_assembly [--chunk-seconds S] [--counts 10 100 1000]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.session_store import SessionAudioStore, assemble_chunk_files
+
+def append_loop(chunk_files):
+    """The previous assembly: regrow the array for every chunk"""
+    combined_data = np.array([], dtype=np.float32)
+    for chunk_file in chunk_files:
+        with open(chunk_file, 'rb') as f:
+            chunk_data = np.frombuffer(f.read(), dtype=np.float32)
+            combined_data = np.append(combined_data, chunk_data)
+    return combined_data
+
+def memmap_store(store, session_id):
+    # Touch every sample so the mapping is actually read from disk
+    audio = store.load(session_id)
+    float(audio.sum())
+    return audio
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark session chunk assembly")
+    parser.add_argument("--chunk-seconds", type=float, default=1.0, help="Audio length of each chunk")
+    parser.add_argument("--sample-rate", type=int, default=44100, help="Sample rate of the chunks")
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000], help="Chunk counts to test")
+    args = parser.parse_args()
+    
+    chunk = np.random.rand(int(args.chunk_seconds * args.sample_rate)).astype(np.float32)
+    
+    print(f"{'chunks':>8} {'np.append':>14} {'preallocated':>14} {'memmap store':>14}")
+    for count in args.counts:
+        work_dir = tempfile.mkdtemp()
+        try:
+            chunk_files = []
+            for i in range(count):
+                chunk_file = os.path.join(work_dir, f"chunk_{i:06d}.raw")
+                with open(chunk_file, 'wb') as f:
+                    f.write(chunk.tobytes())
+                chunk_files.append(chunk_file)
+            
+            store = SessionAudioStore(os.path.join(work_dir, "store"))
+            for _ in range(count):
+                store.append("bench", chunk.tobytes())
+            
+            timings = [
+                time_call(append_loop, chunk_files),
+                time_call(assemble_chunk_files, chunk_files),
+                time_call(memmap_store, store, "bench")
+            ]
+            print(f"{count:>8} " + " ".join(f"{t:>11.1f} ms" for t in timings))
+        finally:
+            shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    main()
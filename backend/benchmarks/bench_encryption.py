@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for per-call encryption latency
+
+Compares deriving the PBKDF2 key on every call (the previous behaviour)
+against the cached ciphers handed out by KeyManager.
+
+Usage:
+    python -m benchmarks.bench_encryption [--calls N]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.hipaa_compliance import KeyManager, encrypt_data, decrypt_data
+import utils.hipaa_compliance as hipaa_compliance
+
+SAMPLE_SUMMARY = "PATIENT VISIT SUMMARY\n" + "Patient reports mild headache and fatigue. " * 40
+
+def time_calls(func, calls):
+    """
+    Time repeated calls of a function
+    
+    Args:
+        func: Zero-argument callable to time
+        calls: Number of calls
+        
+    Returns:
+        List of per-call latencies in milliseconds
+    """
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def report(label, latencies):
+    print(f"{label:<32} mean {statistics.mean(latencies):8.3f} ms   "
+          f"median {statistics.median(latencies):8.3f} ms   max {max(latencies):8.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark encrypt_data/decrypt_data latency")
+    parser.add_argument("--calls", type=int, default=20, help="Number of calls per mode")
+    args = parser.parse_args()
+    
+    key_dir = tempfile.mkdtemp()
+    original_manager = hipaa_compliance.key_manager
+    
+    try:
+        # ttl=0 expires every entry immediately, reproducing a derivation per call
+        for label, manager in [("uncached (PBKDF2/call)", KeyManager(key_dir, ttl=0)),
+                               ("cached KeyManager", KeyManager(key_dir))]:
+            hipaa_compliance.key_manager = manager
+            token = encrypt_data(SAMPLE_SUMMARY)
+            report(f"{label} encrypt", time_calls(lambda: encrypt_data(SAMPLE_SUMMARY), args.calls))
+            report(f"{label} decrypt", time_calls(lambda: decrypt_data(token), args.calls))
+    finally:
+        hipaa_compliance.key_manager = original_manager
+        shutil.rmtree(key_dir)
+
+if __name__ == "__main__":
+    main()
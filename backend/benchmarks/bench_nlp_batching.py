@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for batched NER and summarization
+
+Runs generate_medical_summary from many concurrent threads, as the API's
+thread pool does, and reports throughput and latency percentiles for each
+maximum batch size. A batch size of 1 is equivalent to no batching.
+
+Uses whichever spaCy and summarizer models resolve locally, so it runs
+offline (with the extractive summarizer if no model is available).
+
+Usage:
+    python -m benchmarks.bench_nlp_batching [--requests N] [--concurrency C] [--batch-sizes 1 4 8 16]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils.summarization as summarization
+from utils.models import model_registry
+
+PHRASES = [
+    "The patient reports a persistent cough for two weeks.",
+    "She has a history of hypertension and takes lisinopril daily.",
+    "Blood pressure today is 142 over 90.",
+    "We discussed reducing salt intake and increasing exercise.",
+    "He denies chest pain or shortness of breath.",
+    "The lungs are clear on auscultation.",
+    "Plan to order a chest x-ray and a complete blood count.",
+    "Follow up in three weeks or sooner if symptoms worsen.",
+]
+
+def synthetic_transcript(sentences, rng):
+    return " ".join(rng.choice(PHRASES) for _ in range(sentences))
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run_load(transcripts, concurrency):
+    latencies = []
+    
+    def timed(transcript):
+        start = time.perf_counter()
+        summarization.generate_medical_summary(transcript)
+        latencies.append(time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, transcripts))
+    return time.perf_counter() - start, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched NER and summarization under concurrent load")
+    parser.add_argument("--requests", type=int, default=64, help="Documents per batch size")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent requests")
+    parser.add_argument("--sentences", type=int, default=40, help="Sentences per synthetic transcript")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--window-ms", type=float, default=summarization.NLP_BATCH_WINDOW_MS)
+    args = parser.parse_args()
+    
+    rng = random.Random(0)
+    transcripts = [synthetic_transcript(args.sentences, rng) for _ in range(args.requests)]
+    
+    # Load models up front so the first batch size isn't charged for it
+    model_registry.get("nlp")
+    print(f"summarizer: {model_registry.get('summarizer').info}")
+    
+    summarization.NLP_BATCHING = True
+    print(f"{'max batch':>10} {'docs/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'avg batch':>10}")
+    for batch_size in args.batch_sizes:
+        for batcher in (summarization.ner_batcher, summarization.summary_batcher):
+            batcher.max_batch = batch_size
+            batcher.max_wait = args.window_ms / 1000 if batch_size > 1 else 0
+            batcher.batches = batcher.items = 0
+        
+        elapsed, latencies = run_load(transcripts, args.concurrency)
+        print(f"{batch_size:>10} {len(transcripts) / elapsed:>10.2f} "
+              f"{percentile(latencies, 0.5) * 1000:>10.1f} {percentile(latencies, 0.99) * 1000:>10.1f} "
+              f"{summarization.summary_batcher.stats()['avgBatchSize']:>10.2f}")
+
+if __name__ == "__main__":
+    main()
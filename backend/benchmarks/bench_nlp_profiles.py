@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the spaCy pipeline profiles
+
+Loads the NLP model once per profile in NLP_PROFILES and reports
+documents/second for nlp.pipe over synthetic visit transcripts, along
+with the active components and how many entities and sentences each
+profile finds.
+
+Usage:
+    python -m benchmarks.bench_nlp_profiles [--model en_core_web_sm] [--documents N] [--sentences S]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.summarization import NLP_PROFILES, load_nlp_pipeline
+from benchmarks.bench_nlp_batching import synthetic_transcript
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark spaCy pipeline profiles")
+    parser.add_argument("--model", default="en_core_web_sm", help="spaCy pipeline to load")
+    parser.add_argument("--documents", type=int, default=200, help="Documents per profile")
+    parser.add_argument("--sentences", type=int, default=40, help="Sentences per synthetic transcript")
+    parser.add_argument("--profiles", nargs="+", default=list(NLP_PROFILES))
+    args = parser.parse_args()
+    
+    rng = random.Random(0)
+    documents = [synthetic_transcript(args.sentences, rng) for _ in range(args.documents)]
+    
+    for profile in args.profiles:
+        nlp = load_nlp_pipeline(args.model, profile=profile)
+        # Warm up caches before timing
+        list(nlp.pipe(documents[:5]))
+        
+        start = time.perf_counter()
+        docs = list(nlp.pipe(documents))
+        elapsed = time.perf_counter() - start
+        
+        entities = sum(len(doc.ents) for doc in docs)
+        sentences = sum(len(list(doc.sents)) for doc in docs)
+        print(f"{profile:<8} {len(docs) / elapsed:8.1f} docs/s   {entities:6d} entities   "
+              f"{sentences:6d} sentences   [{', '.join(nlp.pipe_names)}]")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark suite for the visit pipeline
+
+Generates speech-like synthetic visit audio (harmonic voiced syllables
+grouped into utterances with pauses, over background noise) and times each
+stage on it: noise_reduction, voice_isolation, the full DSP front end,
+Whisper, generate_medical_summary, encrypt_data and secure_storage. It then
+drives the HTTP endpoints (file upload and chunked streaming) at each
+concurrency level, in-process through ASGI or against a running server
+with --url.
+
+Everything runs offline. Stages whose dependencies are missing (Whisper,
+a spaCy model) are reported as skipped rather than failing the run. Each
+request sends different audio so the result cache is not measured, unless
+--allow-cache is given. Results are written as JSON for comparison
+between releases.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--seconds 30 120] [--sample-rate 44100] [--repeat 3]
+        [--concurrency 1 4] [--requests 8] [--skip-stages | --skip-http] [--output results.json]
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import datetime
+import subprocess
+import importlib.util
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.bench_nlp_batching import synthetic_transcript
+
+STREAM_CHUNK_SECONDS = 1.0  # Length of each chunk posted to /api/stream-audio
+
+def speech_like_audio(seconds, sample_rate, seed=0):
+    """
+    Synthetic visit recording with speech-like structure
+
+    Utterances of 1-6 s separated by 0.3-2 s pauses, each made of 4-6 Hz
+    syllables of a harmonic voice with drifting pitch, over low-level noise.
+    The harmonics reach well into the voice band, so the VAD treats the
+    utterances as speech.
+
+    Args:
+        seconds: Length of the recording
+        sample_rate: Sampling rate
+        seed: Random seed, different seeds give different bytes
+
+    Returns:
+        1D float32 numpy array
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    audio = 0.01 * rng.standard_normal(total)
+
+    position = int(rng.uniform(0.2, 1.0) * sample_rate)
+    while position < total:
+        length = min(int(rng.uniform(1, 6) * sample_rate), total - position)
+        t = np.arange(length) / sample_rate
+        pitch = rng.uniform(120, 250) * (1 + 0.05 * np.sin(2 * np.pi * rng.uniform(0.2, 1) * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+        voice = sum(np.sin(k * phase) / np.sqrt(k) for k in range(1, 20))
+        syllables = np.clip(np.sin(2 * np.pi * rng.uniform(4, 6) * t), 0, None) ** 2
+        audio[position:position + length] += 0.2 * syllables * voice
+        position += length + int(rng.uniform(0.3, 2.0) * sample_rate)
+
+    return audio.astype(np.float32)
+
+def latency_stats(latencies):
+    ordered = sorted(latencies)
+    return {
+        "runs": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "min": ordered[0],
+        "max": ordered[-1]
+    }
+
+def time_stage(func, repeat):
+    """
+    Time repeated calls of a stage
+
+    Args:
+        func: Zero-argument callable
+        repeat: Number of timed calls
+
+    Returns:
+        Latency statistics in seconds, or the error if the stage failed
+    """
+    latencies = []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - start)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {str(e)}"}
+    return latency_stats(latencies)
+
+def describe(result):
+    if "mean" not in result:
+        return json.dumps(result)
+    line = f"mean {result['mean'] * 1000:9.1f} ms  p95 {result['p95'] * 1000:9.1f} ms"
+    if "realTimeFactor" in result:
+        line += f"  RTF {result['realTimeFactor']:.4f}"
+    return line
+
+def skipped(reason):
+    return {"skipped": reason}
+
+def with_rtf(result, seconds):
+    # Processing seconds per second of audio
+    if "mean" in result:
+        result["realTimeFactor"] = result["mean"] / seconds
+    return result
+
+def nlp_unavailable():
+    from utils.models import model_registry
+    try:
+        model_registry.get("nlp")
+    except Exception as e:
+        return str(e)
+    return None
+
+def bench_stages(args, work_dir):
+    from utils.audio_processing import (
+        noise_reduction, voice_isolation, resample_audio, prepare_speech_for_whisper, PROCESSING_SAMPLE_RATE
+    )
+    from utils.hipaa_compliance import encrypt_data, secure_storage
+    from utils.summarization import generate_medical_summary
+
+    results = {}
+    nlp_error = nlp_unavailable()
+    executor = None
+    if importlib.util.find_spec("whisper") is not None:
+        from utils.transcription import TranscriptionExecutor
+        executor = TranscriptionExecutor(model_name=args.whisper_model, workers=1, max_queue=0)
+        start = time.perf_counter()
+        executor.warm_up()
+        results["whisperLoadSeconds"] = time.perf_counter() - start
+
+    try:
+        for seconds in args.seconds:
+            print(f"Stages on {seconds:g} s of audio at {args.sample_rate} Hz")
+            audio = speech_like_audio(seconds, args.sample_rate)
+            processing = resample_audio(audio, args.sample_rate, PROCESSING_SAMPLE_RATE).astype(np.float32)
+            whisper_audio, speech_map = prepare_speech_for_whisper(audio, args.sample_rate)
+            # Roughly one sentence per four seconds of conversation
+            transcript = synthetic_transcript(max(1, int(seconds / 4)), random.Random(0))
+
+            stages = {
+                "noise_reduction": with_rtf(time_stage(
+                    lambda: noise_reduction(processing.reshape(-1, 1), PROCESSING_SAMPLE_RATE), args.repeat
+                ), seconds),
+                "voice_isolation": with_rtf(time_stage(
+                    lambda: voice_isolation(processing, PROCESSING_SAMPLE_RATE), args.repeat
+                ), seconds),
+                "prepare_speech_for_whisper": with_rtf(time_stage(
+                    lambda: prepare_speech_for_whisper(audio, args.sample_rate), args.repeat
+                ), seconds),
+            }
+            stages["prepare_speech_for_whisper"]["speech"] = speech_map.stats()
+
+            if executor is None:
+                stages["whisper"] = skipped("openai-whisper is not installed")
+            else:
+                stages["whisper"] = with_rtf(time_stage(
+                    lambda: asyncio.run(executor.transcribe(whisper_audio, wait=True)), args.repeat
+                ), seconds)
+
+            if nlp_error:
+                stages["generate_medical_summary"] = skipped(nlp_error)
+            else:
+                stages["generate_medical_summary"] = time_stage(lambda: generate_medical_summary(transcript), args.repeat)
+                stages["generate_medical_summary"]["transcriptWords"] = len(transcript.split())
+
+            # The first call derives the key, which is timed separately by bench_encryption
+            summary = "PATIENT VISIT SUMMARY\n" + transcript
+            encrypted = encrypt_data(summary)
+            stages["encrypt_data"] = time_stage(lambda: encrypt_data(summary), args.repeat)
+            stages["secure_storage"] = time_stage(
+                lambda: secure_storage(encrypted, os.path.join(work_dir, "summary.enc"), "BENCH"), args.repeat
+            )
+
+            for name, result in stages.items():
+                print(f"  {name:<28} {describe(result)}")
+            results[f"{seconds:g}s"] = stages
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+def encode_wav(audio, sample_rate):
+    import soundfile as sf
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, sample_rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+async def post_upload(client, audio, sample_rate, index):
+    response = await client.post(
+        "/api/process-audio",
+        files={"audio": ("visit.wav", encode_wav(audio, sample_rate), "audio/wav")},
+        data={"patientId": f"BENCH{index}", "timing": "true"}
+    )
+    return response
+
+async def post_stream(client, audio, sample_rate, index):
+    from utils.streaming import STREAM_SAMPLE_RATE
+    from utils.audio_processing import resample_audio
+
+    audio = resample_audio(audio, sample_rate, STREAM_SAMPLE_RATE).astype(np.float32)
+    session_id = f"bench-{index}-{time.time_ns()}"
+    chunk = int(STREAM_CHUNK_SECONDS * STREAM_SAMPLE_RATE)
+    for start in range(0, len(audio), chunk):
+        response = await client.post(
+            "/api/stream-audio", content=audio[start:start + chunk].tobytes(), headers={"X-Session-ID": session_id}
+        )
+        if response.status_code != 200:
+            return response
+    return await client.post(
+        "/api/complete-stream", json={"sessionId": session_id, "patientId": f"BENCH{index}", "timing": True}
+    )
+
+async def run_http_load(client, send, audios, sample_rate, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, server_stages = [], {}, {}
+
+    async def one(index, audio):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await send(client, audio, sample_rate, index)
+                status = str(response.status_code)
+            except Exception as e:
+                response, status = None, type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if response is not None and response.status_code == 200:
+                for stage, seconds in response.json().get("timing", {}).get("stages", {}).items():
+                    server_stages.setdefault(stage, []).append(seconds)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index, audio) for index, audio in enumerate(audios)))
+    elapsed = time.perf_counter() - start
+
+    result = latency_stats(latencies)
+    result.update({
+        "concurrency": concurrency,
+        "requestsPerSecond": len(audios) / elapsed,
+        "statuses": statuses,
+        # Mean server-side seconds per stage, from the responses' timing breakdown
+        "serverStages": {stage: sum(values) / len(values) for stage, values in server_stages.items()}
+    })
+    return result
+
+async def bench_http(args):
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=None)
+    else:
+        from api.app import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+
+    results = {}
+    async with client:
+        for seconds in args.seconds:
+            for concurrency in args.concurrency:
+                # A different seed per request keeps the result cache out of the measurement
+                audios = [
+                    speech_like_audio(seconds, args.sample_rate, seed=0 if args.allow_cache else index + 1)
+                    for index in range(args.requests)
+                ]
+                for endpoint, send in (("process_audio", post_upload), ("stream", post_stream)):
+                    result = await run_http_load(client, send, audios, args.sample_rate, concurrency)
+                    print(f"  {endpoint:<14} {seconds:>6g}s c={concurrency:<3} {result['requestsPerSecond']:.2f} req/s "
+                          f"p50 {result['p50']:.2f}s p95 {result['p95']:.2f}s {result['statuses']}")
+                    results.setdefault(endpoint, {}).setdefault(f"{seconds:g}s", []).append(result)
+
+        metrics = await client.get("/metrics")
+        if metrics.status_code == 200:
+            results["metrics"] = metrics.text
+    return results
+
+def metadata(args):
+    from utils.audio_processing import dsp_config
+    from utils.transcription import WHISPER_MODEL
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+        "dsp": dsp_config(),
+        "whisperModel": args.whisper_model or WHISPER_MODEL
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the visit pipeline end to end")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[30, 120], help="Lengths of the synthetic visits")
+    parser.add_argument("--sample-rate", type=int, default=44100, help="Sample rate of the synthetic audio")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="Concurrent HTTP requests")
+    parser.add_argument("--requests", type=int, default=8, help="HTTP requests per concurrency level")
+    parser.add_argument("--whisper-model", default=None, help="Whisper model for the stage benchmark")
+    parser.add_argument("--url", default=None, help="Benchmark a running server instead of the app in-process")
+    parser.add_argument("--allow-cache", action="store_true", help="Send identical audio so the result cache can hit")
+    parser.add_argument("--skip-stages", action="store_true", help="Only run the HTTP benchmark")
+    parser.add_argument("--skip-http", action="store_true", help="Only run the stage benchmark")
+    parser.add_argument("--output", default="bench_pipeline.json", help="JSON results file")
+    args = parser.parse_args()
+
+    from utils.transcription import WHISPER_MODEL
+    args.whisper_model = args.whisper_model or WHISPER_MODEL
+    if not args.allow_cache:
+        os.environ.setdefault("RESULT_CACHE_ENABLED", "false")
+    os.environ.setdefault("MODEL_WARMUP", "false")
+
+    results = {"meta": metadata(args)}
+    work_dir = tempfile.mkdtemp()
+    try:
+        if not args.skip_stages:
+            results["stages"] = bench_stages(args, work_dir)
+        if not args.skip_http:
+            if not args.url and importlib.util.find_spec("whisper") is None:
+                results["http"] = skipped("openai-whisper is not installed")
+            else:
+                print(f"HTTP endpoints{' at ' + args.url if args.url else ' (in-process)'}")
+                results["http"] = asyncio.run(bench_http(args))
+    finally:
+        shutil.rmtree(work_dir)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for transcript preprocessing
+
+Compares the previous per-filler re.sub loop with the compiled
+single-pass TranscriptPreprocessor on a synthetic transcript corpus, for
+the default filler list and for a large clinic lexicon, and checks both
+produce the same text.
+
+Usage:
+    python -m benchmarks.bench_preprocess_transcript [--documents N] [--sentences S] [--lexicon-size L]
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.summarization import DEFAULT_FILLERS, TranscriptPreprocessor
+from benchmarks.bench_nlp_batching import PHRASES
+
+def legacy_preprocess(text, fillers):
+    # The implementation TranscriptPreprocessor replaced
+    for filler in fillers:
+        text = re.sub(r'\b' + filler + r'\b', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s+([.,;:!?])', r'\1', text)
+    return text.strip()
+
+def synthetic_corpus(documents, sentences, fillers, rng):
+    corpus = []
+    for _ in range(documents):
+        words = []
+        for _ in range(sentences):
+            for word in rng.choice(PHRASES).split():
+                if rng.random() < 0.15:
+                    words.append(rng.choice(fillers))
+                words.append(word)
+        corpus.append(" ".join(words))
+    return corpus
+
+def measure(name, preprocess, corpus):
+    start = time.perf_counter()
+    results = [preprocess(text) for text in corpus]
+    elapsed = time.perf_counter() - start
+    megabytes = sum(len(text) for text in corpus) / 1e6
+    print(f"  {name:<10} {elapsed:8.3f}s  {megabytes / elapsed:8.2f} MB/s  {len(corpus) / elapsed:10.1f} docs/s")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcript preprocessing")
+    parser.add_argument("--documents", type=int, default=2000, help="Transcripts in the corpus")
+    parser.add_argument("--sentences", type=int, default=40, help="Sentences per transcript")
+    parser.add_argument("--lexicon-size", type=int, default=300, help="Fillers in the large lexicon")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    large = DEFAULT_FILLERS + [f"filler{i}" for i in range(args.lexicon_size - len(DEFAULT_FILLERS))]
+
+    for label, fillers in (("default lexicon", DEFAULT_FILLERS), (f"{len(large)}-entry lexicon", large)):
+        corpus = synthetic_corpus(args.documents, args.sentences, fillers, rng)
+        print(f"{label}: {len(corpus)} transcripts, {sum(len(text) for text in corpus) / 1e6:.1f} MB")
+
+        expected = measure("re.sub", lambda text: legacy_preprocess(text, fillers), corpus)
+        compiled = TranscriptPreprocessor(fillers)
+        results = measure("compiled", compiled, corpus)
+        print(f"  outputs match: {results == expected}")
+
+if __name__ == "__main__":
+    main()
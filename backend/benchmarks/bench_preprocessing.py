@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark for audio preprocessing at the input rate vs a canonical rate
+
+Times prepare_for_whisper with the DSP stages running at the input sample
+rate (the previous behaviour) and at PROCESSING_SAMPLE_RATE. Given a test
+set, each mode is also transcribed with Whisper and scored by word error
+rate so quality can be compared alongside speed.
+
+A test set is a directory of audio files, each with a reference transcript
+in a .txt file of the same name.
+
+Usage:
+    python -m benchmarks.bench_preprocessing [--seconds S] [--sample-rate SR] [--test-set DIR]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.audio_processing import prepare_for_whisper, PROCESSING_SAMPLE_RATE
+
+def synthetic_audio(seconds, sample_rate):
+    """Harmonic tone with amplitude modulation and background noise"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t))
+    voice = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((180, 360, 720, 1440)))
+    noise = 0.05 * np.random.normal(0, 1, len(t))
+    return (0.3 * envelope * voice + noise).astype(np.float32)
+
+def word_error_rate(reference, hypothesis):
+    """
+    Word-level Levenshtein distance divided by the reference length
+    
+    Args:
+        reference: Reference transcript
+        hypothesis: Transcribed text
+        
+    Returns:
+        Word error rate
+    """
+    normalize = lambda text: re.sub(r"[^\w\s']", " ", text.lower()).split()
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / max(1, len(ref))
+
+def load_test_set(directory):
+    """
+    Load (audio, sample rate, reference) triples from a test set directory
+    """
+    import soundfile as sf
+    
+    items = []
+    for name in sorted(os.listdir(directory)):
+        base, extension = os.path.splitext(name)
+        reference_file = os.path.join(directory, base + ".txt")
+        if extension == ".txt" or not os.path.exists(reference_file):
+            continue
+        audio, sample_rate = sf.read(os.path.join(directory, name), dtype='float32')
+        with open(reference_file) as f:
+            items.append((audio, sample_rate, f.read()))
+    return items
+
+def time_preprocessing(items, processing_rate, repeats):
+    elapsed = 0.0
+    outputs = []
+    for audio, sample_rate, _ in items:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            prepared = prepare_for_whisper(audio, sample_rate, processing_rate=processing_rate)
+            elapsed += time.perf_counter() - start
+        outputs.append(prepared)
+    return elapsed / repeats, outputs
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing at the input rate vs a canonical rate")
+    parser.add_argument("--seconds", type=float, default=60, help="Length of the synthetic recording")
+    parser.add_argument("--sample-rate", type=int, default=44100, help="Sample rate of the synthetic recording")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per mode")
+    parser.add_argument("--test-set", help="Directory of audio files with .txt reference transcripts")
+    parser.add_argument("--model", default="tiny", help="Whisper model used for WER")
+    args = parser.parse_args()
+    
+    if args.test_set:
+        items = load_test_set(args.test_set)
+    else:
+        items = [(synthetic_audio(args.seconds, args.sample_rate), args.sample_rate, None)]
+    audio_seconds = sum(len(audio) / sample_rate for audio, sample_rate, _ in items)
+    
+    model = None
+    if args.test_set:
+        import whisper
+        model = whisper.load_model(args.model)
+    
+    print(f"{len(items)} recording(s), {audio_seconds:.1f} s of audio")
+    for label, processing_rate in [("input rate", None), (f"{PROCESSING_SAMPLE_RATE} Hz", PROCESSING_SAMPLE_RATE)]:
+        elapsed, outputs = time_preprocessing(items, processing_rate, args.repeats)
+        line = f"{label:<12} {elapsed:8.3f} s   {audio_seconds / elapsed:8.1f}x real time"
+        
+        if model is not None:
+            errors = [
+                word_error_rate(reference, model.transcribe(prepared)["text"])
+                for prepared, (_, _, reference) in zip(outputs, items)
+            ]
+            line += f"   WER {np.mean(errors):.3f}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
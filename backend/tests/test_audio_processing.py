@@ -1,7 +1,7 @@
 import os
 import unittest
 import numpy as np
-from utils.audio_processing import noise_reduction, voice_isolation
+from utils.audio_processing import noise_reduction, voice_isolation, prepare_for_whisper, WHISPER_SAMPLE_RATE, BlockNoiseReducer, BandpassFilterBank, detect_speech, SpeechMap, speech_regions, prepare_speech_for_whisper
 
 class TestAudioProcessing(unittest.TestCase):
     def setUp(self):
@@ -38,5 +38,117 @@ class TestAudioProcessing(unittest.TestCase):
         # More sophisticated tests would analyze the frequency spectrum
         # to ensure speech frequencies are preserved
 
+    def test_prepare_for_whisper(self):
+        # Processed audio is handed to Whisper as a 16 kHz float32 array
+        prepared = prepare_for_whisper(self.noisy_signal, self.sample_rate)
+        
+        self.assertEqual(prepared.dtype, np.float32)
+        self.assertEqual(prepared.ndim, 1)
+        self.assertEqual(len(prepared), 2 * WHISPER_SAMPLE_RATE)
+
+    def test_block_noise_reduction(self):
+        # Long recordings are split into blocks but keep their length
+        processed_signal = noise_reduction(self.noisy_signal, self.sample_rate, block_seconds=0.5)
+        self.assertEqual(processed_signal.shape, self.noisy_signal.shape)
+        self.assertLess(np.mean(processed_signal**2), np.mean(self.noisy_signal**2))
+        
+        # Feeding the same audio in small pieces gives the same result
+        reducer = BlockNoiseReducer(self.sample_rate, block_seconds=0.5)
+        pieces = [reducer.process(self.noisy_signal[i:i + 3000]) for i in range(0, len(self.noisy_signal), 3000)]
+        streamed = np.concatenate(pieces + [reducer.flush()])
+        np.testing.assert_allclose(streamed, processed_signal.reshape(-1))
+
+    def test_block_noise_reduction_matches_whole_recording(self):
+        # Splitting a recording into blocks keeps the gating of the whole-recording path
+        sample_rate = 16000
+        t = np.arange(sample_rate * 24) / sample_rate
+        speech = 0.5 * np.sin(2 * np.pi * 440 * t) * ((t % 2) < 1)
+        noisy = (speech + 0.05 * np.random.default_rng(0).normal(size=len(t))).astype(np.float32)
+        
+        whole = noise_reduction(noisy, sample_rate, block_seconds=None).reshape(-1)
+        blocked = noise_reduction(noisy, sample_rate, block_seconds=10).reshape(-1)
+        self.assertLess(np.sqrt(np.mean((blocked - whole) ** 2)), 0.05 * np.sqrt(np.mean(whole ** 2)))
+    
+    def test_bandpass_filter_bank(self):
+        bank = BandpassFilterBank()
+        self.assertIs(bank.design(self.sample_rate), bank.design(self.sample_rate))
+        
+        # Speech frequencies pass, rumble and hiss are attenuated
+        t = np.arange(self.sample_rate) / self.sample_rate
+        for frequency, passes in [(20, False), (440, True), (10000, False)]:
+            tone = np.sin(2 * np.pi * frequency * t).astype(np.float32)
+            filtered = bank.filter(tone, self.sample_rate, zero_phase=True)
+            self.assertEqual(filtered.dtype, np.float32)
+            ratio = np.std(filtered) / np.std(tone)
+            self.assertTrue(ratio > 0.9 if passes else ratio < 0.1, f"{frequency} Hz kept {ratio:.2f}")
+        
+        # Block-wise filtering with carried state matches filtering in one go
+        audio = self.noisy_signal.reshape(-1).astype(np.float32)
+        whole = bank.filter(audio, self.sample_rate)
+        stream = bank.stream(self.sample_rate)
+        blocks = [stream.process(audio[i:i + 1000]) for i in range(0, len(audio), 1000)]
+        np.testing.assert_allclose(np.concatenate(blocks), whole, atol=1e-6)
+        
+        # In-place filtering reuses the input buffer
+        self.assertTrue(np.shares_memory(bank.filter(audio, self.sample_rate, inplace=True), audio))
+
+    def test_detect_speech(self):
+        # Speech-band tone bursts at 2-4 s and 7-8 s in 10 s of low noise
+        sample_rate = 16000
+        audio = 0.001 * np.random.normal(0, 1, 10 * sample_rate)
+        t = np.arange(2 * sample_rate) / sample_rate
+        audio[2 * sample_rate:4 * sample_rate] += 0.3 * np.sin(2 * np.pi * 440 * t)
+        audio[7 * sample_rate:8 * sample_rate] += 0.3 * np.sin(2 * np.pi * 440 * t[:sample_rate])
+        
+        regions = detect_speech(audio, sample_rate, pad_seconds=0)
+        self.assertEqual(len(regions), 2)
+        self.assertAlmostEqual(regions[0][0] / sample_rate, 2, delta=0.05)
+        self.assertAlmostEqual(regions[1][1] / sample_rate, 8, delta=0.05)
+        
+        speech_map = SpeechMap(regions, sample_rate, len(audio))
+        self.assertAlmostEqual(speech_map.speech_ratio, 0.3, delta=0.02)
+        self.assertEqual(len(speech_map.extract(audio)), speech_map.speech_samples)
+        # 2.5 s into the speech-only audio is 0.5 s into the second burst
+        self.assertAlmostEqual(speech_map.to_original(2.5), 7.5, delta=0.05)
+        # Segments come back JSON-ready, in recording time
+        segment, = speech_map.map_segments([{"start": 0.5, "end": 2.5, "text": "pain"}])
+        self.assertIsInstance(segment["start"], float)
+        self.assertAlmostEqual(segment["start"], 2.5, delta=0.05)
+        self.assertAlmostEqual(segment["end"], 7.5, delta=0.05)
+
+    def test_steady_audio_is_kept_when_no_speech_is_detected(self):
+        sample_rate = 16000
+        t = np.arange(5 * sample_rate) / sample_rate
+        steady = (0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+        
+        # No frame stands out from a recording at one level
+        self.assertEqual(detect_speech(steady, sample_rate), [])
+        self.assertEqual(speech_regions(steady, sample_rate), [(0, len(steady))])
+        audio, speech_map = prepare_speech_for_whisper(steady, sample_rate, processing_rate=sample_rate)
+        self.assertEqual(len(audio), len(steady))
+        self.assertEqual(speech_map.speech_ratio, 1.0)
+        
+        # Digital silence still yields nothing to transcribe
+        audio, speech_map = prepare_speech_for_whisper(np.zeros_like(steady), sample_rate, processing_rate=sample_rate)
+        self.assertEqual(len(audio), 0)
+        self.assertEqual(speech_map.speech_samples, 0)
+    
+    def test_extract_fades_at_cuts(self):
+        sample_rate = 16000
+        audio = np.ones(sample_rate, dtype=np.float32)
+        speech_map = SpeechMap([(0, 4000), (8000, 12000)], sample_rate, len(audio))
+        speech = speech_map.extract(audio)
+        
+        fade = int(0.01 * sample_rate)
+        self.assertEqual(len(speech), 8000)
+        # The recording's own start is untouched, both sides of the join ramp through zero
+        self.assertEqual(speech[0], 1.0)
+        self.assertLess(speech[3999], 0.01)
+        self.assertLess(speech[4000], 0.01)
+        self.assertTrue(np.all(np.diff(speech[4000:4000 + fade]) > 0))
+        self.assertEqual(speech[6000], 1.0)
+        # The original audio is not modified
+        self.assertTrue(np.all(audio == 1.0))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,111 @@
+import os
+import json
+import shutil
+import tempfile
+import time
+import threading
+import unittest
+from unittest import mock
+from utils.audit import AuditLog
+
+class TestAuditLog(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        # Cleanups run last-in first-out, so logs are closed before this
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def open_log(self, directory=None, **kwargs):
+        audit_log = AuditLog(directory or self.temp_dir, **kwargs)
+        self.addCleanup(audit_log.close)
+        return audit_log
+
+    def segment_files(self):
+        return sorted(name for name in os.listdir(self.temp_dir) if name.startswith("audit-"))
+
+    def test_concurrent_entries_are_group_committed(self):
+        audit_log = self.open_log()
+
+        def write(patient_id):
+            for i in range(50):
+                audit_log.record("secure_storage", patient_id, file_path=f"{patient_id}/{i}.enc")
+
+        threads = [threading.Thread(target=write, args=(f"P{n}",)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        audit_log.flush()
+
+        stats = audit_log.stats()
+        self.assertEqual(stats["entries"], 400)
+        self.assertLess(stats["commits"], 400)
+
+        history = audit_log.history("P3")
+        self.assertEqual([entry["file_path"] for entry in history], [f"P3/{i}.enc" for i in range(50)])
+        self.assertTrue(all(entry["patient_id"] == "P3" for entry in history))
+
+    def test_history_spans_segments_and_pages(self):
+        audit_log = self.open_log(segment_bytes=512, max_batch=4)
+        for i in range(40):
+            audit_log.record("access_attempt", "P1" if i % 2 else "P2", user=f"dr{i}")
+        audit_log.flush()
+
+        self.assertGreater(len(self.segment_files()), 1)
+        history = audit_log.history("P1")
+        self.assertEqual([entry["user"] for entry in history], [f"dr{i}" for i in range(1, 40, 2)])
+
+        latest = audit_log.history("P1", limit=5)
+        self.assertEqual(latest, history[-5:])
+        older = audit_log.history("P1", limit=5, before=latest[0]["seq"])
+        self.assertEqual(older, history[-10:-5])
+        self.assertEqual(audit_log.history("unknown"), [])
+
+    def test_unindexed_entries_are_recovered(self):
+        audit_log = AuditLog(self.temp_dir)
+        audit_log.record("secure_storage", "P1")
+        audit_log.close()
+
+        # Entries that reached the segment before a crash, and a torn last line
+        segment = os.path.join(self.temp_dir, self.segment_files()[-1])
+        with open(segment, "a") as f:
+            entry = {"timestamp": "2024-01-01T00:00:00", "action": "access_attempt", "patient_id": "P1", "seq": 2}
+            f.write(json.dumps(entry) + "\n")
+            f.write('{"timestamp": "2024-01-01T00:00:01", "act')
+
+        audit_log = self.open_log()
+        audit_log.record("secure_storage", "P1")
+        audit_log.flush()
+
+        history = audit_log.history("P1")
+        self.assertEqual([entry["seq"] for entry in history], [1, 2, 3])
+        self.assertEqual(history[1]["action"], "access_attempt")
+        # The torn segment is left as it is and writing continues in a new one
+        self.assertEqual(len(self.segment_files()), 2)
+
+    def test_fsync_policies(self):
+        for policy in ("commit", "interval", "none"):
+            audit_log = AuditLog(os.path.join(self.temp_dir, policy), fsync=policy)
+            audit_log.record("secure_storage", "P1")
+            audit_log.close()
+            self.assertEqual(len(self.open_log(os.path.join(self.temp_dir, policy)).history("P1")), 1)
+
+        with self.assertRaises(ValueError):
+            AuditLog(self.temp_dir, fsync="sometimes")
+
+    def test_interval_policy_syncs_the_last_group_when_idle(self):
+        with mock.patch("utils.audit.os.fsync", wraps=os.fsync) as fsync:
+            audit_log = self.open_log(fsync="interval", fsync_interval=1.0)
+            audit_log.record("secure_storage", "P1")
+            audit_log.flush()
+            self.assertEqual(fsync.call_count, 0)
+
+            # Nothing else is recorded, the writer syncs once the interval has passed
+            deadline = time.monotonic() + 5
+            while fsync.call_count == 0 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(fsync.call_count, 1)
+            time.sleep(0.3)
+            self.assertEqual(fsync.call_count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,10 @@
 import unittest
 import os
 import tempfile
-from utils.hipaa_compliance import encrypt_data, decrypt_data, secure_storage
+from unittest import mock
+from utils import hipaa_compliance
+from utils.audit import AuditLog
+from utils.hipaa_compliance import encrypt_data, decrypt_data, secure_storage, KeyManager
 
 class TestHipaaCompliance(unittest.TestCase):
     def setUp(self):
@@ -32,21 +35,79 @@ class TestHipaaCompliance(unittest.TestCase):
         encrypted_data = encrypt_data(self.test_data, self.test_password)
         test_file_path = os.path.join(self.temp_dir, "test_secure_storage.enc")
         
+        audit_log = AuditLog(self.temp_dir)
+        
         # Store the encrypted data
-        secure_storage(encrypted_data, test_file_path, "TEST001")
+        with mock.patch.object(hipaa_compliance, "audit_log", audit_log):
+            secure_storage(encrypted_data, test_file_path, "TEST001")
         
         # Check that the file exists
         self.assertTrue(os.path.exists(test_file_path))
         
-        # Check that the audit log was created
-        audit_log_path = os.path.join(self.temp_dir, "audit_TEST001.log")
-        self.assertTrue(os.path.exists(audit_log_path))
+        # Check that the write was audited
+        audit_log.flush()
+        history = audit_log.history("TEST001")
+        audit_log.close()
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0]["action"], "secure_storage")
+        self.assertEqual(history[0]["file_path"], test_file_path)
+        self.assertEqual(history[0]["user"], hipaa_compliance.SERVICE_USER)
         
         # Check that the stored data matches the encrypted data
         with open(test_file_path, 'rb') as f:
             stored_data = f.read()
         self.assertEqual(stored_data, encrypted_data)
     
+    def test_key_manager_caches_derived_keys(self):
+        manager = KeyManager(self.temp_dir)
+        
+        cipher = manager.get_cipher(self.test_password)
+        self.assertIs(manager.get_cipher(self.test_password), cipher)
+        self.assertEqual(manager.get_key(self.test_password), manager.get_key(self.test_password))
+        self.assertEqual(manager.derivations, 1)
+        
+        # A different password derives its own key
+        manager.get_cipher("OtherPassword")
+        self.assertEqual(manager.derivations, 2)
+    
+    def test_key_manager_expiry(self):
+        manager = KeyManager(self.temp_dir, ttl=0)
+        
+        manager.get_cipher(self.test_password)
+        manager.get_cipher(self.test_password)
+        self.assertEqual(manager.derivations, 2)
+        
+        # Keys expire too, without a cipher ever being built
+        manager = KeyManager(self.temp_dir, ttl=0)
+        manager.get_key(self.test_password)
+        manager.get_key(self.test_password)
+        self.assertEqual(manager.derivations, 2)
+    
+    def test_key_manager_sees_rotation_by_another_process(self):
+        manager = KeyManager(self.temp_dir, ttl=60)
+        old_key = manager.get_key(self.test_password)
+        
+        KeyManager(self.temp_dir).rotate()
+        self.assertEqual(manager.get_key(self.test_password), old_key)
+        
+        # Once the cached salts expire the new salt is read from disk
+        with mock.patch.object(hipaa_compliance.time, "monotonic", return_value=hipaa_compliance.time.monotonic() + 60):
+            self.assertNotEqual(manager.get_key(self.test_password), old_key)
+    
+    def test_key_manager_rotation(self):
+        manager = KeyManager(self.temp_dir)
+        old_key = manager.get_key(self.test_password)
+        token = manager.get_cipher(self.test_password).encrypt(b"before rotation")
+        
+        manager.rotate()
+        
+        # New data uses the new key, old data is still readable
+        self.assertNotEqual(manager.get_key(self.test_password), old_key)
+        self.assertEqual(manager.get_cipher(self.test_password).decrypt(token), b"before rotation")
+        
+        # Retired salts persist across managers
+        self.assertEqual(KeyManager(self.temp_dir).get_cipher(self.test_password).decrypt(token), b"before rotation")
+    
     def tearDown(self):
         # Clean up temp files
         for root, dirs, files in os.walk(self.temp_dir, topdown=False):
@@ -0,0 +1,136 @@
+import io
+import asyncio
+import hashlib
+import shutil
+import unittest
+import numpy as np
+import soundfile as sf
+from utils.ingest import (
+    ingest_upload, StreamingDecoder, UploadTooLarge, InvalidUpload, DecodeError, DecoderUnavailable, decoder_available
+)
+
+BOUNDARY = "visitboundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+def multipart_body(fields, filename, data):
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="audio"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b"\r\n"
+    )
+    parts.append(f"--{BOUNDARY}--\r\n".encode())
+    return b"".join(parts)
+
+async def in_chunks(body, size):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+class RecordingDecoder:
+    """Collects the bytes it is fed instead of decoding them"""
+
+    instances = []
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.data = bytearray()
+        self.feeds = 0
+        self.aborted = False
+        RecordingDecoder.instances.append(self)
+
+    def feed(self, data):
+        self.data.extend(data)
+        self.feeds += 1
+
+    def finish(self):
+        return np.zeros(self.sample_rate, dtype=np.float32)
+
+    def abort(self):
+        self.aborted = True
+
+    def stats(self):
+        return {"uploadBytes": len(self.data), "decodedSeconds": 1.0, "sampleRate": self.sample_rate, "peakBytes": 0}
+
+def ingest(body, max_bytes=1024 * 1024, chunk_size=1000):
+    return asyncio.run(ingest_upload(
+        CONTENT_TYPE, in_chunks(body, chunk_size), 16000, max_bytes, {"wav", "mp3"},
+        decoder_factory=RecordingDecoder
+    ))
+
+class TestIngest(unittest.TestCase):
+    def test_file_is_streamed_to_the_decoder(self):
+        data = np.random.default_rng(0).bytes(50000)
+        upload = ingest(multipart_body({"patientId": "P1", "timing": "true"}, "visit.mp3", data))
+
+        decoder = RecordingDecoder.instances[-1]
+        self.assertEqual(bytes(decoder.data), data)
+        self.assertGreater(decoder.feeds, 10)
+        self.assertEqual(upload.fields, {"patientId": "P1", "timing": "true"})
+        self.assertEqual(upload.filename, "visit.mp3")
+        self.assertEqual(upload.digest, hashlib.sha256(data).hexdigest())
+        self.assertEqual(len(upload.audio), 16000)
+
+    def test_oversized_upload_is_rejected_while_streaming(self):
+        body = multipart_body({}, "visit.wav", b"\0" * 200000)
+        with self.assertRaises(UploadTooLarge):
+            ingest(body, max_bytes=100000)
+
+        decoder = RecordingDecoder.instances[-1]
+        self.assertTrue(decoder.aborted)
+        self.assertLessEqual(len(decoder.data), 100000)
+
+    def test_invalid_uploads(self):
+        with self.assertRaises(InvalidUpload):
+            ingest(multipart_body({}, "notes.txt", b"text"))
+        with self.assertRaises(InvalidUpload):
+            ingest(f"--{BOUNDARY}--\r\n".encode())
+        with self.assertRaises(InvalidUpload):
+            asyncio.run(ingest_upload("application/json", in_chunks(b"{}", 10), 16000, 1024, {"wav"}))
+
+    def test_missing_decoder_is_not_a_decode_error(self):
+        # A server without ffmpeg must not blame the upload
+        self.assertFalse(decoder_available("no-such-ffmpeg"))
+        with self.assertRaises(DecoderUnavailable) as raised:
+            StreamingDecoder(16000, binary="no-such-ffmpeg")
+        self.assertNotIsInstance(raised.exception, DecodeError)
+
+@unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg is not installed")
+class TestStreamingDecoder(unittest.TestCase):
+    def wav_bytes(self, seconds, sample_rate=44100):
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        tone = 0.5 * np.sin(2 * np.pi * 440 * t)
+        buffer = io.BytesIO()
+        sf.write(buffer, np.stack([tone, tone], axis=1), sample_rate, format="WAV")
+        return buffer.getvalue()
+
+    def decode(self, data, **kwargs):
+        decoder = StreamingDecoder(16000, **kwargs)
+        try:
+            for start in range(0, len(data), 4096):
+                decoder.feed(data[start:start + 4096])
+            return decoder.finish(), decoder
+        except BaseException:
+            decoder.abort()
+            raise
+
+    def test_decodes_to_mono_float32_at_the_target_rate(self):
+        audio, decoder = self.decode(self.wav_bytes(2.0))
+        self.assertEqual(audio.dtype, np.float32)
+        self.assertEqual(audio.ndim, 1)
+        self.assertAlmostEqual(len(audio) / 16000, 2.0, places=2)
+        self.assertAlmostEqual(float(np.abs(audio).max()), 0.5, places=1)
+
+        stats = decoder.stats()
+        self.assertAlmostEqual(stats["decodedSeconds"], 2.0, places=2)
+        self.assertGreaterEqual(stats["peakBytes"], audio.nbytes)
+        self.assertLess(stats["peakBytes"], audio.nbytes + 64 * 1024)
+
+    def test_undecodable_and_overlong_audio(self):
+        with self.assertRaises(DecodeError):
+            self.decode(b"not audio" * 1000)
+        with self.assertRaises(UploadTooLarge):
+            self.decode(self.wav_bytes(3.0), max_seconds=1.0)
+
+if __name__ == "__main__":
+    unittest.main()
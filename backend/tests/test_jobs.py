@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+from utils.jobs import JobStore
+
+class TestJobStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "jobs.db")
+        self.store = JobStore(self.db_path)
+    
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.temp_dir)
+    
+    def test_job_lifecycle(self):
+        job, created = self.store.create("TEST001", "2024-01-01", "/tmp/visit.wav")
+        self.assertTrue(created)
+        self.assertEqual(job["status"], "queued")
+        
+        self.store.set_stage(job["job_id"], "transcribe")
+        self.assertEqual(self.store.get(job["job_id"])["status"], "running")
+        
+        self.store.complete(job["job_id"], b"encrypted result")
+        job = self.store.get(job["job_id"])
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(job["result"], b"encrypted result")
+        self.assertIsNone(job["input_path"])
+    
+    def test_idempotency_key(self):
+        first, _ = self.store.create("TEST001", "2024-01-01", "/tmp/a.wav", idempotency_key="retry-1")
+        second, created = self.store.create("TEST001", "2024-01-01", "/tmp/b.wav", idempotency_key="retry-1")
+        self.assertFalse(created)
+        self.assertEqual(first["job_id"], second["job_id"])
+    
+    def test_unfinished_jobs_survive_restart(self):
+        running, _ = self.store.create("TEST001", "2024-01-01", "/tmp/a.wav")
+        failed, _ = self.store.create("TEST002", "2024-01-01", "/tmp/b.wav")
+        self.store.set_stage(running["job_id"], "summarize")
+        self.store.fail(failed["job_id"], "boom")
+        self.store.close()
+        
+        self.store = JobStore(self.db_path)
+        unfinished = self.store.unfinished()
+        self.assertEqual([job["job_id"] for job in unfinished], [running["job_id"]])
+        self.assertEqual(unfinished[0]["stage"], "summarize")
+    
+    def test_unknown_stage(self):
+        job, _ = self.store.create("TEST001", "2024-01-01", "/tmp/a.wav")
+        with self.assertRaises(ValueError):
+            self.store.set_stage(job["job_id"], "bogus")
+
+if __name__ == "__main__":
+    unittest.main()
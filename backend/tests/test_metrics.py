@@ -0,0 +1,82 @@
+import time
+import asyncio
+import unittest
+from fastapi.concurrency import run_in_threadpool
+from utils.metrics import MetricsRegistry, STAGE_SECONDS, start_trace, timed, record_stage, max_rss_bytes
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("stage_seconds", "Stage time", ["stage"], buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.7, 3):
+            histogram.observe(value, stage="ner")
+
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE stage_seconds histogram", lines)
+        self.assertIn('stage_seconds_bucket{stage="ner",le="0.1"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="ner",le="1"} 3', lines)
+        self.assertIn('stage_seconds_bucket{stage="ner",le="+Inf"} 4', lines)
+        self.assertIn('stage_seconds_sum{stage="ner"} 4.25', lines)
+        self.assertIn('stage_seconds_count{stage="ner"} 4', lines)
+
+        with self.assertRaises(ValueError):
+            histogram.observe(1.0)
+        with self.assertRaises(ValueError):
+            registry.counter("stage_seconds", "Not a counter")
+
+    def test_counters_gauges_and_collectors(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("requests", "Requests")
+        gauge = registry.gauge("peak", "Peak", ["process"])
+        depth = registry.gauge("depth", "Queue depth")
+        queue = [1, 2, 3]
+        registry.register_collector(lambda: depth.set(len(queue)))
+
+        counter.inc()
+        counter.inc(2)
+        gauge.set_max(10, process="api")
+        gauge.set_max(5, process="api")
+        queue.pop()
+
+        lines = registry.render().splitlines()
+        self.assertIn("requests_total 3", lines)
+        self.assertIn('peak{process="api"} 10', lines)
+        self.assertIn("depth 2", lines)
+        self.assertIs(registry.counter("requests", "Requests"), counter)
+
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry()
+        registry.gauge("files", "Files", ["path"]).set(1, path='C:\\a "b"')
+        self.assertIn('files{path="C:\\\\a \\"b\\""} 1', registry.render())
+
+    def test_trace_collects_stages_across_threadpool_calls(self):
+        def work():
+            with timed("denoise"):
+                time.sleep(0.01)
+
+        async def request():
+            trace = start_trace()
+            await run_in_threadpool(work)
+            with timed("store"):
+                pass
+            record_stage("store", 0.5)
+            return trace
+
+        before = STAGE_SECONDS.samples()
+        trace = asyncio.run(request())
+        timing = trace.to_dict(audio_seconds=10)
+
+        self.assertGreaterEqual(timing["stages"]["denoise"], 0.01)
+        self.assertGreaterEqual(timing["stages"]["store"], 0.5)
+        self.assertEqual(timing["realTimeFactor"], timing["totalSeconds"] / 10)
+        self.assertGreater(len(STAGE_SECONDS.samples()), len(before))
+
+        # Stages outside a request only feed the histograms
+        record_stage("denoise", 0.1)
+        self.assertIsNone(trace.to_dict()["realTimeFactor"])
+
+    def test_max_rss(self):
+        self.assertGreater(max_rss_bytes(), 1024 * 1024)
+
+if __name__ == "__main__":
+    unittest.main()
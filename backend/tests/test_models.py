@@ -0,0 +1,67 @@
+import threading
+import unittest
+from utils.models import ModelRegistry, READY, FAILED, NOT_LOADED
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ModelRegistry()
+        self.loads = 0
+    
+    def load_model(self):
+        self.loads += 1
+        return f"model {self.loads}"
+    
+    def test_lazy_loading(self):
+        self.registry.register("fake", self.load_model)
+        self.assertEqual(self.registry.status()["fake"]["state"], NOT_LOADED)
+        self.assertFalse(self.registry.ready)
+        
+        self.assertEqual(self.registry.get("fake"), "model 1")
+        self.assertEqual(self.registry.get("fake"), "model 1")
+        self.assertEqual(self.loads, 1)
+        
+        status = self.registry.status()["fake"]
+        self.assertEqual(status["state"], READY)
+        self.assertIsNotNone(status["loadSeconds"])
+        self.assertTrue(self.registry.ready)
+    
+    def test_concurrent_callers_share_one_load(self):
+        started = threading.Event()
+        
+        def slow_loader():
+            started.wait()
+            return self.load_model()
+        
+        self.registry.register("slow", slow_loader)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.registry.get("slow"))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        started.set()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(results, ["model 1"] * 4)
+        self.assertEqual(self.loads, 1)
+    
+    def test_failed_load_is_reported_and_retried(self):
+        attempts = []
+        
+        def flaky_loader():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OSError("model files missing")
+            return "recovered"
+        
+        self.registry.register("flaky", flaky_loader)
+        self.registry.warm_up().join()
+        
+        status = self.registry.status()["flaky"]
+        self.assertEqual(status["state"], FAILED)
+        self.assertIn("model files missing", status["error"])
+        
+        self.assertEqual(self.registry.get("flaky"), "recovered")
+        self.assertTrue(self.registry.ready)
+
+if __name__ == "__main__":
+    unittest.main()
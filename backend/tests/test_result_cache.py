@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from utils.result_cache import ResultCache, cache_key, digest_file
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.temp_dir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def entry_files(self):
+        return [name for _, _, files in os.walk(self.root) for name in files]
+
+    def test_stage_outputs_round_trip_encrypted(self):
+        cache = ResultCache(self.root)
+        key = cache_key("recording", {"model": "tiny"})
+        audio = np.random.rand(1000).astype(np.float32)
+
+        self.assertIsNone(cache.get(key, "transcript"))
+        cache.put(key, "transcript", "Patient reports chest pain.")
+        cache.put(key, "audio", audio.tobytes())
+        cache.put_json(key, "speech", {"speechSeconds": 1.5})
+
+        self.assertEqual(cache.get(key, "transcript"), "Patient reports chest pain.")
+        np.testing.assert_array_equal(np.frombuffer(cache.get(key, "audio", binary=True), dtype=np.float32), audio)
+        self.assertEqual(cache.get_json(key, "speech"), {"speechSeconds": 1.5})
+
+        # Nothing readable is left on disk
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                with open(os.path.join(directory, name), "rb") as f:
+                    self.assertNotIn(b"chest pain", f.read())
+
+        stats = cache.stats()
+        self.assertEqual(stats["entries"], 3)
+        self.assertEqual(stats["stages"]["transcript"], {"hits": 1, "misses": 1})
+        self.assertEqual(stats["stages"]["audio"], {"hits": 1, "misses": 0})
+
+    def test_keys_depend_on_every_part(self):
+        self.assertEqual(cache_key("a", {"x": 1, "y": 2}), cache_key("a", {"y": 2, "x": 1}))
+        self.assertNotEqual(cache_key("a", {"x": 1}), cache_key("a", {"x": 2}))
+        self.assertNotEqual(cache_key("a", {"x": 1}), cache_key("b", {"x": 1}))
+
+        path = os.path.join(self.temp_dir, "audio.wav")
+        with open(path, "wb") as f:
+            f.write(os.urandom(3 * 1024 * 1024 + 7))
+        other = os.path.join(self.temp_dir, "copy.wav")
+        shutil.copy(path, other)
+        self.assertEqual(digest_file(path), digest_file(other))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResultCache(self.root)
+        cache.put("a" * 64, "summary", "x" * 1000)
+        entry_size = cache.stats()["bytes"]
+
+        cache = ResultCache(self.root, max_bytes=entry_size * 2)
+        cache.put("b" * 64, "summary", "x" * 1000)
+        self.assertIsNotNone(cache.get("a" * 64, "summary"))
+        cache.put("c" * 64, "summary", "x" * 1000)
+
+        self.assertIsNone(cache.get("b" * 64, "summary"))
+        self.assertIsNotNone(cache.get("a" * 64, "summary"))
+        self.assertIsNotNone(cache.get("c" * 64, "summary"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(len(self.entry_files()), 2)
+
+        # The index and sizes are rebuilt from disk
+        reopened = ResultCache(self.root, max_bytes=entry_size * 2)
+        self.assertEqual(reopened.stats()["bytes"], cache.stats()["bytes"])
+        self.assertIsNotNone(reopened.get("c" * 64, "summary"))
+
+        # Entries larger than the whole cache are not stored
+        reopened.put("d" * 64, "summary", "x" * 10000)
+        self.assertIsNone(reopened.get("d" * 64, "summary"))
+
+    def test_unreadable_entry_is_a_miss(self):
+        cache = ResultCache(self.root)
+        cache.put("a" * 64, "summary", "text")
+        path = os.path.join(self.root, "aa", f"{'a' * 64}.summary.enc")
+        with open(path, "wb") as f:
+            f.write(b"not a token")
+
+        self.assertIsNone(cache.get("a" * 64, "summary"))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_disabled_cache(self):
+        cache = ResultCache(self.root, enabled=False)
+        cache.put("a" * 64, "summary", "text")
+        self.assertIsNone(cache.get("a" * 64, "summary"))
+        self.assertFalse(os.path.exists(self.root))
+
+if __name__ == "__main__":
+    unittest.main()
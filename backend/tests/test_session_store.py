@@ -0,0 +1,221 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import unittest
+import numpy as np
+from utils.session_store import SessionAudioStore, SequenceGap, assemble_chunk_files, chunk_decoder
+
+def encode_opus(audio, sample_rate):
+    """Encode float32 audio to WebM/Opus as a browser's MediaRecorder would"""
+    return subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "f32le", "-ar", str(sample_rate), "-ac", "1",
+         "-i", "pipe:0", "-c:a", "libopus", "-b:a", "24k", "-f", "webm", "pipe:1"],
+        input=audio.tobytes(), capture_output=True, check=True
+    ).stdout
+
+class TestSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = SessionAudioStore(self.temp_dir)
+        self.chunks = [np.random.rand(n).astype(np.float32) for n in (100, 1, 2048)]
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def test_append_and_load(self):
+        for chunk in self.chunks:
+            total = self.store.append("session-1", chunk.tobytes())
+        
+        self.assertEqual(total, sum(len(chunk) for chunk in self.chunks))
+        audio = self.store.load("session-1")
+        self.assertIsInstance(audio, np.memmap)
+        np.testing.assert_array_equal(audio, np.concatenate(self.chunks))
+        
+        self.store.delete("session-1")
+        self.assertFalse(self.store.exists("session-1"))
+        self.assertEqual(len(self.store.load("session-1")), 0)
+    
+    def test_assemble_chunk_files(self):
+        chunk_files = []
+        for i, chunk in enumerate(self.chunks):
+            chunk_file = os.path.join(self.temp_dir, f"chunk_{i}.raw")
+            with open(chunk_file, 'wb') as f:
+                f.write(chunk.tobytes())
+            chunk_files.append(chunk_file)
+        
+        np.testing.assert_array_equal(assemble_chunk_files(chunk_files), np.concatenate(self.chunks))
+    
+    def test_sequenced_chunks_detect_duplicates_and_gaps(self):
+        for seq, chunk in enumerate(self.chunks[:2]):
+            receipt = self.store.append_chunk("session-1", chunk.tobytes(), seq)
+            self.assertFalse(receipt["duplicate"])
+        
+        # A resent chunk is acknowledged but not stored twice
+        self.assertTrue(self.store.check_chunk("session-1", self.chunks[0].tobytes(), 0))
+        self.assertFalse(self.store.check_chunk("session-1", self.chunks[2].tobytes(), 2))
+        receipt = self.store.append_chunk("session-1", self.chunks[0].tobytes(), 0)
+        self.assertTrue(receipt["duplicate"])
+        self.assertEqual(receipt["nextSeq"], 2)
+        with self.assertRaises(ValueError):
+            self.store.append_chunk("session-1", self.chunks[2].tobytes(), 1)
+        
+        with self.assertRaises(SequenceGap) as gap:
+            self.store.append_chunk("session-1", self.chunks[2].tobytes(), 5)
+        self.assertEqual(gap.exception.expected, 2)
+        
+        self.store.append_chunk("session-1", self.chunks[2].tobytes(), 2)
+        np.testing.assert_array_equal(self.store.load("session-1"), np.concatenate(self.chunks))
+        for seq, chunk in enumerate(self.chunks):
+            np.testing.assert_array_equal(self.store.load_chunk("session-1", seq), chunk)
+        self.assertIsNone(self.store.load_chunk("session-1", 3))
+    
+    def test_first_chunk_must_be_chunk_zero(self):
+        with self.assertRaises(SequenceGap) as gap:
+            self.store.append_chunk("session-1", self.chunks[0].tobytes(), 3)
+        self.assertEqual(gap.exception.expected, 0)
+        self.assertEqual(self.store.stats("session-1")["chunks"], 0)
+    
+    def test_idle_sessions_are_removed(self):
+        for session_id in ("idle", "live", "recent"):
+            self.store.append_chunk(session_id, self.chunks[0].tobytes(), 0)
+        past = time.time() - 120
+        for session_id in ("idle", "live"):
+            for name in os.listdir(self.store.session_dir(session_id)):
+                os.utime(os.path.join(self.store.session_dir(session_id), name), (past, past))
+        self.store.next_seq("never-stored")
+        
+        self.assertEqual(self.store.expire_idle(60, keep={"live"}), ["idle"])
+        self.assertFalse(os.path.exists(self.store.session_dir("idle")))
+        self.assertNotIn("idle", self.store._states)
+        self.assertNotIn("never-stored", self.store._states)
+        self.assertEqual(self.store.next_seq("live"), 1)
+        self.assertEqual(self.store.next_seq("recent"), 1)
+    
+    def test_interrupted_append_is_dropped_on_reload(self):
+        for seq, chunk in enumerate(self.chunks[:2]):
+            self.store.append_chunk("session-1", chunk.tobytes(), seq)
+        
+        # Audio of a third chunk reached the disk, its index record only partly
+        with open(self.store.audio_path("session-1"), 'ab') as f:
+            f.write(self.chunks[2].tobytes())
+        with open(self.store.index_path("session-1"), 'ab') as f:
+            f.write(b"\0" * 10)
+        
+        store = SessionAudioStore(self.temp_dir)
+        self.assertEqual(store.next_seq("session-1"), 2)
+        np.testing.assert_array_equal(store.load("session-1"), np.concatenate(self.chunks[:2]))
+        store.append_chunk("session-1", self.chunks[2].tobytes(), 2)
+        np.testing.assert_array_equal(store.load("session-1"), np.concatenate(self.chunks))
+    
+    def test_unsequenced_audio_is_kept_before_sequenced_chunks(self):
+        os.makedirs(self.store.session_dir("session-1"))
+        with open(self.store.audio_path("session-1"), 'wb') as f:
+            f.write(self.chunks[0].tobytes())
+        
+        store = SessionAudioStore(self.temp_dir)
+        self.assertEqual(store.next_seq("session-1"), 0)
+        store.append_chunk("session-1", self.chunks[1].tobytes(), 0)
+        np.testing.assert_array_equal(store.load("session-1"), np.concatenate(self.chunks[:2]))
+        np.testing.assert_array_equal(store.load_chunk("session-1", 0), self.chunks[1])
+    
+    def test_concurrent_sessions(self):
+        chunk = np.arange(160, dtype=np.float32)
+        
+        def stream(session_id):
+            for seq in range(50):
+                self.store.append_chunk(session_id, chunk.tobytes(), seq)
+                # Every chunk sent twice, as a client retrying on a lost acknowledgement would
+                self.store.append_chunk(session_id, chunk.tobytes(), seq)
+        
+        threads = [threading.Thread(target=stream, args=(f"session-{i}",)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        for i in range(20):
+            self.assertEqual(self.store.num_samples(f"session-{i}"), 50 * len(chunk))
+    
+    def test_int16_round_trip_is_bit_exact(self):
+        chunks = [np.random.randint(-2 ** 15, 2 ** 15, n).astype(np.int16) for n in (100, 1, 2048)]
+        stream_format = self.store.negotiate("session-1", "s16", 16000)
+        self.assertEqual(stream_format, {"codec": "s16", "sampleRate": 16000})
+        for seq, chunk in enumerate(chunks):
+            self.store.append_chunk("session-1", chunk.tobytes(), seq)
+        
+        self.assertEqual(self.store.stats("session-1")["storedBytes"], 2 * sum(len(chunk) for chunk in chunks))
+        np.testing.assert_array_equal(self.store.load_chunk("session-1", 1), chunks[1])
+        audio = SessionAudioStore(self.temp_dir).load("session-1")
+        self.assertEqual(audio.dtype, np.float32)
+        np.testing.assert_array_equal(audio * 2 ** 15, np.concatenate(chunks))
+        
+        # The live decoder gives the same samples chunk by chunk
+        decoder = chunk_decoder(stream_format)
+        np.testing.assert_array_equal(np.concatenate([decoder.decode(c.tobytes()) for c in chunks]), audio)
+    
+    def test_opus_stream_must_start_with_a_webm_header(self):
+        self.store.negotiate("session-1", "opus", 48000)
+        with self.assertRaises(ValueError):
+            self.store.check_chunk("session-1", b"not webm", 0)
+        with self.assertRaises(ValueError):
+            self.store.append_chunk("session-1", b"not webm", 0)
+        self.assertEqual(self.store.stats("session-1")["chunks"], 0)
+        
+        self.store.append_chunk("session-1", b"\x1a\x45\xdf\xa3 header", 0)
+        self.store.append_chunk("session-1", b"cluster", 1)
+        self.assertEqual(self.store.stats("session-1")["chunks"], 2)
+    
+    def test_format_is_fixed_by_the_first_chunk(self):
+        self.store.append("session-1", self.chunks[0].tobytes())
+        self.assertEqual(self.store.negotiate("session-1"), {"codec": "f32", "sampleRate": 44100})
+        self.assertEqual(self.store.negotiate("session-1", "f32", 44100), {"codec": "f32", "sampleRate": 44100})
+        with self.assertRaises(ValueError):
+            self.store.negotiate("session-1", "s16")
+        with self.assertRaises(ValueError):
+            self.store.negotiate("session-2", "mp3")
+        with self.assertRaises(ValueError):
+            self.store.negotiate("session-2", "s16", 1000)
+        
+        # Odd-length int16 chunks are partial samples
+        self.store.negotiate("session-2", "s16")
+        with self.assertRaises(ValueError):
+            self.store.append("session-2", b"abc")
+    
+    @unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg is not installed")
+    def test_opus_round_trip_error_is_bounded(self):
+        sample_rate = 16000
+        t = np.arange(5 * sample_rate) / sample_rate
+        audio = (0.3 * np.sin(2 * np.pi * 220 * t) + 0.2 * np.sin(2 * np.pi * 660 * t)).astype(np.float32)
+        encoded = encode_opus(audio, sample_rate)
+        
+        stream_format = self.store.negotiate("session-1", "opus", sample_rate)
+        pieces = [encoded[start:start + 1000] for start in range(0, len(encoded), 1000)]
+        for seq, piece in enumerate(pieces):
+            self.store.append_chunk("session-1", piece, seq)
+        
+        # An order of magnitude below float32 PCM at 44.1 kHz
+        stored = self.store.stats("session-1")["storedBytes"]
+        self.assertEqual(stored, len(encoded))
+        self.assertLess(stored * 10, len(t) / sample_rate * 44100 * 4)
+        
+        decoded = self.store.load("session-1")
+        self.assertEqual(len(decoded), len(audio))
+        snr = 10 * np.log10(np.sum(audio ** 2) / np.sum((decoded - audio) ** 2))
+        self.assertGreater(snr, 20)
+        
+        # Decoding chunk by chunk while streaming gives the same audio
+        decoder = chunk_decoder(stream_format)
+        live = [decoder.decode(piece) for piece in pieces] + [decoder.finish()]
+        np.testing.assert_array_equal(np.concatenate(live), decoded)
+    
+    def test_rejects_partial_samples_and_bad_ids(self):
+        with self.assertRaises(ValueError):
+            self.store.append("session-1", b"abc")
+        with self.assertRaises(ValueError):
+            self.store.append("../escape", self.chunks[0].tobytes())
+
+if __name__ == "__main__":
+    unittest.main()
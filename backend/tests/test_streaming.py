@@ -0,0 +1,122 @@
+import asyncio
+import unittest
+import numpy as np
+from utils.streaming import StreamingSession, StreamingSessionManager, find_quiet_cut
+
+class LaggingDecoder:
+    """Decodes int16 chunks one chunk late, as a compressed stream's decoder lags its input"""
+
+    def __init__(self):
+        self.held = b""
+        self.aborted = False
+
+    def decode(self, data):
+        ready, self.held = self.held, data
+        return np.frombuffer(ready, dtype=np.int16).astype(np.float32) / 2 ** 15
+
+    def finish(self):
+        return self.decode(b"")
+
+    def abort(self):
+        self.aborted = True
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.sample_rate = 16000
+        self.calls = []
+    
+    async def fake_transcribe(self, audio, prompt):
+        self.calls.append(len(audio))
+        return f"window {len(self.calls)}"
+    
+    def tone(self, seconds):
+        t = np.arange(int(seconds * self.sample_rate)) / self.sample_rate
+        return (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    
+    def speech_like(self, seconds):
+        # Tone bursts separated by pauses, so the VAD finds speech in every window
+        audio = self.tone(seconds)
+        audio[(np.arange(len(audio)) // (self.sample_rate // 2)) % 2 == 1] *= 0.001
+        return audio
+    
+    def test_find_quiet_cut(self):
+        audio = self.tone(4)
+        # Silence between 2.5 s and 2.6 s
+        audio[int(2.5 * self.sample_rate):int(2.6 * self.sample_rate)] = 0
+        cut = find_quiet_cut(audio, self.sample_rate, search_seconds=3)
+        self.assertGreaterEqual(cut, int(2.5 * self.sample_rate))
+        self.assertLess(cut, int(2.6 * self.sample_rate))
+    
+    def test_windows_transcribed_incrementally(self):
+        async def run():
+            session = StreamingSession("test", self.fake_transcribe, sample_rate=self.sample_rate, window_seconds=4)
+            for _ in range(10):
+                session.add_chunk(self.speech_like(1))
+                await asyncio.sleep(0.01)
+            await session._task
+            partial_segments = len(session.segments)
+            
+            transcript = await session.finalize()
+            return session, partial_segments, transcript
+        
+        session, partial_segments, transcript = asyncio.run(run())
+        
+        # Full windows were transcribed before completion
+        self.assertGreaterEqual(partial_segments, 2)
+        self.assertTrue(session.finished)
+        self.assertEqual(session.processed_samples, 10 * self.sample_rate)
+        self.assertEqual(len(self.calls), len(session.segments))
+        self.assertEqual(transcript, " ".join(f"window {i + 1}" for i in range(len(self.calls))))
+        self.assertEqual(session.segments[-1]["end"], 10.0)
+    
+    def test_silent_windows_skip_transcription(self):
+        async def run():
+            session = StreamingSession("test", self.fake_transcribe, sample_rate=self.sample_rate, window_seconds=4)
+            session.add_chunk(np.zeros(8 * self.sample_rate, dtype=np.float32))
+            await session.finalize()
+            return session
+        
+        session = asyncio.run(run())
+        self.assertEqual(self.calls, [])
+        self.assertEqual(session.speech_stats()["speechRatio"], 0.0)
+        self.assertEqual(session.segments[-1]["end"], 8.0)
+
+    def test_decoded_chunks_and_held_back_tail(self):
+        async def run():
+            session = StreamingSession(
+                "test", self.fake_transcribe, sample_rate=self.sample_rate, window_seconds=4,
+                decoder_factory=LaggingDecoder
+            )
+            for _ in range(6):
+                await session.receive((self.speech_like(1) * 2 ** 14).astype(np.int16).tobytes())
+            received = session.received_samples
+            await session.finalize()
+            return session, received
+        
+        session, received = asyncio.run(run())
+        self.assertEqual(received, 5 * self.sample_rate)
+        # finalize() collected the last chunk from the decoder
+        self.assertEqual(session.processed_samples, 6 * self.sample_rate)
+        self.assertIsNone(session.decoder)
+    
+    def test_close_aborts_decoder(self):
+        session = StreamingSession("test", self.fake_transcribe, decoder_factory=LaggingDecoder)
+        decoder = session.decoder
+        session.close()
+        self.assertTrue(decoder.aborted)
+    
+    def test_idle_sessions_are_dropped_and_swept(self):
+        sweeps = []
+        manager = StreamingSessionManager(self.fake_transcribe, idle_seconds=60,
+                                          on_sweep=lambda idle, live: sweeps.append((idle, live)))
+        idle = manager.get_or_create("idle", decoder_factory=LaggingDecoder)
+        manager.get_or_create("live")
+        idle.last_activity -= 120
+        
+        manager.expire_idle(force=True)
+        self.assertIsNone(manager.get("idle"))
+        self.assertIsNone(idle.decoder)
+        self.assertEqual(sweeps, [(60, {"live"})])
+
+if __name__ == "__main__":
+    unittest.main()
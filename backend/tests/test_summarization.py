@@ -0,0 +1,239 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from utils import summarization
+from utils.metrics import metrics
+from utils.summarization import (
+    summarizer_model_sources, load_summarizer, chunk_sentences, summarize_long_text, split_sentences, MicroBatcher, BatchingSummarizer,
+    load_nlp_pipeline, extract_medical_terms, preprocess_transcript, TranscriptPreprocessor, structure_summary,
+    summarize_visit, NO_SPEECH_SUMMARY
+)
+
+class RecordingSummarizer:
+    # Keeps the first three words of each input and records every call
+    max_input_tokens = 20
+    
+    def __init__(self):
+        self.inputs = []
+    
+    def count_tokens(self, text):
+        return len(text.split())
+    
+    def __call__(self, text, **kwargs):
+        texts = text if isinstance(text, list) else [text]
+        self.inputs.extend(texts)
+        results = [{'summary_text': " ".join(item.split()[:3]) + "."} for item in texts]
+        return results
+
+class TestSummarization(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def test_model_sources_are_offline_by_default(self):
+        sources = summarizer_model_sources("org/model", "abc123", self.temp_dir, allow_download=False)
+        self.assertEqual([name for name, _ in sources], ["cache"])
+        self.assertTrue(sources[0][1]["local_files_only"])
+        self.assertEqual(sources[0][1]["revision"], "abc123")
+    
+    def test_model_directory_preferred(self):
+        with open(os.path.join(self.temp_dir, "config.json"), "w") as f:
+            f.write("{}")
+        
+        sources = summarizer_model_sources("org/model", "a" * 40, self.temp_dir, allow_download=True)
+        self.assertEqual([name for name, _ in sources], ["local_dir", "cache", "download"])
+        self.assertEqual(sources[0][1]["pretrained_model_name_or_path"], self.temp_dir)
+        self.assertNotIn("local_files_only", sources[2][1])
+    
+    def test_unpinned_revisions_are_never_downloaded(self):
+        for revision in (None, "main"):
+            sources = summarizer_model_sources("org/model", revision, self.temp_dir, allow_download=True)
+            self.assertEqual([name for name, _ in sources], ["cache"])
+
+    def test_loaded_backend_is_exported(self):
+        with mock.patch.object(summarization, "summarizer_model_sources", return_value=[]):
+            summarizer = load_summarizer()
+        self.assertEqual(summarizer.info["backend"], "extractive")
+        self.assertIn('summarizer_backend{backend="extractive",model="",revision=""} 1', metrics.render())
+
+    def test_chunk_sentences(self):
+        sentences = [f"Sentence number {i} is here." for i in range(10)]
+        chunks = chunk_sentences(sentences, 12, lambda text: len(text.split()))
+        
+        self.assertEqual(" ".join(chunks), " ".join(sentences))
+        self.assertTrue(all(len(chunk.split()) <= 12 for chunk in chunks))
+        
+        # A run-on sentence is split on word boundaries
+        chunks = chunk_sentences([" ".join(["word"] * 50)], 12, lambda text: len(text.split()))
+        self.assertTrue(all(len(chunk.split()) <= 12 for chunk in chunks))
+        self.assertEqual(sum(len(chunk.split()) for chunk in chunks), 50)
+    
+    def test_long_text_is_summarized_in_full(self):
+        sentences = [f"Topic{i} was discussed at length today." for i in range(40)]
+        text = " ".join(sentences)
+        summarizer = RecordingSummarizer()
+        
+        summarize_long_text(text, summarizer, batch_size=4)
+        
+        # Every sentence reached the model within its input limit
+        for i in range(40):
+            self.assertTrue(any(f"Topic{i} " in item for item in summarizer.inputs))
+        self.assertTrue(all(len(item.split()) <= summarizer.max_input_tokens for item in summarizer.inputs))
+        self.assertEqual(split_sentences(text), sentences)
+
+    def test_short_text_is_returned_unchanged(self):
+        summarizer = RecordingSummarizer()
+        for text in ["Cough.", "The cough is better since Monday."]:
+            self.assertEqual(summarize_long_text(text, summarizer), text)
+        self.assertEqual(summarizer.inputs, [])
+    
+    def test_micro_batcher_groups_concurrent_items(self):
+        batches = []
+        
+        def process(items):
+            batches.append(list(items))
+            return [item * 2 for item in items]
+        
+        batcher = MicroBatcher(process, max_batch=4, max_wait=0.2)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(batcher, range(8)))
+        
+        self.assertEqual(results, [i * 2 for i in range(8)])
+        self.assertTrue(all(len(batch) <= 4 for batch in batches))
+        self.assertLess(len(batches), 8)
+        self.assertEqual(batcher.stats()["items"], 8)
+    
+    def test_micro_batcher_propagates_errors(self):
+        def process(items):
+            raise ValueError("model failed")
+        
+        batcher = MicroBatcher(process, max_wait=0)
+        with self.assertRaises(ValueError):
+            batcher(1)
+    
+    def test_micro_batcher_resolves_every_future(self):
+        # A batch that loses a result fails all of its callers instead of leaving one waiting
+        batcher = MicroBatcher(lambda items: [item * 2 for item in items][1:], max_batch=4, max_wait=0.2)
+        futures = [batcher.submit(i) for i in range(4)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+        
+        # Callers that time out stop waiting, and their queued items are skipped
+        started = threading.Event()
+        release = threading.Event()
+        processed = []
+        
+        def process(items):
+            started.set()
+            release.wait(5)
+            processed.extend(items)
+            return items
+        
+        batcher = MicroBatcher(process, max_batch=1, max_wait=0)
+        first = batcher.submit("first")
+        started.wait(5)
+        with self.assertRaises(FutureTimeoutError):
+            batcher("second", timeout=0.05)
+        release.set()
+        self.assertEqual(first.result(timeout=5), "first")
+        self.assertEqual(batcher("third", timeout=5), "third")
+        self.assertEqual(processed, ["first", "third"])
+    
+    def test_batching_summarizer(self):
+        model = RecordingSummarizer()
+        batcher = MicroBatcher(lambda requests: [model(text, **options)[0] for text, options in requests], max_wait=0.05)
+        text = " ".join(f"Topic{i} was discussed at length today." for i in range(40))
+        
+        direct = summarize_long_text(text, RecordingSummarizer())
+        batched = summarize_long_text(text, BatchingSummarizer(model, batcher), batch_size=None)
+        self.assertEqual(batched, direct)
+
+    def test_preprocess_transcript(self):
+        text = "  Um, the pain is, uh, like  sharp .\nYou know it started likely Monday, I mean   Tuesday ?  "
+        self.assertEqual(preprocess_transcript(text), ", the pain is,, sharp. it started likely Monday, Tuesday?")
+        self.assertEqual(preprocess_transcript("well,um,yes"), "well,,yes")
+        self.assertEqual(preprocess_transcript("umm ok"), "umm ok")
+    
+    def test_transcript_lexicon(self):
+        lexicon = os.path.join(self.temp_dir, "lexicon.json")
+        with open(lexicon, "w") as f:
+            f.write('{"fillers": ["okay so", "okay", "basically"], "replacements": {"BP": "blood pressure", "pt": "patient"}}')
+        preprocessor = TranscriptPreprocessor.from_file(lexicon)
+        
+        self.assertEqual(preprocessor("Okay so the Pt says basically her bp is high okay ."),
+                         "the patient says her blood pressure is high.")
+        # Default fillers are not removed once a clinic lexicon replaces them
+        self.assertEqual(preprocess_transcript("um okay", preprocessor), "um")
+        
+        # Hundreds of entries still compile into one pattern
+        large = TranscriptPreprocessor([f"filler{i}" for i in range(500)])
+        self.assertEqual(large("filler12 chest filler499 pain filler5000"), "chest pain filler5000")
+    
+    def test_medical_terms_are_counted_and_ranked(self):
+        entities = [
+            {"text": "headache", "label": "SYMPTOM", "start": 4},
+            {"text": "Ibuprofen", "label": "MEDICATION", "start": 20},
+            {"text": "nausea", "label": "SYMPTOM", "start": 35},
+            {"text": "Nausea", "label": "SYMPTOM", "start": 60},
+            {"text": "ibuprofen", "label": "MEDICATION", "start": 80},
+            {"text": "migraines", "label": "DISEASE", "start": 90, "lemma": "migraine"},
+            {"text": "migraine", "label": "DISEASE", "start": 99},
+            {"text": "NAUSEA ", "label": "SYMPTOM", "start": 120}
+        ]
+        terms = extract_medical_terms(entities)
+        
+        self.assertEqual(terms["symptoms"], ["nausea", "headache"])
+        self.assertEqual(terms["medications"], ["Ibuprofen"])
+        self.assertEqual(terms.to_dict()["diagnoses"], [{"text": "migraines", "count": 2, "offset": 90}])
+        self.assertEqual(terms.to_dict(limit=1)["symptoms"], [{"text": "nausea", "count": 3, "offset": 35}])
+        self.assertIn("MIGRAINE", terms.categories["diagnoses"])
+        
+        summary = structure_summary("Patient has migraines.", terms)
+        self.assertIn("Symptoms:\n  - nausea (3)\n  - headache\n", summary)
+        self.assertNotIn("Measurements", summary)
+    
+    def test_medical_terms_scale_linearly(self):
+        entities = [{"text": f"term{i % 500}", "label": "SYMPTOM", "start": i} for i in range(50000)]
+        terms = extract_medical_terms(entities)
+        self.assertEqual(len(terms.categories["symptoms"]), 500)
+        self.assertEqual(terms.to_dict(limit=1)["symptoms"], [{"text": "term0", "count": 100, "offset": 0}])
+    
+    def test_nlp_profile_doc_feeds_terms_and_sentences(self):
+        import spacy
+        
+        # A saved pipeline with NER but no parser or senter
+        nlp = spacy.blank("en")
+        ruler = nlp.add_pipe("entity_ruler")
+        ruler.add_patterns([{"label": "MEDICATION", "pattern": "aspirin"}])
+        model_dir = os.path.join(self.temp_dir, "pipeline")
+        nlp.to_disk(model_dir)
+        
+        with self.assertRaises(ValueError):
+            load_nlp_pipeline(model_dir, profile="bogus")
+        
+        nlp = load_nlp_pipeline(model_dir, profile="minimal")
+        self.assertIn("sentencizer", nlp.pipe_names)
+        
+        doc = nlp("She takes aspirin daily. The cough is better. She stopped aspirin once.")
+        self.assertEqual(len(split_sentences(doc.text, doc)), 3)
+        self.assertEqual(extract_medical_terms(doc.ents)["medications"], ["aspirin"])
+
+    def test_silent_recording_skips_nlp(self):
+        # A recording with no speech transcribes to "", or to fillers only
+        stages = []
+        with mock.patch.object(summarization.model_registry, "get", side_effect=AssertionError("model used")):
+            for transcript in ["", "  ", "um, uh"]:
+                summary, terms = summarize_visit(transcript, on_stage=stages.append)
+                self.assertEqual(summary, NO_SPEECH_SUMMARY)
+                self.assertTrue(all(not ranked for ranked in terms.to_dict().values()))
+        self.assertEqual(stages, [])
+
+if __name__ == "__main__":
+    unittest.main()
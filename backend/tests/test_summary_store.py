@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from utils import summary_store as summary_store_module
+from utils.audit import AuditLog
+from utils.summary_store import SummaryStore
+
+class TestSummaryStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        self.audit_log = AuditLog(os.path.join(self.temp_dir, "audit"))
+        self.addCleanup(self.audit_log.close)
+        patcher = mock.patch.object(summary_store_module, "audit_log", self.audit_log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.root = os.path.join(self.temp_dir, "summaries")
+
+    def open_store(self, **kwargs):
+        store = SummaryStore(self.root, **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def test_summary_round_trips_encrypted(self):
+        store = self.open_store()
+        terms = {"symptoms": [{"text": "chest pain", "count": 2}]}
+        summary_id = store.put("P1", "2024-03-01", "Patient reports chest pain.", terms)
+
+        self.assertEqual(store.patient_id(summary_id), "P1")
+        self.assertIsNone(store.patient_id("missing"))
+
+        summary = store.get(summary_id, user="dr-smith")
+        self.assertEqual(summary["summary"], "Patient reports chest pain.")
+        self.assertEqual(summary["medicalTerms"], terms)
+        self.assertEqual(summary["patientId"], "P1")
+        self.assertEqual(summary["visitDate"], "2024-03-01")
+        self.assertIsNone(store.get("missing"))
+
+        # Nothing is stored in the clear
+        segments = [name for name in os.listdir(self.root) if name.endswith(".seg")]
+        for name in segments:
+            with open(os.path.join(self.root, name), "rb") as f:
+                self.assertNotIn(b"chest pain", f.read())
+
+        self.audit_log.flush()
+        entries = self.audit_log.history("P1")
+        self.assertEqual([entry["action"] for entry in entries], ["store_summary", "read_summary"])
+        # Reads are attributed to the user who asked for them
+        self.assertEqual(entries[1]["user"], "dr-smith")
+
+    def test_history_pages_by_visit_date(self):
+        store = self.open_store(segment_bytes=1024)
+        dates = ["2024-01-%02d" % day for day in (5, 1, 20, 12, 3, 28, 15)]
+        ids = {store.put("P1", date, f"Visit on {date}") for date in dates}
+        store.put("P2", "2024-01-10", "Another patient")
+
+        self.assertGreater(len([name for name in os.listdir(self.root) if name.endswith(".seg")]), 1)
+
+        seen, cursor = [], None
+        while True:
+            visits, cursor = store.history("P1", limit=3, before=cursor)
+            seen.extend(visits)
+            if cursor is None:
+                break
+
+        self.assertEqual([visit["visitDate"] for visit in seen], sorted(dates, reverse=True))
+        self.assertEqual({visit["summaryId"] for visit in seen}, ids)
+        self.assertNotIn("summary", seen[0])
+
+        visits, _ = store.history("P1", limit=1, include_summaries=True, user="dr-smith")
+        self.assertEqual(visits[0]["summary"], "Visit on 2024-01-28")
+        self.audit_log.flush()
+        self.assertEqual(self.audit_log.history("P1")[-1]["user"], "dr-smith")
+        self.assertEqual(store.count("P1"), 7)
+        self.assertEqual(store.count(), 8)
+
+    def test_store_reopens_and_appends(self):
+        store = SummaryStore(self.root)
+        first = store.put("P1", "2024-01-01", "First visit")
+        store.close()
+
+        store = self.open_store()
+        second = store.put("P1", "2024-02-01", "Second visit")
+        self.assertEqual(store.get(first)["summary"], "First visit")
+        self.assertEqual(store.get(second)["summary"], "Second visit")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+import threading
+import unittest
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import utils.transcription as transcription
+from utils.transcription import TranscriptionExecutor, QueueFullError
+
+class FakeModel:
+    def transcribe(self, audio, **options):
+        time.sleep(0.05)
+        return {"text": f"transcribed {audio}"}
+
+class CrashingModel:
+    """Kills its worker process on "crash", as the OOM killer would"""
+    
+    def transcribe(self, audio, **options):
+        if audio == "crash":
+            os._exit(1)
+        return {"text": f"transcribed {audio}"}
+
+def init_crashing_worker(model_name):
+    transcription._worker_model = CrashingModel()
+
+class CrashingTranscriptionExecutor(TranscriptionExecutor):
+    def _create_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_crashing_worker, initargs=(self.model_name,)
+        )
+
+class ThreadTranscriptionExecutor(TranscriptionExecutor):
+    # Threads share the fake model instead of loading Whisper in new processes
+    def _create_pool(self):
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+class TestTranscription(unittest.TestCase):
+    def setUp(self):
+        transcription._worker_model = FakeModel()
+        self.executor = ThreadTranscriptionExecutor(model_name="fake", workers=1, max_queue=1)
+    
+    def tearDown(self):
+        self.executor.shutdown()
+        transcription._worker_model = None
+    
+    def test_transcribe(self):
+        result = asyncio.run(self.executor.transcribe("visit.wav"))
+        self.assertEqual(result["text"], "transcribed visit.wav")
+        
+        stats = self.executor.stats()
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertGreater(stats["avg_decode_seconds"], 0)
+        self.assertGreater(stats["worker_max_rss_bytes"], 0)
+    
+    def test_warm_up(self):
+        self.assertIs(self.executor.warm_up(), self.executor)
+        
+        transcription._worker_model = None
+        with self.assertRaises(RuntimeError):
+            self.executor.warm_up()
+    
+    def test_warm_up_reaches_every_worker(self):
+        executor = ThreadTranscriptionExecutor(model_name="fake", workers=3, max_queue=1)
+        try:
+            self.assertIs(executor.warm_up(timeout=10), executor)
+        finally:
+            executor.shutdown()
+    
+    def test_concurrent_starts_create_one_pool(self):
+        created = []
+        
+        class SlowStartExecutor(ThreadTranscriptionExecutor):
+            def _create_pool(self):
+                time.sleep(0.05)
+                created.append(1)
+                return super()._create_pool()
+        
+        executor = SlowStartExecutor(model_name="fake", workers=1, max_queue=1)
+        threads = [threading.Thread(target=executor.start) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        executor.shutdown()
+        self.assertEqual(len(created), 1)
+    
+    def test_pool_is_replaced_after_a_worker_dies(self):
+        executor = CrashingTranscriptionExecutor(model_name="fake", workers=1, max_queue=1)
+        try:
+            with self.assertRaises(BrokenProcessPool):
+                asyncio.run(executor.transcribe("crash"))
+            
+            result = asyncio.run(executor.transcribe("visit.wav"))
+            self.assertEqual(result["text"], "transcribed visit.wav")
+            self.assertEqual(executor.stats()["failed"], 1)
+        finally:
+            executor.shutdown()
+    
+    def test_queue_full(self):
+        async def submit_many():
+            jobs = [self.executor.transcribe(f"visit_{i}.wav") for i in range(3)]
+            return await asyncio.gather(*jobs, return_exceptions=True)
+        
+        results = asyncio.run(submit_many())
+        
+        # One job runs, one waits in the queue and the third is rejected
+        self.assertEqual(sum(isinstance(r, QueueFullError) for r in results), 1)
+        self.assertEqual(self.executor.stats()["rejected"], 1)
+        self.assertEqual(self.executor.stats()["completed"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
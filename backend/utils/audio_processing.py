@@ -1,59 +1,359 @@
 #!/usr/bin/env python3
+import os
 import numpy as np
-import librosa
 import noisereduce as nr
 import torch
+from math import gcd
 from scipy import signal
+from utils.metrics import timed
 
-def noise_reduction(audio_data, sample_rate=44100):
+WHISPER_SAMPLE_RATE = 16000  # Whisper expects 16 kHz mono float32
+PROCESSING_SAMPLE_RATE = int(os.environ.get("PROCESSING_SAMPLE_RATE", WHISPER_SAMPLE_RATE))  # Rate the DSP stages run at
+RESAMPLE_WINDOW = ('kaiser', 8.0)  # Anti-aliasing window, sharper than scipy's default kaiser 5.0
+
+NOISE_PROP_DECREASE = 0.75  # Fraction of the estimated noise removed
+NOISE_STATIONARY = False  # Gate recordings against a time-smoothed noise estimate rather than a fixed profile
+NOISE_BLOCK_SECONDS = float(os.environ.get("NOISE_BLOCK_SECONDS", 30))  # Longer recordings are denoised block by block
+# Overlap crossfaded between neighbouring blocks, twice the time constant of the non-stationary
+# noise estimate so neither block is used near its own edge
+NOISE_BLOCK_OVERLAP_SECONDS = 4.0
+NOISE_PROFILE_SECONDS = 2.0  # Quietest audio kept from each block as its noise estimate
+NOISE_PROFILE_BLOCKS = 3  # Number of recent blocks the rolling noise profile is built from
+NOISE_PROFILE_FRAME_SECONDS = 0.1  # Frame length used to find the quietest audio
+
+def noise_reduction(audio_data, sample_rate=44100, block_seconds=NOISE_BLOCK_SECONDS):
     """
     Apply noise reduction to audio data
     
+    Recordings longer than block_seconds are processed by BlockNoiseReducer
+    so peak memory does not grow with the length of the visit. The blocks use
+    the same non-stationary gating, so the result stays close to denoising
+    the whole recording at once.
+    
     Args:
         audio_data: numpy array of audio data
         sample_rate: sampling rate of audio data
+        block_seconds: length of the blocks long recordings are split into (None to never split)
         
     Returns:
         Processed audio data with reduced noise
     """
+    audio_flat = audio_data.reshape(-1)
+    if block_seconds is not None and len(audio_flat) > block_seconds * sample_rate:
+        reducer = BlockNoiseReducer(sample_rate, block_seconds=block_seconds, stationary=NOISE_STATIONARY)
+        return reducer.reduce(audio_flat).reshape(-1, 1)
+    
     # Convert to float32 if not already
-    if audio_data.dtype != np.float32:
-        audio_data = audio_data.astype(np.float32)
+    if audio_flat.dtype != np.float32:
+        audio_flat = audio_flat.astype(np.float32)
     
     # Apply noise reduction
     reduced_noise = nr.reduce_noise(
-        y=audio_data.flatten(), 
+        y=audio_flat, 
         sr=sample_rate,
-        stationary=False,
-        prop_decrease=0.75
+        stationary=NOISE_STATIONARY,
+        prop_decrease=NOISE_PROP_DECREASE
     )
     
     return reduced_noise.reshape(-1, 1)
 
-def voice_isolation(audio_data, sample_rate=44100):
+class BlockNoiseReducer:
+    """
+    Block-wise noise reduction with bounded memory
+    
+    Audio is denoised in overlapping blocks that are crossfaded at the seams,
+    so only one block's STFT buffers exist at a time. By default each block
+    gets the non-stationary gating noise_reduction() applies to a short
+    recording, whose noise estimate is smoothed over a few seconds and so
+    barely depends on where the blocks start. With stationary set, each block
+    is instead gated against a rolling noise profile made of the quietest
+    audio from the last few blocks, which carries across pieces too short to
+    estimate their own noise, such as live streaming windows.
+    
+    Feed audio with process() as it arrives and call flush() at the end, or
+    denoise a whole recording with reduce().
+    """
+    
+    def __init__(self, sample_rate, block_seconds=NOISE_BLOCK_SECONDS, overlap_seconds=NOISE_BLOCK_OVERLAP_SECONDS,
+                 profile_seconds=NOISE_PROFILE_SECONDS, profile_blocks=NOISE_PROFILE_BLOCKS,
+                 prop_decrease=NOISE_PROP_DECREASE, stationary=NOISE_STATIONARY):
+        """
+        Args:
+            sample_rate: sampling rate of audio data
+            block_seconds: length of each denoised block
+            overlap_seconds: overlap between neighbouring blocks
+            profile_seconds: quietest audio kept from each block for the noise profile
+            profile_blocks: number of recent blocks the noise profile is built from
+            prop_decrease: fraction of the estimated noise removed
+            stationary: gate against the rolling noise profile instead of each block's own noise estimate
+        """
+        self.sample_rate = sample_rate
+        self.block_samples = int(block_seconds * sample_rate)
+        self.overlap_samples = min(int(overlap_seconds * sample_rate), self.block_samples // 2)
+        self.profile_samples = int(profile_seconds * sample_rate)
+        self.frame_samples = max(1, int(NOISE_PROFILE_FRAME_SECONDS * sample_rate))
+        self.profile_blocks = profile_blocks
+        self.prop_decrease = prop_decrease
+        self.stationary = stationary
+        self._profiles = []
+        self._pending = np.empty(0, dtype=np.float32)
+        self._tail = None  # Denoised overlap of the last block, not yet emitted
+        
+        # Complementary raised-cosine fades sum to one across the overlap
+        fade = np.sin(0.5 * np.pi * (np.arange(self.overlap_samples) + 0.5) / max(1, self.overlap_samples)) ** 2
+        self._fade_in = fade.astype(np.float32)
+        self._fade_out = (1 - fade).astype(np.float32)
+    
+    @property
+    def noise_profile(self):
+        """Audio the next block's noise is estimated from (None before the first block or without stationary)"""
+        return np.concatenate(self._profiles) if self._profiles else None
+    
+    def _update_profile(self, block):
+        frames = len(block) // self.frame_samples
+        if frames == 0:
+            return
+        
+        energy = np.square(block[:frames * self.frame_samples].reshape(frames, -1)).mean(axis=1)
+        keep = max(1, self.profile_samples // self.frame_samples)
+        quietest = np.sort(np.argsort(energy)[:keep])
+        
+        self._profiles.append(block[:frames * self.frame_samples].reshape(frames, -1)[quietest].reshape(-1))
+        del self._profiles[:-self.profile_blocks]
+    
+    def reduce_block(self, block):
+        """
+        Denoise one block, updating the rolling noise profile if it is used
+        
+        Args:
+            block: 1D numpy array of audio data
+            
+        Returns:
+            1D float32 numpy array of denoised audio
+        """
+        block = np.asarray(block, dtype=np.float32).reshape(-1)
+        if self.stationary:
+            self._update_profile(block)
+        
+        # Too short for an STFT frame, nothing to denoise
+        if len(block) < self.frame_samples:
+            return block.copy()
+        
+        return nr.reduce_noise(
+            y=block,
+            sr=self.sample_rate,
+            y_noise=self.noise_profile,
+            stationary=self.stationary,
+            prop_decrease=self.prop_decrease
+        ).astype(np.float32, copy=False)
+    
+    def _crossfade(self, denoised):
+        if self._tail is not None:
+            overlap = len(self._tail)
+            denoised[:overlap] = self._tail * self._fade_out[:overlap] + denoised[:overlap] * self._fade_in[:overlap]
+        return denoised
+    
+    def process(self, audio_data):
+        """
+        Add audio and denoise every complete block
+        
+        Output lags the input by up to one block.
+        
+        Args:
+            audio_data: 1D numpy array of audio data
+            
+        Returns:
+            1D float32 numpy array of denoised audio that is final
+        """
+        self._pending = np.concatenate([self._pending, np.asarray(audio_data, dtype=np.float32).reshape(-1)])
+        
+        output = []
+        step = self.block_samples - self.overlap_samples
+        while len(self._pending) >= self.block_samples:
+            denoised = self._crossfade(self.reduce_block(self._pending[:self.block_samples]))
+            output.append(denoised[:step])
+            self._tail = denoised[step:]
+            # The overlap is denoised again as the start of the next block
+            self._pending = self._pending[step:]
+        
+        return np.concatenate(output) if output else np.empty(0, dtype=np.float32)
+    
+    def flush(self):
+        """
+        Denoise whatever audio is left and reset the block state
+        
+        Returns:
+            1D float32 numpy array of the remaining denoised audio
+        """
+        if self._tail is not None and len(self._pending) <= len(self._tail):
+            output = self._tail[:len(self._pending)]
+        elif len(self._pending):
+            output = self._crossfade(self.reduce_block(self._pending))
+        else:
+            output = np.empty(0, dtype=np.float32)
+        
+        self._pending = np.empty(0, dtype=np.float32)
+        self._tail = None
+        return output
+    
+    def reduce(self, audio_data):
+        """
+        Denoise a whole recording block by block
+        
+        Args:
+            audio_data: 1D numpy array (or memory map) of audio data
+            
+        Returns:
+            1D float32 numpy array of denoised audio, same length as the input
+        """
+        output = np.empty(len(audio_data), dtype=np.float32)
+        written = 0
+        for start in range(0, len(audio_data), self.block_samples):
+            denoised = self.process(audio_data[start:start + self.block_samples])
+            output[written:written + len(denoised)] = denoised
+            written += len(denoised)
+        
+        denoised = self.flush()
+        output[written:written + len(denoised)] = denoised
+        return output
+
+SPEECH_BAND = (80, 3000)  # Hz passed by voice_isolation
+BANDPASS_ORDER = 4
+FILTER_BLOCK_SAMPLES = 65536  # Scratch buffer size when filtering in place
+
+class BandpassFilterStream:
+    """
+    Block-wise bandpass filter that carries its state between blocks
+    
+    Filtering a signal in consecutive blocks gives the same output as
+    filtering it in one go, so streaming input can be filtered as it arrives.
+    """
+    
+    def __init__(self, sos):
+        """
+        Args:
+            sos: float32 second-order sections from BandpassFilterBank.design()
+        """
+        self.sos = sos
+        self._zi = np.zeros((sos.shape[0], 2), dtype=np.float32)
+    
+    def process(self, block, out=None):
+        """
+        Filter the next block of audio
+        
+        Args:
+            block: 1D float32 numpy array of audio data
+            out: optional array to write the result to (may be block itself)
+            
+        Returns:
+            1D float32 numpy array of filtered audio
+        """
+        filtered, self._zi = signal.sosfilt(self.sos, block, zi=self._zi)
+        if out is None:
+            return filtered.astype(np.float32, copy=False)
+        out[:] = filtered
+        return out
+    
+    def reset(self):
+        self._zi[:] = 0
+
+class BandpassFilterBank:
+    """
+    Butterworth bandpass designs cached per (sample rate, band)
+    
+    Filters run as second-order sections in float32, which stays stable at
+    high sample rates where the (b, a) form loses precision and avoids a
+    float64 copy of the signal.
+    """
+    
+    def __init__(self, order=BANDPASS_ORDER):
+        """
+        Args:
+            order: Butterworth filter order
+        """
+        self.order = order
+        self._designs = {}
+    
+    def design(self, sample_rate, band=SPEECH_BAND):
+        """
+        Get the second-order sections for a band, designing them on first use
+        
+        Args:
+            sample_rate: sampling rate of audio data
+            band: (low, high) cutoff frequencies in Hz
+            
+        Returns:
+            float32 numpy array of second-order sections
+        """
+        key = (sample_rate, tuple(band))
+        sos = self._designs.get(key)
+        if sos is None:
+            sos = signal.butter(self.order, band, btype='band', fs=sample_rate, output='sos').astype(np.float32)
+            self._designs[key] = sos
+        return sos
+    
+    def stream(self, sample_rate, band=SPEECH_BAND):
+        """
+        Create a stateful filter for block-wise input
+        
+        Args:
+            sample_rate: sampling rate of audio data
+            band: (low, high) cutoff frequencies in Hz
+            
+        Returns:
+            BandpassFilterStream
+        """
+        return BandpassFilterStream(self.design(sample_rate, band))
+    
+    def filter(self, audio_data, sample_rate, band=SPEECH_BAND, zero_phase=False, inplace=False):
+        """
+        Bandpass a whole signal
+        
+        Args:
+            audio_data: 1D numpy array of audio data
+            sample_rate: sampling rate of audio data
+            band: (low, high) cutoff frequencies in Hz
+            zero_phase: filter forwards and backwards so the output has no phase delay
+            inplace: overwrite audio_data if it is a writeable float32 array
+            
+        Returns:
+            1D float32 numpy array of filtered audio
+        """
+        sos = self.design(sample_rate, band)
+        if zero_phase:
+            return signal.sosfiltfilt(sos, audio_data).astype(np.float32, copy=False)
+        
+        if not (inplace and audio_data.dtype == np.float32 and audio_data.flags.writeable):
+            audio_data = np.array(audio_data, dtype=np.float32)
+        
+        # Filtering in blocks keeps the scratch memory to one block
+        stream = BandpassFilterStream(sos)
+        for start in range(0, len(audio_data), FILTER_BLOCK_SAMPLES):
+            block = audio_data[start:start + FILTER_BLOCK_SAMPLES]
+            stream.process(block, out=block)
+        return audio_data
+
+# Shared filter designs for the process
+speech_filter_bank = BandpassFilterBank()
+
+def voice_isolation(audio_data, sample_rate=44100, zero_phase=False, inplace=False):
     """
     Isolate human voice from background sounds
     
     Args:
         audio_data: numpy array of audio data
         sample_rate: sampling rate of audio data
+        zero_phase: filter without phase delay (not possible for streaming input)
+        inplace: overwrite audio_data instead of allocating a new array
         
     Returns:
         Processed audio data with isolated voice
     """
-    # Convert to float32 if not already
-    if audio_data.dtype != np.float32:
-        audio_data = audio_data.astype(np.float32)
-    
-    # Flatten if 2D
-    audio_flat = audio_data.flatten()
+    # Flatten if 2D (a view, so memory-mapped input is not copied)
+    audio_flat = audio_data.reshape(-1)
     
-    # Apply bandpass filter to focus on speech frequencies (typically 85-255 Hz)
-    nyquist = 0.5 * sample_rate
-    low = 80 / nyquist
-    high = 3000 / nyquist
-    b, a = signal.butter(4, [low, high], btype='band')
-    filtered_audio = signal.lfilter(b, a, audio_flat)
+    # Apply bandpass filter to focus on speech frequencies
+    filtered_audio = speech_filter_bank.filter(audio_flat, sample_rate, zero_phase=zero_phase, inplace=inplace)
     
     # Apply spectral gating
     # In a real implementation, would use a more sophisticated voice isolation model
@@ -61,6 +361,369 @@ def voice_isolation(audio_data, sample_rate=44100):
     
     return filtered_audio.reshape(-1, 1)
 
+def resample_audio(audio_data, orig_sr, target_sr=WHISPER_SAMPLE_RATE):
+    """
+    Resample audio with a polyphase filter
+    
+    Args:
+        audio_data: numpy array of audio data
+        orig_sr: sampling rate of audio data
+        target_sr: desired sampling rate
+        
+    Returns:
+        1D float32 numpy array at target_sr
+    """
+    audio_flat = audio_data.reshape(-1)
+    if orig_sr == target_sr:
+        return audio_flat.astype(np.float32, copy=False)
+    
+    factor = gcd(int(orig_sr), int(target_sr))
+    resampled = signal.resample_poly(audio_flat, int(target_sr) // factor, int(orig_sr) // factor, window=RESAMPLE_WINDOW)
+    return resampled.astype(np.float32, copy=False)
+
+def prepare_for_whisper(audio_data, sample_rate, processing_rate=PROCESSING_SAMPLE_RATE, noise_reducer=None,
+                        band_filter=None):
+    """
+    Denoise, bandpass and resample audio so it can be passed to Whisper as an array
+    
+    The audio is resampled to processing_rate first, so noise reduction and
+    the bandpass never run on samples above the speech band that Whisper
+    would discard anyway.
+    
+    Args:
+        audio_data: numpy array of audio data (multichannel audio is downmixed)
+        sample_rate: sampling rate of audio data
+        processing_rate: rate the DSP stages run at (None to use sample_rate)
+        noise_reducer: optional BlockNoiseReducer at the processing rate whose
+            rolling noise profile carries over between calls
+        band_filter: optional BandpassFilterStream at the processing rate, for
+            consecutive pieces of one recording
+        
+    Returns:
+        1D float32 numpy array at 16 kHz
+    """
+    if audio_data.ndim > 1 and audio_data.shape[1] > 1:
+        audio_data = audio_data.mean(axis=1)
+    
+    if processing_rate is not None:
+        with timed("resample"):
+            audio_data = resample_audio(audio_data, sample_rate, processing_rate)
+        sample_rate = processing_rate
+    
+    audio_data = denoise_and_bandpass(audio_data, sample_rate, noise_reducer, band_filter)
+    with timed("resample"):
+        return resample_audio(audio_data, sample_rate)
+
+def denoise_and_bandpass(audio_data, sample_rate, noise_reducer=None, band_filter=None):
+    """
+    Denoise audio and keep the speech band, at the audio's own rate
+    
+    Args:
+        audio_data: 1D numpy array of mono audio data
+        sample_rate: sampling rate of audio data
+        noise_reducer: optional BlockNoiseReducer at sample_rate whose
+            rolling noise profile carries over between calls
+        band_filter: optional BandpassFilterStream at sample_rate, for
+            consecutive pieces of one recording
+        
+    Returns:
+        1D numpy array of processed audio (clips under half a second are returned unprocessed)
+    """
+    # Very short clips are passed through unprocessed
+    if len(audio_data) > sample_rate * 0.5:
+        with timed("noise_reduction"):
+            if noise_reducer is not None:
+                if noise_reducer.sample_rate != sample_rate:
+                    raise ValueError(f"Noise reducer runs at {noise_reducer.sample_rate} Hz, audio is {sample_rate} Hz")
+                audio_data = noise_reducer.reduce_block(audio_data)
+            else:
+                audio_data = noise_reduction(audio_data.reshape(-1, 1), sample_rate)
+        # The denoised array is ours, so it can be filtered in place
+        with timed("voice_isolation"):
+            if band_filter is not None:
+                audio_data = audio_data.reshape(-1).astype(np.float32, copy=False)
+                audio_data = band_filter.process(audio_data, out=audio_data)
+            else:
+                audio_data = voice_isolation(audio_data, sample_rate, inplace=True)
+    return audio_data.reshape(-1)
+
+VAD_FRAME_SECONDS = 0.03  # Analysis frame length for voice activity detection
+VAD_THRESHOLD_DB = 10.0  # Frames this far above the noise floor may be speech
+VAD_ABSOLUTE_FLOOR_DB = -60.0  # Frames quieter than this are never speech
+VAD_VOICE_BAND = (300, 3000)  # Hz where most speech energy lies
+VAD_MIN_VOICE_RATIO = 0.5  # Share of a frame's energy that must fall in the voice band
+VAD_MIN_SPEECH_SECONDS = 0.25  # Shorter bursts (clicks, knocks) are dropped
+VAD_MIN_SILENCE_SECONDS = 0.5  # Shorter pauses are kept as part of the speech
+VAD_PAD_SECONDS = 0.3  # Audio kept either side of each speech region
+VAD_FADE_SECONDS = 0.01  # Fade at each cut where speech regions are joined, so the seams don't click
+VAD_BATCH_FRAMES = 4096  # Frames analysed per FFT batch, bounds scratch memory
+VAD_ENABLED = os.environ.get("VAD_ENABLED", "true").lower() in ("1", "true", "yes")
+
+def _runs(mask):
+    """Start and end indices of each run of True values"""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def detect_speech(audio_data, sample_rate, frame_seconds=VAD_FRAME_SECONDS, threshold_db=VAD_THRESHOLD_DB,
+                  min_speech_seconds=VAD_MIN_SPEECH_SECONDS, min_silence_seconds=VAD_MIN_SILENCE_SECONDS,
+                  pad_seconds=VAD_PAD_SECONDS):
+    """
+    Find speech regions with an energy and spectral voice activity detector
+    
+    A frame counts as speech when it is threshold_db above the recording's
+    noise floor and most of its energy falls in the voice band. Short pauses
+    are bridged, short bursts dropped and each region padded.
+    
+    Args:
+        audio_data: numpy array of audio data
+        sample_rate: sampling rate of audio data
+        frame_seconds: analysis frame length
+        threshold_db: level above the noise floor a speech frame must reach
+        min_speech_seconds: shortest region kept
+        min_silence_seconds: shortest pause that splits two regions
+        pad_seconds: audio kept either side of each region
+        
+    Returns:
+        List of (start, end) sample indices of speech regions
+    """
+    audio_flat = audio_data.reshape(-1)
+    frame = max(1, int(frame_seconds * sample_rate))
+    frames = len(audio_flat) // frame
+    if frames == 0:
+        return []
+    
+    window = np.hanning(frame).astype(np.float32)
+    frequencies = np.fft.rfftfreq(frame, 1 / sample_rate)
+    voice_bins = (frequencies >= VAD_VOICE_BAND[0]) & (frequencies <= VAD_VOICE_BAND[1])
+    
+    energy_db = np.empty(frames, dtype=np.float32)
+    voice_ratio = np.empty(frames, dtype=np.float32)
+    for start in range(0, frames, VAD_BATCH_FRAMES):
+        stop = min(frames, start + VAD_BATCH_FRAMES)
+        batch = audio_flat[start * frame:stop * frame].reshape(-1, frame).astype(np.float32)
+        power = np.square(np.abs(np.fft.rfft(batch * window, axis=1)))
+        total = power.sum(axis=1) + 1e-12
+        energy_db[start:stop] = 10 * np.log10(np.square(batch).mean(axis=1) + 1e-12)
+        voice_ratio[start:stop] = power[:, voice_bins].sum(axis=1) / total
+    
+    noise_floor = np.percentile(energy_db, 10)
+    speech = (
+        (energy_db > noise_floor + threshold_db)
+        & (energy_db > VAD_ABSOLUTE_FLOOR_DB)
+        & (voice_ratio > VAD_MIN_VOICE_RATIO)
+    )
+    
+    # Bridge short pauses, then drop short bursts
+    starts, ends = _runs(~speech)
+    for start, end in zip(starts, ends):
+        if start > 0 and end < frames and (end - start) * frame_seconds < min_silence_seconds:
+            speech[start:end] = True
+    
+    pad = int(pad_seconds * sample_rate)
+    regions = []
+    for start, end in zip(*_runs(speech)):
+        if (end - start) * frame_seconds < min_speech_seconds:
+            continue
+        region_start = max(0, start * frame - pad)
+        region_end = min(len(audio_flat), end * frame + pad)
+        if regions and region_start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], int(region_end))
+        else:
+            regions.append((int(region_start), int(region_end)))
+    return regions
+
+def speech_regions(audio_data, sample_rate):
+    """
+    Speech regions to keep from a recording, never dropping audible audio wholesale
+    
+    detect_speech() compares frames to the recording's own noise floor, so
+    audio at a steady level (e.g. one continuous voice close to the
+    microphone) can yield no regions at all. In that case the whole
+    recording is kept, unless every frame is below the absolute floor.
+    
+    Args:
+        audio_data: numpy array of audio data
+        sample_rate: sampling rate of audio data
+        
+    Returns:
+        List of (start, end) sample indices of speech regions
+    """
+    regions = detect_speech(audio_data, sample_rate)
+    if regions or not len(audio_data):
+        return regions
+    
+    # Loudest frame, batched like detect_speech so long recordings need no full-size scratch copy
+    audio_flat = audio_data.reshape(-1)
+    frame = min(max(1, int(VAD_FRAME_SECONDS * sample_rate)), len(audio_flat))
+    usable = len(audio_flat) // frame * frame
+    loudest = 0.0
+    for start in range(0, usable, frame * VAD_BATCH_FRAMES):
+        batch = audio_flat[start:min(usable, start + frame * VAD_BATCH_FRAMES)].astype(np.float32)
+        loudest = max(loudest, float(np.square(batch).reshape(-1, frame).mean(axis=1).max()))
+    if 10 * np.log10(loudest + 1e-12) <= VAD_ABSOLUTE_FLOOR_DB:
+        return []
+    return [(0, len(audio_flat))]
+
+class SpeechMap:
+    """
+    Speech regions kept from a recording and their place in the original
+    
+    Times in the compacted speech-only audio (such as Whisper segment
+    timestamps) can be mapped back to the original recording.
+    """
+    
+    def __init__(self, regions, sample_rate, total_samples):
+        """
+        Args:
+            regions: List of (start, end) sample indices from detect_speech()
+            sample_rate: sampling rate the indices refer to
+            total_samples: length of the original recording
+        """
+        self.regions = regions
+        self.sample_rate = sample_rate
+        self.total_samples = total_samples
+        lengths = [end - start for start, end in regions]
+        self._compact_starts = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    
+    @property
+    def speech_samples(self):
+        return int(self._compact_starts[-1])
+    
+    @property
+    def speech_ratio(self):
+        return self.speech_samples / self.total_samples if self.total_samples else 0.0
+    
+    def extract(self, audio_data, fade_seconds=VAD_FADE_SECONDS):
+        """
+        Concatenate the speech regions of a recording
+        
+        Each region is faded in and out where it was cut from the recording,
+        so the joins don't click. Fades keep the length, so timestamps still
+        map back exactly.
+        
+        Args:
+            audio_data: numpy array of the original audio data
+            fade_seconds: length of the fade at each cut
+            
+        Returns:
+            1D numpy array of speech-only audio
+        """
+        audio_flat = audio_data.reshape(-1)
+        if not self.regions:
+            return audio_flat[:0]
+        speech = np.concatenate([audio_flat[start:end] for start, end in self.regions])
+        
+        fade = int(fade_seconds * self.sample_rate)
+        for index, (start, end) in enumerate(self.regions):
+            region = speech[self._compact_starts[index]:self._compact_starts[index + 1]]
+            length = min(fade, len(region) // 2)
+            if length == 0:
+                continue
+            ramp = (np.sin(0.5 * np.pi * (np.arange(length) + 0.5) / length) ** 2).astype(speech.dtype)
+            if start > 0:
+                region[:length] *= ramp
+            if end < self.total_samples:
+                region[-length:] *= ramp[::-1]
+        return speech
+    
+    def to_original(self, seconds):
+        """
+        Map a time in the speech-only audio to the original recording
+        
+        Args:
+            seconds: time in the speech-only audio
+            
+        Returns:
+            Time in seconds in the original recording
+        """
+        if not self.regions:
+            return seconds
+        sample = int(round(seconds * self.sample_rate))
+        index = min(int(np.searchsorted(self._compact_starts, sample, side='right')) - 1, len(self.regions) - 1)
+        index = max(index, 0)
+        return float(self.regions[index][0] + sample - self._compact_starts[index]) / self.sample_rate
+    
+    def map_segments(self, segments):
+        """
+        Rewrite Whisper segment timestamps to original recording times
+        
+        Args:
+            segments: List of segment dictionaries with 'start' and 'end'
+            
+        Returns:
+            New list of segment dictionaries
+        """
+        return [
+            {**segment, "start": self.to_original(segment["start"]), "end": self.to_original(segment["end"])}
+            for segment in segments
+        ]
+    
+    def stats(self):
+        """
+        Summarize how much of the recording is speech
+
+        Returns:
+            Dictionary of speech statistics
+        """
+        return {
+            "speechSeconds": self.speech_samples / self.sample_rate,
+            "totalSeconds": self.total_samples / self.sample_rate,
+            "speechRatio": self.speech_ratio,
+            "regions": len(self.regions)
+        }
+
+def prepare_speech_for_whisper(audio_data, sample_rate, processing_rate=PROCESSING_SAMPLE_RATE, vad=VAD_ENABLED):
+    """
+    Denoise and bandpass a recording, then keep its speech for Whisper
+    
+    The whole recording is denoised before the silence is dropped, so the
+    noise profile is estimated from the pauses rather than from speech.
+    
+    Args:
+        audio_data: numpy array of audio data (multichannel audio is downmixed)
+        sample_rate: sampling rate of audio data
+        processing_rate: rate the DSP stages run at
+        vad: detect speech and drop the silence (False keeps the whole recording)
+        
+    Returns:
+        Tuple of (1D float32 numpy array at 16 kHz, SpeechMap)
+    """
+    if audio_data.ndim > 1 and audio_data.shape[1] > 1:
+        audio_data = audio_data.mean(axis=1)
+    with timed("resample"):
+        audio_data = resample_audio(audio_data, sample_rate, processing_rate)
+    
+    audio_data = audio_data.reshape(-1)
+    with timed("vad"):
+        regions = speech_regions(audio_data, processing_rate) if vad else [(0, len(audio_data))]
+    speech_map = SpeechMap(regions, processing_rate, len(audio_data))
+    if not regions:
+        return np.empty(0, dtype=np.float32), speech_map
+    
+    audio_data = denoise_and_bandpass(audio_data, processing_rate)
+    speech = speech_map.extract(audio_data)
+    with timed("resample"):
+        return resample_audio(speech, processing_rate), speech_map
+
+def dsp_config():
+    """
+    Settings that determine the output of prepare_speech_for_whisper
+
+    Returns:
+        Dictionary of DSP and voice activity detection parameters
+    """
+    return {
+        "whisperRate": WHISPER_SAMPLE_RATE,
+        "processingRate": PROCESSING_SAMPLE_RATE,
+        "resampleWindow": RESAMPLE_WINDOW,
+        "noise": [NOISE_PROP_DECREASE, NOISE_STATIONARY, NOISE_BLOCK_SECONDS, NOISE_BLOCK_OVERLAP_SECONDS, NOISE_PROFILE_SECONDS,
+                  NOISE_PROFILE_BLOCKS, NOISE_PROFILE_FRAME_SECONDS],
+        "band": [SPEECH_BAND, BANDPASS_ORDER],
+        "vad": VAD_ENABLED and [VAD_FRAME_SECONDS, VAD_THRESHOLD_DB, VAD_ABSOLUTE_FLOOR_DB, VAD_VOICE_BAND,
+                                VAD_MIN_VOICE_RATIO, VAD_MIN_SPEECH_SECONDS, VAD_MIN_SILENCE_SECONDS, VAD_PAD_SECONDS,
+                                VAD_FADE_SECONDS]
+    }
+
 def preprocess_audio_for_transcription(file_path):
     """
     Load audio file and preprocess it for transcription
@@ -71,6 +734,8 @@ def preprocess_audio_for_transcription(file_path):
     Returns:
         Processed audio data ready for transcription
     """
+    import librosa
+    
     # Load audio file
     audio_data, sample_rate = librosa.load(file_path, sr=None)
     
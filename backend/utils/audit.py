@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import queue
+import sqlite3
+import datetime
+import atexit
+import threading
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+logger = logging.getLogger(__name__)
+
+AUDIT_DIR = os.environ.get(
+    "AUDIT_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "audit")
+)
+AUDIT_SEGMENT_BYTES = int(os.environ.get("AUDIT_SEGMENT_BYTES", 16 * 1024 * 1024))  # Size a segment is closed at
+AUDIT_FSYNC = os.environ.get("AUDIT_FSYNC", "commit")  # One of FSYNC_POLICIES
+AUDIT_FSYNC_INTERVAL = float(os.environ.get("AUDIT_FSYNC_INTERVAL", 1.0))  # Seconds between fsyncs for "interval"
+AUDIT_MAX_BATCH = 512  # Most entries written in one group commit
+
+LOG_FILE = os.environ.get("LOG_FILE", "hipaa_compliance.log")
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# "commit" syncs every group commit, "interval" at most every AUDIT_FSYNC_INTERVAL
+# seconds, "none" leaves it to the operating system
+FSYNC_POLICIES = ("commit", "interval", "none")
+
+_STOP = object()
+_log_listener = None
+
+def configure_logging(level=logging.INFO, log_file=LOG_FILE):
+    """
+    Route logging through a queue so callers never wait on the log file
+
+    Records are put on a queue by the root logger's handler and written to
+    the log file and stderr by a listener thread. Safe to call more than once.
+
+    Args:
+        level: Root logger level
+        log_file: Path of the application log
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(log_file), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(records))
+    root.setLevel(level)
+    _log_listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+class AuditLog:
+    """
+    Append-only audit trail written by a background thread
+
+    record() only puts the entry on a queue. The writer takes everything
+    queued, appends it to the current segment file in one write, syncs it
+    according to the fsync policy and indexes the entries by patient in
+    SQLite in one transaction, so a burst of requests costs one commit.
+    Segments are never modified; a new one is started once the current one
+    reaches segment_bytes. Entries written before a crash but not yet
+    indexed are indexed again on startup. With the "interval" policy, the
+    writer syncs a group left unsynced once the interval has passed, even
+    if nothing else is recorded.
+    """
+
+    def __init__(self, directory=AUDIT_DIR, segment_bytes=AUDIT_SEGMENT_BYTES, fsync=AUDIT_FSYNC,
+                 fsync_interval=AUDIT_FSYNC_INTERVAL, max_batch=AUDIT_MAX_BATCH):
+        """
+        Args:
+            directory: Directory holding the segments and the index
+            segment_bytes: Size at which a new segment is started
+            fsync: One of FSYNC_POLICIES
+            fsync_interval: Seconds between fsyncs for the "interval" policy
+            max_batch: Most entries written in one group commit
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_batch = max_batch
+        self.commits = 0
+        self.entries = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._segment = None
+        self._file = None
+        self._last_fsync = time.monotonic()
+        self._unsynced = False  # Written since the last fsync, for the "interval" policy
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.directory, "index.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                seq INTEGER PRIMARY KEY,
+                patient_id TEXT,
+                action TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_patient ON entries (patient_id, seq)")
+        self._conn.commit()
+        self._recover()
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"audit-{segment:06d}.log")
+
+    def _segments(self):
+        return sorted(
+            int(name[6:12]) for name in os.listdir(self.directory)
+            if name.startswith("audit-") and name.endswith(".log")
+        )
+
+    def _recover(self):
+        """Index entries that reached a segment but not the index, then pick the segment to append to"""
+        row = self._conn.execute("SELECT segment, offset + length, seq FROM entries ORDER BY seq DESC LIMIT 1").fetchone()
+        segment, offset, self._seq = row if row is not None else (0, 0, 0)
+
+        segments = self._segments()
+        recovered = []
+        for number in (n for n in segments if n >= segment):
+            with open(self._segment_path(number), "rb") as f:
+                f.seek(offset if number == segment else 0)
+                position = f.tell()
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    entry = json.loads(line)
+                    recovered.append((entry, number, position, len(line)))
+                    position += len(line)
+        if recovered:
+            self._index(recovered)
+            self._conn.commit()
+            self._seq = max(self._seq, recovered[-1][0]["seq"])
+            logger.info(f"Indexed {len(recovered)} audit entries found after the last commit")
+
+        self._segment = segments[-1] if segments else 1
+        path = self._segment_path(self._segment)
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            with open(path, "rb") as f:
+                f.seek(max(0, size - 1))
+                torn = size > 0 and f.read(1) != b"\n"
+            # Never append after a partly written line
+            if torn or size >= self.segment_bytes:
+                self._segment += 1
+        self._file = open(self._segment_path(self._segment), "ab")
+
+    def _index(self, rows):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO entries (seq, patient_id, action, timestamp, segment, offset, length) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (entry["seq"], entry.get("patient_id"), entry["action"], entry["timestamp"], segment, offset, length)
+                for entry, segment, offset, length in rows
+            ]
+        )
+
+    def start(self):
+        """Open the log and start the writer thread"""
+        with self._start_lock:
+            if self._thread is None:
+                with self._lock:
+                    self._open()
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def record(self, action, patient_id=None, **details):
+        """
+        Queue an audit entry without waiting for it to be written
+
+        Args:
+            action: What happened, e.g. "secure_storage"
+            patient_id: Optional ID of the patient concerned
+            **details: Further JSON-serializable fields
+        """
+        if self._thread is None:
+            self.start()
+        entry = {"timestamp": datetime.datetime.now().isoformat(), "action": action, "patient_id": patient_id}
+        entry.update(details)
+        self._queue.put(entry)
+
+    def _collect(self):
+        # Wakes up when an unsynced write is due to be synced
+        timeout = None
+        if self._unsynced:
+            timeout = max(0, self._last_fsync + self.fsync_interval - time.monotonic())
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                self._sync()
+                continue
+            entries = [entry for entry in batch if entry is not _STOP]
+            try:
+                if entries:
+                    self._commit(entries)
+            except Exception as e:
+                logger.error(f"Audit write failed, {len(entries)} entries lost: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if len(entries) < len(batch):
+                return
+
+    def _commit(self, entries):
+        with self._lock:
+            if self._file.tell() >= self.segment_bytes:
+                self._file.close()
+                self._segment += 1
+                self._file = open(self._segment_path(self._segment), "ab")
+
+            rows, lines = [], []
+            offset = self._file.tell()
+            for entry in entries:
+                self._seq += 1
+                entry["seq"] = self._seq
+                line = (json.dumps(entry) + "\n").encode()
+                rows.append((entry, self._segment, offset, len(line)))
+                lines.append(line)
+                offset += len(line)
+
+            # One write and at most one fsync for the whole group
+            self._file.write(b"".join(lines))
+            self._file.flush()
+            now = time.monotonic()
+            if self.fsync == "commit" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+                self._unsynced = False
+            else:
+                self._unsynced = self.fsync == "interval"
+
+            self._index(rows)
+            self._conn.commit()
+            self.commits += 1
+            self.entries += len(entries)
+
+    def _sync(self):
+        with self._lock:
+            if self._unsynced:
+                os.fsync(self._file.fileno())
+                self._last_fsync = time.monotonic()
+                self._unsynced = False
+
+    def flush(self):
+        """Wait until every queued entry has been written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def history(self, patient_id, limit=None, before=None):
+        """
+        Read a patient's audit entries through the index
+
+        Args:
+            patient_id: ID of the patient
+            limit: Optional maximum number of entries (the most recent are kept)
+            before: Optional sequence number, only older entries are returned
+
+        Returns:
+            List of entry dictionaries, oldest first
+        """
+        if self._thread is None:
+            self.start()
+
+        query = "SELECT segment, offset, length FROM entries WHERE patient_id = ?"
+        params = [patient_id]
+        if before is not None:
+            query += " AND seq < ?"
+            params.append(before)
+        query += " ORDER BY seq DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        entries = []
+        files = {}
+        try:
+            for segment, offset, length in reversed(rows):
+                f = files.get(segment)
+                if f is None:
+                    f = files[segment] = open(self._segment_path(segment), "rb")
+                f.seek(offset)
+                entries.append(json.loads(f.read(length)))
+        finally:
+            for f in files.values():
+                f.close()
+        return entries
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "commits": self.commits,
+            "entries": self.entries,
+            "segment": self._segment,
+            "fsync": self.fsync
+        }
+
+    def close(self):
+        """Write everything queued and stop the writer"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+            self._sync()
+            with self._lock:
+                self._file.close()
+                self._conn.close()
+
+# Shared audit trail for the process
+audit_log = AuditLog()
+atexit.register(audit_log.close)
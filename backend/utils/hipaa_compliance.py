@@ -1,68 +1,229 @@
 #!/usr/bin/env python3
 import os
 import json
+import getpass
 import base64
-from cryptography.fernet import Fernet
+import hashlib
+import threading
+import time
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import uuid
 import datetime
 import logging
+from utils.metrics import timed
+from utils.audit import audit_log, configure_logging
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("hipaa_compliance.log"),
-        logging.StreamHandler()
-    ]
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Constants
 KEY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "keys")
 SALT_FILE = os.path.join(KEY_DIR, "salt.key")
+RETIRED_SALT_FILE = os.path.join(KEY_DIR, "retired_salts.key")
+SALT_SIZE = 16
+PBKDF2_ITERATIONS = 100000
+DEFAULT_PASSWORD = "PatientVisitSummarizer"  # In production, would use a more secure way to manage the master password
+try:
+    SERVICE_USER = getpass.getuser()  # Account the service runs as, recorded when no user is given
+except Exception:
+    SERVICE_USER = "unknown"
+KEY_CACHE_TTL = float(os.environ.get("KEY_CACHE_TTL", 3600))  # Seconds a derived key stays in memory
 
-def get_encryption_key(password=None):
+def derive_key(password, salt, iterations=PBKDF2_ITERATIONS):
     """
-    Generate or retrieve encryption key using a password and salt
+    Derive a Fernet key from a password and salt using PBKDF2
     
     Args:
-        password: Optional password for key generation
+        password: Password string or bytes
+        salt: Salt bytes
+        iterations: Number of PBKDF2 iterations
         
     Returns:
-        Fernet encryption key
+        URL-safe base64 encoded Fernet key
     """
-    # Create key directory if it doesn't exist
-    if not os.path.exists(KEY_DIR):
-        os.makedirs(KEY_DIR)
-    
-    # Generate or load salt
-    if os.path.exists(SALT_FILE):
-        with open(SALT_FILE, 'rb') as f:
-            salt = f.read()
-    else:
-        salt = os.urandom(16)
-        with open(SALT_FILE, 'wb') as f:
-            f.write(salt)
-    
-    # Use provided password or generate one
-    if password is None:
-        # In production, would use a more secure way to manage the master password
-        password = "PatientVisitSummarizer"  # Default password
-    
-    password = password.encode()
-    
-    # Generate key using PBKDF2
+    if isinstance(password, str):
+        password = password.encode()
+    
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
         salt=salt,
-        iterations=100000,
+        iterations=iterations,
     )
-    key = base64.urlsafe_b64encode(kdf.derive(password))
-    return key
+    return base64.urlsafe_b64encode(kdf.derive(password))
+
+class KeyManager:
+    """
+    Process-wide store of derived encryption keys
+    
+    PBKDF2 is deliberately slow, so each (password, salt) pair is derived once
+    and the resulting key and cipher are reused until the salts expire or are
+    rotated. Salts retired by rotate() are kept on disk so data encrypted
+    before a rotation can still be decrypted through MultiFernet.
+    """
+    
+    def __init__(self, key_dir=KEY_DIR, iterations=PBKDF2_ITERATIONS, ttl=KEY_CACHE_TTL):
+        """
+        Args:
+            key_dir: Directory holding the current and retired salts
+            iterations: Number of PBKDF2 iterations
+            ttl: Seconds before a cached key is derived again (None to never expire)
+        """
+        self.key_dir = key_dir
+        self.salt_file = os.path.join(key_dir, os.path.basename(SALT_FILE))
+        self.retired_salt_file = os.path.join(key_dir, os.path.basename(RETIRED_SALT_FILE))
+        self.iterations = iterations
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._salts = None
+        self._salts_loaded_at = None
+        self._keys = {}  # (password digest, salt) -> derived key
+        self._ciphers = {}  # password digest -> MultiFernet
+        self.derivations = 0
+    
+    def _load_salts(self):
+        """Load (or create) the current salt followed by any retired salts"""
+        if self._salts is not None:
+            return self._salts
+        
+        os.makedirs(self.key_dir, exist_ok=True)
+        
+        if os.path.exists(self.salt_file):
+            with open(self.salt_file, 'rb') as f:
+                salt = f.read()
+        else:
+            salt = os.urandom(SALT_SIZE)
+            with open(self.salt_file, 'wb') as f:
+                f.write(salt)
+        
+        retired = []
+        if os.path.exists(self.retired_salt_file):
+            with open(self.retired_salt_file, 'rb') as f:
+                data = f.read()
+            # Most recently retired salts are appended last, try them first
+            retired = [data[i:i + SALT_SIZE] for i in range(0, len(data), SALT_SIZE)][::-1]
+        
+        self._salts = [salt] + retired
+        self._salts_loaded_at = time.monotonic()
+        return self._salts
+    
+    @staticmethod
+    def _password_digest(password):
+        if password is None:
+            password = DEFAULT_PASSWORD
+        if isinstance(password, str):
+            password = password.encode()
+        return hashlib.sha256(password).digest(), password
+    
+    def _derive(self, digest, password, salt):
+        cache_key = (digest, salt)
+        key = self._keys.get(cache_key)
+        if key is None:
+            with timed("key_derivation"):
+                key = derive_key(password, salt, self.iterations)
+            self._keys[cache_key] = key
+            self.derivations += 1
+        return key
+    
+    def _expired(self, loaded_at):
+        return self.ttl is not None and time.monotonic() - loaded_at >= self.ttl
+    
+    def get_key(self, password=None):
+        """
+        Get the current Fernet key for a password
+        
+        Args:
+            password: Optional password for key generation
+            
+        Returns:
+            Fernet encryption key
+        """
+        digest, password = self._password_digest(password)
+        with self._lock:
+            self._evict_expired()
+            return self._derive(digest, password, self._load_salts()[0])
+    
+    def get_cipher(self, password=None):
+        """
+        Get a reusable cipher for a password
+        
+        Encrypts with the key for the current salt and decrypts with the
+        current or any retired key.
+        
+        Args:
+            password: Optional password for key generation
+            
+        Returns:
+            MultiFernet cipher
+        """
+        digest, password = self._password_digest(password)
+        with self._lock:
+            self._evict_expired()
+            cipher = self._ciphers.get(digest)
+            if cipher is not None:
+                return cipher
+            
+            cipher = MultiFernet([
+                Fernet(self._derive(digest, password, salt)) for salt in self._load_salts()
+            ])
+            self._ciphers[digest] = cipher
+            return cipher
+    
+    def rotate(self):
+        """
+        Rotate to a fresh salt
+        
+        The previous salt is appended to the retired salt file so existing
+        ciphertexts remain readable. Use MultiFernet.rotate() on stored data
+        to re-encrypt it under the new key.
+        
+        Returns:
+            The new salt
+        """
+        with self._lock:
+            salts = self._load_salts()
+            with open(self.retired_salt_file, 'ab') as f:
+                f.write(salts[0])
+            
+            new_salt = os.urandom(SALT_SIZE)
+            with open(self.salt_file, 'wb') as f:
+                f.write(new_salt)
+            
+            self.clear()
+            logger.info("Encryption salt rotated")
+            return new_salt
+    
+    def clear(self):
+        """Drop all cached keys and salts so they are re-read on next use"""
+        with self._lock:
+            self._salts = None
+            self._salts_loaded_at = None
+            self._keys.clear()
+            self._ciphers.clear()
+    
+    def _evict_expired(self):
+        # Every cached key and cipher comes from the loaded salts, so they all
+        # expire with them and a rotation by another process is picked up
+        if self._salts is not None and self._expired(self._salts_loaded_at):
+            self.clear()
+
+# Shared key manager for the process
+key_manager = KeyManager()
+
+def get_encryption_key(password=None):
+    """
+    Generate or retrieve encryption key using a password and salt
+    
+    Args:
+        password: Optional password for key generation
+        
+    Returns:
+        Fernet encryption key
+    """
+    return key_manager.get_key(password)
 
 def encrypt_data(data, password=None):
     """
@@ -76,11 +237,8 @@ def encrypt_data(data, password=None):
         Encrypted data as bytes
     """
     try:
-        # Get encryption key
-        key = get_encryption_key(password)
-        
-        # Create Fernet cipher
-        cipher = Fernet(key)
+        # Get cached cipher
+        cipher = key_manager.get_cipher(password)
         
         # Create metadata
         metadata = {
@@ -99,7 +257,8 @@ def encrypt_data(data, password=None):
         }).encode()
         
         # Encrypt
-        encrypted_data = cipher.encrypt(combined_data)
+        with timed("encrypt"):
+            encrypted_data = cipher.encrypt(combined_data)
         
         # Log encryption event (without sensitive data)
         logger.info(f"Data encrypted: {metadata['uuid']}")
@@ -110,26 +269,25 @@ def encrypt_data(data, password=None):
         logger.error(f"Encryption error: {str(e)}")
         raise
 
-def decrypt_data(encrypted_data, password=None):
+def decrypt_data(encrypted_data, password=None, binary=False):
     """
     Decrypt Fernet-encrypted data
     
     Args:
         encrypted_data: Bytes of encrypted data
         password: Optional password for decryption key
+        binary: Return the decrypted bytes instead of decoding them as text
         
     Returns:
-        Decrypted data as string
+        Decrypted data as string (or bytes if binary is set)
     """
     try:
-        # Get encryption key
-        key = get_encryption_key(password)
-        
-        # Create Fernet cipher
-        cipher = Fernet(key)
+        # Get cached cipher
+        cipher = key_manager.get_cipher(password)
         
         # Decrypt
-        decrypted_data = cipher.decrypt(encrypted_data)
+        with timed("decrypt"):
+            decrypted_data = cipher.decrypt(encrypted_data)
         
         # Parse JSON
         json_data = json.loads(decrypted_data.decode('utf-8'))
@@ -140,13 +298,13 @@ def decrypt_data(encrypted_data, password=None):
         # Log decryption event (without sensitive data)
         logger.info(f"Data decrypted: {json_data['metadata']['uuid']}")
         
-        return original_data.decode('utf-8')
+        return original_data if binary else original_data.decode('utf-8')
     
     except Exception as e:
         logger.error(f"Decryption error: {str(e)}")
         raise
 
-def secure_storage(encrypted_data, file_path, patient_id):
+def secure_storage(encrypted_data, file_path, patient_id, user=None):
     """
     Securely store encrypted data with audit trail
     
@@ -154,6 +312,7 @@ def secure_storage(encrypted_data, file_path, patient_id):
         encrypted_data: Bytes of encrypted data
         file_path: Path to save the encrypted data
         patient_id: ID of the patient for audit trail
+        user: Optional user responsible for the write, defaults to the service account
         
     Returns:
         None
@@ -165,22 +324,11 @@ def secure_storage(encrypted_data, file_path, patient_id):
             os.makedirs(directory)
         
         # Write encrypted data to file
-        with open(file_path, 'wb') as f:
+        with timed("disk_write"), open(file_path, 'wb') as f:
             f.write(encrypted_data)
         
-        # Create audit log entry
-        audit_entry = {
-            "timestamp": datetime.datetime.now().isoformat(),
-            "action": "secure_storage",
-            "patient_id": patient_id,
-            "file_path": file_path,
-            "user": os.getlogin()
-        }
-        
-        # Write audit log
-        audit_log_path = os.path.join(os.path.dirname(file_path), f"audit_{patient_id}.log")
-        with open(audit_log_path, 'a') as f:
-            f.write(json.dumps(audit_entry) + "\n")
+        # Queue the audit entry; the audit writer commits it in the background
+        audit_log.record("secure_storage", patient_id, file_path=file_path, user=user or SERVICE_USER)
         
         logger.info(f"Data securely stored for patient: {patient_id}")
     
@@ -202,4 +350,5 @@ def access_control(patient_id, user_id):
     # In a real implementation, would check against a database of permissions
     # For demo purposes, just log the access attempt
     logger.info(f"Access attempt: User {user_id} for Patient {patient_id}")
+    audit_log.record("access_attempt", patient_id, user=user_id, allowed=True)
     return True
\ No newline at end of file
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+import os
+import asyncio
+import shutil
+import hashlib
+import threading
+import subprocess
+import logging
+import numpy as np
+from utils.metrics import metrics, timed
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+    from python_multipart.exceptions import FormParserError
+except ImportError:  # python-multipart before 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+    from multipart.exceptions import FormParserError
+
+logger = logging.getLogger(__name__)
+
+DECODER_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+DECODER_READ_BYTES = 64 * 1024  # Read size for the decoder's output and for audio files
+MAX_DECODED_SECONDS = float(os.environ.get("MAX_DECODED_SECONDS", 2 * 3600))  # Longest recording accepted
+MAX_FIELD_BYTES = 64 * 1024  # Largest non-file form field
+
+PEAK_BYTES_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(11))  # 1 MB to 1 GB
+UPLOAD_PEAK_BYTES = metrics.histogram(
+    "upload_peak_bytes", "Largest amount of upload and decoded audio held in memory per upload", buckets=PEAK_BYTES_BUCKETS
+)
+UPLOAD_BYTES = metrics.counter("upload_bytes", "Bytes of audio received in uploads")
+
+class UploadTooLarge(Exception):
+    """Upload or its decoded audio exceeds the configured limit"""
+    pass
+
+class InvalidUpload(Exception):
+    """Malformed request, missing file or disallowed file type"""
+    pass
+
+class DecodeError(Exception):
+    """The decoder could not turn the upload into audio"""
+    pass
+
+class DecoderUnavailable(Exception):
+    """The audio decoder is not installed, so no upload can be decoded"""
+    pass
+
+def decoder_available(binary=DECODER_BINARY):
+    """
+    Check that the audio decoder can be run
+
+    Args:
+        binary: Name or path of the ffmpeg executable
+
+    Returns:
+        True if the executable is found
+    """
+    return shutil.which(binary) is not None
+
+def decoder_config(sample_rate):
+    """
+    Settings that determine the decoded samples, for cache keys
+
+    Args:
+        sample_rate: Rate the audio is decoded to
+
+    Returns:
+        Dictionary of decoder settings
+    """
+    return {"decoder": "ffmpeg", "format": "f32le", "channels": 1, "downmix": "mean", "sampleRate": sample_rate}
+
+class StreamingDecoder:
+    """
+    Decode compressed audio fed in pieces to mono float32 PCM
+
+    Input is piped to an ffmpeg process as it arrives and a reader thread
+    collects the decoded samples, so neither the compressed upload nor a
+    temporary file is ever held in full. Every format ffmpeg reads is
+    accepted; MP4/M4A files must have their index at the start (as
+    "faststart" files do) since a pipe cannot be seeked. For live streams,
+    decode() hands back the audio decoded so far after every piece.
+    """
+
+    def __init__(self, sample_rate, max_seconds=MAX_DECODED_SECONDS, binary=DECODER_BINARY, input_format=None):
+        """
+        Args:
+            sample_rate: Rate to decode to
+            max_seconds: Longest decoded audio accepted
+            binary: Path of the ffmpeg executable
+            input_format: Optional ffmpeg container name, so malformed input is
+                refused at once instead of after format probing
+        """
+        self.sample_rate = sample_rate
+        self.max_bytes = int(max_seconds * sample_rate) * 4
+        self.input_bytes = 0
+        self.peak_bytes = 0
+        self.too_long = False
+        self._output = bytearray()
+        self._taken = 0  # Bytes of output already handed out by take()
+        self._output_lock = threading.Lock()
+        self._errors = bytearray()
+        try:
+            self._process = subprocess.Popen(
+                [binary, "-hide_banner", "-loglevel", "error", *(["-f", input_format] if input_format else []),
+                 "-i", "pipe:0",
+                 # Channels are averaged like prepare_speech_for_whisper does, not mixed at +3 dB
+                 "-vn", "-af", f"aresample={sample_rate}:rematrix_maxval=1", "-ac", "1", "-f", "f32le", "pipe:1"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except FileNotFoundError:
+            raise DecoderUnavailable(f"Audio decoder '{binary}' is not installed")
+
+        # Both pipes are drained continuously so ffmpeg never blocks on a full pipe
+        self._readers = [
+            threading.Thread(target=self._read_output, daemon=True),
+            threading.Thread(target=self._read_errors, daemon=True)
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    def _read_output(self):
+        for chunk in iter(lambda: self._process.stdout.read1(DECODER_READ_BYTES), b""):
+            with self._output_lock:
+                if self._taken + len(self._output) + len(chunk) > self.max_bytes:
+                    self.too_long = True
+                    self._process.kill()
+                    break
+                self._output.extend(chunk)
+
+    def _read_errors(self):
+        for chunk in iter(lambda: self._process.stderr.read1(DECODER_READ_BYTES), b""):
+            self._errors.extend(chunk[:4096 - len(self._errors)])
+
+    def _check(self):
+        if self.too_long:
+            raise UploadTooLarge(f"Recording is longer than {self.max_bytes // 4 // self.sample_rate} seconds")
+
+    def feed(self, data):
+        """
+        Pass the next piece of the encoded audio to the decoder
+
+        Blocks while the decoder catches up, which holds back reading the
+        request instead of buffering it.
+
+        Args:
+            data: Encoded bytes
+        """
+        self.input_bytes += len(data)
+        self.peak_bytes = max(self.peak_bytes, len(self._output) + len(data))
+        try:
+            self._process.stdin.write(data)
+            self._process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            # The decoder exited early, finish() reports why
+            self._check()
+
+    def take(self):
+        """
+        Remove and return the audio decoded so far
+
+        Returns:
+            1D float32 numpy array, possibly empty
+        """
+        with self._output_lock:
+            usable = len(self._output) - len(self._output) % 4
+            data = bytes(self._output[:usable])
+            del self._output[:usable]
+            self._taken += usable
+        return np.frombuffer(data, dtype=np.float32)
+
+    def decode(self, data):
+        """
+        Feed the next piece of a live stream and collect what is ready
+
+        The decoder lags its input slightly, so audio from one piece may
+        only come out with the next one or from finish().
+
+        Args:
+            data: Encoded bytes
+
+        Returns:
+            1D float32 numpy array of newly decoded audio
+
+        Raises:
+            DecodeError: If the decoder has rejected the stream
+        """
+        self.feed(data)
+        returncode = self._process.poll()
+        if returncode:
+            self._check()
+            self._readers[1].join()
+            message = self._errors.decode(errors="replace").strip().splitlines()
+            raise DecodeError(f"Could not decode audio: {message[-1] if message else f'exit code {returncode}'}")
+        return self.take()
+
+    def finish(self):
+        """
+        Wait for the remaining audio to be decoded
+
+        Returns:
+            1D float32 numpy array at sample_rate of the audio not yet
+            taken, sharing the decoder's buffer
+        """
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._process.wait()
+        for reader in self._readers:
+            reader.join()
+
+        self._check()
+        if returncode != 0:
+            message = self._errors.decode(errors="replace").strip().splitlines()
+            raise DecodeError(f"Could not decode audio: {message[-1] if message else f'exit code {returncode}'}")
+
+        self.peak_bytes = max(self.peak_bytes, len(self._output))
+        usable = len(self._output) - len(self._output) % 4
+        return np.frombuffer(self._output, dtype=np.float32, count=usable // 4)
+
+    def abort(self):
+        """Stop the decoder without waiting for its output"""
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        for stream in (self._process.stdin, self._process.stdout, self._process.stderr):
+            try:
+                stream.close()
+            except (BrokenPipeError, OSError):
+                pass
+
+    def stats(self):
+        return {
+            "uploadBytes": self.input_bytes,
+            "decodedSeconds": (self._taken + len(self._output)) / 4 / self.sample_rate,
+            "sampleRate": self.sample_rate,
+            "peakBytes": self.peak_bytes
+        }
+
+class IngestedUpload:
+    """Form fields, digest and decoded audio of an uploaded recording"""
+
+    def __init__(self, fields, filename, digest, audio, sample_rate, stats):
+        self.fields = fields
+        self.filename = filename
+        self.digest = digest
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.stats = stats
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+async def ingest_upload(content_type, chunks, sample_rate, max_bytes, allowed_extensions, file_field="audio",
+                        decoder_factory=StreamingDecoder):
+    """
+    Decode a multipart audio upload while it is being received
+
+    The body is parsed as it arrives. Form fields are collected and the
+    file part is hashed and piped to the decoder chunk by chunk, so memory
+    stays at the decoded audio plus one chunk and oversized uploads are
+    rejected as soon as they cross the limit.
+
+    Args:
+        content_type: Content-Type header of the request
+        chunks: Async iterator over the request body
+        sample_rate: Rate to decode to
+        max_bytes: Largest accepted file part
+        allowed_extensions: File name extensions accepted
+        file_field: Name of the form field carrying the audio
+        decoder_factory: Callable taking the sample rate and returning a decoder
+
+    Returns:
+        IngestedUpload
+    """
+    _, params = parse_options_header(content_type or "")
+    boundary = params.get(b"boundary")
+    if boundary is None:
+        raise InvalidUpload("Expected a multipart/form-data request")
+
+    loop = asyncio.get_running_loop()
+    fields = {}
+    digest = hashlib.sha256()
+    state = {"name": None, "filename": None, "header": b"", "value": b"", "disposition": b"", "data": bytearray()}
+    pending = []  # File data parsed from the current chunk, fed to the decoder outside the callbacks
+    decoder = None
+    received = 0
+    filename = None
+
+    def on_part_begin():
+        state.update(name=None, filename=None, disposition=b"", data=bytearray())
+
+    def on_header_field(data, start, end):
+        state["header"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        if state["header"].lower() == b"content-disposition":
+            state["disposition"] = state["value"]
+        state["header"], state["value"] = b"", b""
+
+    def on_headers_finished():
+        nonlocal decoder, filename
+        _, options = parse_options_header(state["disposition"])
+        state["name"] = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if state["name"] == file_field:
+            if decoder is not None:
+                raise InvalidUpload(f"Only one '{file_field}' file is accepted")
+            filename = options.get(b"filename", b"").decode("utf-8", errors="replace")
+            if not filename:
+                raise InvalidUpload("No selected file")
+            if _extension(filename) not in allowed_extensions:
+                raise InvalidUpload(f"File type not allowed. Allowed types: {', '.join(sorted(allowed_extensions))}")
+            decoder = decoder_factory(sample_rate)
+
+    def on_part_data(data, start, end):
+        nonlocal received
+        if state["name"] == file_field:
+            received += end - start
+            if received > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds the {max_bytes // (1024 * 1024)}MB limit")
+            pending.append(data[start:end])
+        else:
+            state["data"] += data[start:end]
+            if len(state["data"]) > MAX_FIELD_BYTES:
+                raise InvalidUpload(f"Form field '{state['name']}' is too large")
+
+    def on_part_end():
+        if state["name"] != file_field:
+            fields[state["name"]] = state["data"].decode("utf-8", errors="replace")
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end
+    })
+
+    try:
+        with timed("upload"):
+            async for chunk in chunks:
+                try:
+                    parser.write(chunk)
+                except FormParserError:
+                    raise InvalidUpload("Invalid multipart data")
+                if pending:
+                    data = b"".join(pending)
+                    pending.clear()
+                    digest.update(data)
+                    # Feeding blocks while ffmpeg catches up, keep it off the event loop
+                    await loop.run_in_executor(None, decoder.feed, data)
+            parser.finalize()
+
+        if decoder is None:
+            raise InvalidUpload("No selected file")
+        with timed("decode"):
+            audio = await loop.run_in_executor(None, decoder.finish)
+    except BaseException:
+        if decoder is not None:
+            decoder.abort()
+        raise
+
+    stats = decoder.stats()
+    UPLOAD_PEAK_BYTES.observe(stats["peakBytes"])
+    UPLOAD_BYTES.inc(stats["uploadBytes"])
+    return IngestedUpload(fields, filename, digest.hexdigest(), audio, sample_rate, stats)
+
+def decode_file(path, sample_rate, decoder_factory=StreamingDecoder):
+    """
+    Decode an audio file through the streaming decoder
+
+    Args:
+        path: Path to the audio file
+        sample_rate: Rate to decode to
+        decoder_factory: Callable taking the sample rate and returning a decoder
+
+    Returns:
+        Tuple of (1D float32 numpy array, sample rate)
+    """
+    decoder = decoder_factory(sample_rate)
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(DECODER_READ_BYTES), b""):
+                decoder.feed(block)
+        audio = decoder.finish()
+    except BaseException:
+        decoder.abort()
+        raise
+    UPLOAD_PEAK_BYTES.observe(decoder.stats()["peakBytes"])
+    return audio, sample_rate
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import os
+import uuid
+import sqlite3
+import datetime
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Job stages in pipeline order
+JOB_STAGES = ["queued", "denoise", "transcribe", "ner", "summarize", "store", "completed"]
+
+class JobStore:
+    """
+    SQLite-backed record of visit processing jobs
+
+    Jobs survive a worker restart: anything not completed or failed can be
+    picked up again with unfinished(). Results are stored as opaque bytes so
+    callers can keep them encrypted at rest.
+    """
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                idempotency_key TEXT UNIQUE,
+                patient_id TEXT NOT NULL,
+                visit_date TEXT,
+                input_path TEXT,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                error TEXT,
+                result BLOB,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def _row_to_job(self, row):
+        return dict(row) if row is not None else None
+
+    def create(self, patient_id, visit_date, input_path, idempotency_key=None):
+        """
+        Create a queued job
+
+        If a job with the same idempotency key already exists it is returned
+        instead, so client retries don't redo the work.
+
+        Args:
+            patient_id: ID of the patient
+            visit_date: Date of the visit
+            input_path: Path to the uploaded audio
+            idempotency_key: Optional client-supplied key for retries
+
+        Returns:
+            Tuple of (job dictionary, whether the job was newly created)
+        """
+        now = datetime.datetime.now().isoformat()
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            if idempotency_key is not None:
+                existing = self._conn.execute(
+                    "SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()
+                if existing is not None:
+                    return self._row_to_job(existing), False
+
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, idempotency_key, patient_id, visit_date, input_path, status, stage, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', 'queued', ?, ?)",
+                (job_id, idempotency_key, patient_id, visit_date, input_path, now, now)
+            )
+            self._conn.commit()
+        return self.get(job_id), True
+
+    def get(self, job_id):
+        """
+        Look up a job
+
+        Args:
+            job_id: ID of the job
+
+        Returns:
+            Job dictionary, or None if not found
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = datetime.datetime.now().isoformat()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id)
+            )
+            self._conn.commit()
+
+    def set_stage(self, job_id, stage):
+        """
+        Record the stage a job has reached
+
+        Args:
+            job_id: ID of the job
+            stage: One of JOB_STAGES
+        """
+        if stage not in JOB_STAGES:
+            raise ValueError(f"Unknown job stage: {stage}")
+        self._update(job_id, status="queued" if stage == "queued" else "running", stage=stage)
+
+    def complete(self, job_id, result):
+        """
+        Mark a job completed and store its result
+
+        Args:
+            job_id: ID of the job
+            result: Result bytes
+        """
+        self._update(job_id, status="completed", stage="completed", result=result, input_path=None)
+
+    def fail(self, job_id, error):
+        """
+        Mark a job failed, keeping the stage it failed in
+
+        Args:
+            job_id: ID of the job
+            error: Error message
+        """
+        self._update(job_id, status="failed", error=error)
+
+    def unfinished(self):
+        """
+        List jobs that were queued or running, e.g. when a worker restarted
+
+        Returns:
+            List of job dictionaries, oldest first
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+import sys
+import time
+import math
+import threading
+import contextvars
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Audio lengths from short clips to long visits, in seconds
+DURATION_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+# Processing time per second of audio
+RTF_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        return tuple(zip(self.labelnames, key)) + tuple(extra)
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + "_total", self._labels(key), value) for key, value in self._values.items()]
+
+class Gauge(_Metric):
+    """Value that goes up and down, set directly or tracked as a high-water mark"""
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_max(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = max(self._values.get(key, value), value)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append((self.name + "_bucket", self._labels(key, [("le", _format_value(bound))]), cumulative))
+                samples.append((self.name + "_sum", self._labels(key), total))
+                samples.append((self.name + "_count", self._labels(key), cumulative))
+        return samples
+
+class MetricsRegistry:
+    """
+    Process-wide metrics rendered in the Prometheus text format
+
+    Metrics are created once and updated where the work happens. Collectors
+    are called at scrape time for values that are cheaper to read than to
+    track, such as queue depths.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, collect):
+        """
+        Register a scrape-time callback
+
+        Args:
+            collect: Zero-argument callable that updates gauges or counters before rendering
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format
+
+        Returns:
+            Text body for a /metrics endpoint
+        """
+        for collect in self._collectors:
+            collect()
+
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Shared registry for the process
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram("visit_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+MAX_RSS_BYTES = metrics.gauge("process_max_rss_bytes", "Peak resident memory", ["process"])
+
+def max_rss_bytes():
+    """Peak resident memory of the current process, or None where unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _collect_memory():
+    peak = max_rss_bytes()
+    if peak is not None:
+        MAX_RSS_BYTES.set(peak, process="api")
+
+metrics.register_collector(_collect_memory)
+
+class Trace:
+    """Per-request timing breakdown, stage name to accumulated seconds"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    def to_dict(self, audio_seconds=None):
+        """
+        Args:
+            audio_seconds: Optional length of the recording, for the real-time factor
+
+        Returns:
+            Dictionary of total seconds, per-stage seconds and real-time factor
+        """
+        elapsed = self.elapsed
+        with self._lock:
+            stages = dict(self.stages)
+        return {
+            "totalSeconds": elapsed,
+            "stages": stages,
+            "audioSeconds": audio_seconds,
+            "realTimeFactor": elapsed / audio_seconds if audio_seconds else None
+        }
+
+# Trace of the request being handled; copied into threadpool calls with the context
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+def start_trace():
+    """
+    Start collecting a timing breakdown for the current request
+
+    Returns:
+        The new Trace
+    """
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+def record_stage(stage, seconds):
+    """
+    Record time spent in a stage
+
+    Args:
+        stage: Stage name
+        seconds: Elapsed seconds
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(stage, seconds)
+
+@contextmanager
+def timed(stage):
+    """
+    Time a block as a pipeline stage
+
+    Args:
+        stage: Stage name
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Model load states
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+class ModelEntry:
+    """Load state of one registered model"""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.state = NOT_LOADED
+        self.model = None
+        self.error = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+class ModelRegistry:
+    """
+    Models loaded on first use or by a background warm-up
+
+    Importing the API no longer loads anything, so the server starts
+    immediately and readiness is reported per model while they load.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def register(self, name, loader):
+        """
+        Register a model loader
+
+        Args:
+            name: Name of the model
+            loader: Zero-argument callable returning the loaded model
+        """
+        self._entries[name] = ModelEntry(name, loader)
+
+    def get(self, name):
+        """
+        Get a model, loading it if this is the first use
+
+        Concurrent callers wait for a single load. A failed load is retried
+        on the next call.
+
+        Args:
+            name: Name of the model
+
+        Returns:
+            The loaded model
+
+        Raises:
+            KeyError: If no model is registered under the name
+        """
+        entry = self._entries[name]
+        if entry.state == READY:
+            return entry.model
+
+        with entry.lock:
+            if entry.state != READY:
+                self._load(entry)
+            if entry.state == FAILED:
+                raise RuntimeError(f"Model '{name}' failed to load: {entry.error}")
+        return entry.model
+
+    def _load(self, entry):
+        entry.state = LOADING
+        logger.info(f"Loading model '{entry.name}'")
+        start = time.perf_counter()
+        try:
+            entry.model = entry.loader()
+        except Exception as e:
+            entry.state = FAILED
+            entry.error = str(e)
+            logger.error(f"Failed to load model '{entry.name}': {str(e)}")
+        else:
+            entry.state = READY
+            entry.error = None
+            logger.info(f"Loaded model '{entry.name}'")
+        finally:
+            entry.load_seconds = time.perf_counter() - start
+
+    def warm_up(self, names=None):
+        """
+        Load models in a background thread
+
+        Args:
+            names: Optional list of model names (defaults to all registered)
+
+        Returns:
+            The warm-up thread
+        """
+        names = list(self._entries) if names is None else names
+
+        def load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception:
+                    # Already recorded in the entry and reported by status()
+                    pass
+
+        thread = threading.Thread(target=load_all, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def ready(self):
+        return all(entry.state == READY for entry in self._entries.values())
+
+    def status(self):
+        """
+        Report the load state of every model
+
+        Returns:
+            Dictionary of model name to state, load time and error
+        """
+        return {
+            name: {
+                "state": entry.state,
+                "loadSeconds": entry.load_seconds,
+                "error": entry.error
+            }
+            for name, entry in self._entries.items()
+        }
+
+# Shared registry for the process
+model_registry = ModelRegistry()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+import os
+import json
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from utils.hipaa_compliance import encrypt_data, decrypt_data
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+DIGEST_BLOCK_BYTES = 1024 * 1024  # Read size when hashing files
+
+CACHE_LOOKUPS = metrics.counter("result_cache_lookups", "Result cache lookups", ["stage", "outcome"])
+
+def digest_file(path):
+    """
+    Hash a file's contents without reading it into memory at once
+
+    Args:
+        path: Path to the file
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(DIGEST_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_key(*parts):
+    """
+    Content-addressed key for a stage's inputs
+
+    Args:
+        parts: JSON-serializable inputs, e.g. an upstream key or digest and the stage's configuration
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+class ResultCache:
+    """
+    Encrypted, size-bounded store of pipeline stage outputs
+
+    Each entry is one stage's output under a key derived from everything
+    that produced it, so the same recording run with the same models and
+    DSP settings is served from disk. Entries are encrypted with
+    encrypt_data and the least recently used are evicted once the total
+    size exceeds max_bytes. Recency survives restarts through file
+    modification times.
+    """
+
+    def __init__(self, root, max_bytes=RESULT_CACHE_MAX_BYTES, enabled=RESULT_CACHE_ENABLED):
+        """
+        Args:
+            root: Directory holding the cache entries
+            max_bytes: Largest total size of the encrypted entries
+            enabled: When off every lookup misses and nothing is stored
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> size, least recently used first
+        self._size = 0
+        self._counters = {}  # stage -> {"hits", "misses"}
+        self.evictions = 0
+
+        if enabled:
+            os.makedirs(root, exist_ok=True)
+            self._load_index()
+
+    def _load_index(self):
+        found = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                if not name.endswith(".enc"):
+                    # Left behind by an interrupted write
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, path, stat.st_size))
+
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    def _path(self, key, stage):
+        return os.path.join(self.root, key[:2], f"{key}.{stage}.enc")
+
+    def _count(self, stage, outcome):
+        counters = self._counters.setdefault(stage, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+        CACHE_LOOKUPS.inc(stage=stage, outcome=outcome)
+
+    def _remove(self, path):
+        self._size -= self._entries.pop(path, 0)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            path = next(iter(self._entries))
+            self._remove(path)
+            self.evictions += 1
+
+    def get(self, key, stage, binary=False):
+        """
+        Look up a stage output
+
+        Args:
+            key: Cache key from cache_key()
+            stage: Name of the pipeline stage
+            binary: Return bytes instead of text
+
+        Returns:
+            The stored output, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        path = self._path(key, stage)
+        with self._lock:
+            if path not in self._entries:
+                self._count(stage, "misses")
+                return None
+            self._entries.move_to_end(path)
+
+        try:
+            with open(path, "rb") as f:
+                data = decrypt_data(f.read(), binary=binary)
+            os.utime(path)
+        except Exception as e:
+            # Evicted by another request meanwhile, or unreadable after a key change
+            logger.warning(f"Dropping unreadable cache entry for stage '{stage}': {str(e)}")
+            with self._lock:
+                self._remove(path)
+                self._count(stage, "misses")
+            return None
+
+        with self._lock:
+            self._count(stage, "hits")
+        return data
+
+    def put(self, key, stage, data):
+        """
+        Store a stage output
+
+        Args:
+            key: Cache key from cache_key()
+            stage: Name of the pipeline stage
+            data: Text or bytes to store
+        """
+        if not self.enabled:
+            return
+
+        encrypted = encrypt_data(data)
+        if len(encrypted) > self.max_bytes:
+            return
+
+        path = self._path(key, stage)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(encrypted)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._size -= self._entries.pop(path, 0)
+            self._entries[path] = len(encrypted)
+            self._size += len(encrypted)
+            self._evict()
+
+    def get_json(self, key, stage):
+        data = self.get(key, stage)
+        return None if data is None else json.loads(data)
+
+    def put_json(self, key, stage, value):
+        self.put(key, stage, json.dumps(value))
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            for path in list(self._entries):
+                self._remove(path)
+
+    def stats(self):
+        """
+        Report cache size and hit rates
+
+        Returns:
+            Dictionary of entry count, sizes, evictions and per-stage hits and misses
+        """
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "maxBytes": self.max_bytes,
+                "evictions": self.evictions,
+                "stages": {stage: dict(counters) for stage, counters in self._counters.items()}
+            }
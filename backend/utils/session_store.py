@@ -0,0 +1,605 @@
+#!/usr/bin/env python3
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+import logging
+from collections import namedtuple
+from functools import partial
+import numpy as np
+from utils.audio_processing import PROCESSING_SAMPLE_RATE
+from utils.ingest import StreamingDecoder, decode_file, DECODER_READ_BYTES
+
+logger = logging.getLogger(__name__)
+
+SESSION_AUDIO_FILE = "audio.f32"  # Audio of sessions streamed before formats were negotiated
+SESSION_INDEX_FILE = "index.i64"
+SESSION_FORMAT_FILE = "format.json"
+LEGACY_CHUNK_PREFIX = "chunk_"  # Per-chunk .raw files written before the store existed
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+SAMPLE_DTYPE = np.float32
+
+# How chunks of each codec are stored: file name, stored unit, the container the decoder
+# reads (None for PCM, which needs no decoder) and the bytes a stream must start with
+ChunkCodec = namedtuple("ChunkCodec", "file dtype container magic")
+CHUNK_CODECS = {
+    "f32": ChunkCodec(SESSION_AUDIO_FILE, np.dtype("<f4"), None, b""),  # Raw float32 PCM
+    "s16": ChunkCodec("audio.s16", np.dtype("<i2"), None, b""),  # 16-bit PCM, half the size
+    "opus": ChunkCodec("audio.webm", np.dtype("u1"), "webm", b"\x1a\x45\xdf\xa3")  # WebM/Opus from MediaRecorder
+}
+DEFAULT_CODEC = "f32"
+# Chunks without a negotiated rate; encoded audio is decoded straight to the processing rate
+DEFAULT_SAMPLE_RATES = {"f32": 44100, "s16": PROCESSING_SAMPLE_RATE, "opus": PROCESSING_SAMPLE_RATE}
+MIN_STREAM_SAMPLE_RATE = 8000
+MAX_STREAM_SAMPLE_RATE = 48000
+
+# One fixed-size record per stored chunk, so chunk first_seq + i is record i. Offsets
+# and lengths count the codec's stored units: samples for PCM, bytes for encoded audio
+INDEX_RECORD = np.dtype([("seq", "<i8"), ("start", "<i8"), ("length", "<i8")])
+# Sequence number given to audio appended before chunks were sequenced
+UNSEQUENCED_SEQ = -1
+
+def assemble_chunk_files(chunk_files, dtype=SAMPLE_DTYPE):
+    """
+    Concatenate raw PCM chunk files into one preallocated array
+
+    File sizes are known up front, so each chunk is read straight into its
+    slot instead of regrowing the array for every chunk.
+
+    Args:
+        chunk_files: Ordered list of chunk file paths
+        dtype: Sample type of the raw data
+
+    Returns:
+        1D numpy array of all samples
+    """
+    itemsize = np.dtype(dtype).itemsize
+    sizes = [os.path.getsize(chunk_file) // itemsize for chunk_file in chunk_files]
+    combined = np.empty(sum(sizes), dtype=dtype)
+
+    offset = 0
+    for chunk_file, size in zip(chunk_files, sizes):
+        with open(chunk_file, 'rb') as f:
+            f.readinto(memoryview(combined[offset:offset + size]).cast('B'))
+        offset += size
+
+    return combined
+
+def pcm_to_float(samples):
+    """
+    Convert stored PCM samples to float32 audio in [-1, 1)
+
+    Args:
+        samples: 1D numpy array of float32 or int16 samples
+
+    Returns:
+        1D float32 numpy array (samples itself if already float32)
+    """
+    if samples.dtype.kind == "f":
+        return samples.astype(np.float32, copy=False)
+    # Division by a power of two is exact, so the int16 values survive a round trip
+    return samples.astype(np.float32) / np.float32(2 ** 15)
+
+class PcmDecoder:
+    """Turn PCM chunks into float32 audio, with the interface of StreamingDecoder"""
+
+    def __init__(self, dtype):
+        """
+        Args:
+            dtype: Sample type of the chunks
+        """
+        self.dtype = np.dtype(dtype)
+
+    def decode(self, data):
+        return pcm_to_float(np.frombuffer(data, dtype=self.dtype))
+
+    def finish(self):
+        return np.empty(0, dtype=np.float32)
+
+    def abort(self):
+        pass
+
+def chunk_decoder(stream_format):
+    """
+    Create a decoder for the chunks of a live session
+
+    Args:
+        stream_format: Dictionary with the session's codec and sampleRate
+
+    Returns:
+        Decoder whose decode(data) returns float32 audio at sampleRate
+    """
+    codec = CHUNK_CODECS[stream_format["codec"]]
+    if codec.container:
+        return StreamingDecoder(stream_format["sampleRate"], input_format=codec.container)
+    return PcmDecoder(codec.dtype)
+
+class SequenceGap(Exception):
+    """A chunk arrived ahead of one that is still missing"""
+
+    def __init__(self, session_id, expected, received):
+        super().__init__(f"Session {session_id} expected chunk {expected}, got {received}")
+        self.expected = expected
+        self.received = received
+
+class _SessionState:
+    """Sequence position and length of a session, with the lock serializing its appends"""
+
+    def __init__(self, stream_format=None, first_seq=None, next_seq=0, length=0):
+        self.format = stream_format
+        self.first_seq = first_seq
+        self.next_seq = next_seq
+        self.length = length
+        self.lock = threading.Lock()
+
+class SessionAudioStore:
+    """
+    Streaming session audio appended to a single file per session
+
+    Each session negotiates a chunk codec and sample rate when it starts,
+    and its chunks are stored as they arrive: float32 or int16 PCM, or the
+    compressed WebM/Opus stream a browser's MediaRecorder produces, which is
+    decoded only when the recording is read back. Appends cost O(chunk) and
+    float32 recordings are returned as a read-only memory map, so
+    assembling a session never copies the audio. Each chunk carries a
+    sequence number and gets a fixed-size record in the session's offset
+    index, so a resent chunk is recognized as a duplicate and a chunk that
+    skips ahead is refused until the missing one arrives. Appends to
+    different sessions never wait on each other.
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root: Directory holding one subdirectory per session
+        """
+        self.root = root
+        self._states = {}
+        self._states_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def session_dir(self, session_id):
+        """
+        Get the directory for a session
+
+        Args:
+            session_id: ID of the streaming session
+
+        Returns:
+            Path to the session directory
+
+        Raises:
+            ValueError: If the session ID could escape the store directory
+        """
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError(f"Invalid session ID: {session_id!r}")
+        return os.path.join(self.root, session_id)
+
+    def _read_format(self, session_id):
+        try:
+            with open(os.path.join(self.session_dir(session_id), SESSION_FORMAT_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def audio_path(self, session_id):
+        stream_format = self._read_format(session_id)
+        codec = stream_format["codec"] if stream_format else DEFAULT_CODEC
+        return os.path.join(self.session_dir(session_id), CHUNK_CODECS[codec].file)
+
+    def index_path(self, session_id):
+        return os.path.join(self.session_dir(session_id), SESSION_INDEX_FILE)
+
+    def exists(self, session_id):
+        session_dir = self.session_dir(session_id)
+        return (os.path.exists(os.path.join(session_dir, SESSION_FORMAT_FILE))
+                or os.path.exists(os.path.join(session_dir, SESSION_AUDIO_FILE))
+                or bool(self._legacy_chunk_files(session_id)))
+
+    def _legacy_chunk_files(self, session_id):
+        session_dir = self.session_dir(session_id)
+        if not os.path.isdir(session_dir):
+            return []
+        return sorted(
+            os.path.join(session_dir, f) for f in os.listdir(session_dir) if f.startswith(LEGACY_CHUNK_PREFIX)
+        )
+
+    def _load_state(self, session_id):
+        """
+        Read a session's format and position from disk
+
+        Audio is written before its index record, so anything past the last
+        complete record is from an interrupted append and is dropped.
+        """
+        session_dir = self.session_dir(session_id)
+        stream_format = self._read_format(session_id)
+        if stream_format is None:
+            if not os.path.exists(os.path.join(session_dir, SESSION_AUDIO_FILE)):
+                return _SessionState()
+            # Streamed before formats were negotiated
+            stream_format = {"codec": DEFAULT_CODEC, "sampleRate": DEFAULT_SAMPLE_RATES[DEFAULT_CODEC]}
+            self._write_format(session_id, stream_format)
+
+        itemsize = CHUNK_CODECS[stream_format["codec"]].dtype.itemsize
+        audio_path, index_path = self.audio_path(session_id), self.index_path(session_id)
+        audio_length = os.path.getsize(audio_path) // itemsize if os.path.exists(audio_path) else 0
+
+        if not os.path.exists(index_path):
+            # Recorded before chunks were sequenced, index it as one chunk
+            records = np.array([(UNSEQUENCED_SEQ, 0, audio_length)], dtype=INDEX_RECORD)[:1 if audio_length else 0]
+            with open(index_path, 'wb') as f:
+                f.write(records.tobytes())
+        else:
+            with open(index_path, 'rb') as f:
+                data = f.read()
+            records = np.frombuffer(data, dtype=INDEX_RECORD, count=len(data) // INDEX_RECORD.itemsize)
+            ends = records["start"] + records["length"]
+            records = records[:np.searchsorted(ends, audio_length, side="right")]
+            if records.nbytes != len(data):
+                with open(index_path, 'r+b') as f:
+                    f.truncate(records.nbytes)
+
+        if not len(records):
+            length = 0
+            state = _SessionState(stream_format)
+        else:
+            length = int(records[-1]["start"] + records[-1]["length"])
+            state = _SessionState(stream_format, int(records[0]["seq"]), int(records[-1]["seq"]) + 1, length)
+        if audio_length > length:
+            with open(audio_path, 'r+b') as f:
+                f.truncate(length * itemsize)
+        return state
+
+    def _write_format(self, session_id, stream_format):
+        session_dir = self.session_dir(session_id)
+        os.makedirs(session_dir, exist_ok=True)
+        path = os.path.join(session_dir, SESSION_FORMAT_FILE)
+        with open(path + ".tmp", 'w') as f:
+            json.dump(stream_format, f)
+        os.replace(path + ".tmp", path)
+
+    def _state(self, session_id):
+        with self._states_lock:
+            state = self._states.get(session_id)
+            if state is None:
+                state = self._states[session_id] = self._load_state(session_id)
+            return state
+
+    def _chunk_record(self, session_id, state, seq):
+        if state.first_seq is None or not state.first_seq <= seq < state.next_seq:
+            return None
+        with open(self.index_path(session_id), 'rb') as f:
+            f.seek((seq - state.first_seq) * INDEX_RECORD.itemsize)
+            return np.frombuffer(f.read(INDEX_RECORD.itemsize), dtype=INDEX_RECORD)[0]
+
+    def negotiate(self, session_id, codec=None, sample_rate=None):
+        """
+        Settle the chunk format of a session
+
+        The first call for a session fixes its format; later calls may leave
+        the codec and rate out, but must not ask for a different one.
+
+        Args:
+            session_id: ID of the streaming session
+            codec: Optional codec name from CHUNK_CODECS
+            sample_rate: Optional sample rate of PCM chunks, or the rate
+                encoded chunks are decoded to
+
+        Returns:
+            Dictionary with the session's codec and sampleRate
+
+        Raises:
+            ValueError: If the codec or rate is not supported, or differs
+                from the one the session started with
+        """
+        if codec is not None and codec not in CHUNK_CODECS:
+            raise ValueError(f"Unsupported chunk codec {codec!r}. Supported codecs: {', '.join(CHUNK_CODECS)}")
+        if sample_rate is not None:
+            sample_rate = int(sample_rate)
+            if not MIN_STREAM_SAMPLE_RATE <= sample_rate <= MAX_STREAM_SAMPLE_RATE:
+                raise ValueError(
+                    f"Sample rate must be between {MIN_STREAM_SAMPLE_RATE} and {MAX_STREAM_SAMPLE_RATE} Hz"
+                )
+
+        state = self._state(session_id)
+        with state.lock:
+            if state.format is None:
+                codec = codec or DEFAULT_CODEC
+                stream_format = {"codec": codec, "sampleRate": sample_rate or DEFAULT_SAMPLE_RATES[codec]}
+                self._write_format(session_id, stream_format)
+                state.format = stream_format
+            elif codec not in (None, state.format["codec"]) or sample_rate not in (None, state.format["sampleRate"]):
+                raise ValueError(
+                    f"Session {session_id} streams {state.format['codec']} at {state.format['sampleRate']} Hz"
+                )
+            return dict(state.format)
+
+    def stream_format(self, session_id):
+        """Codec and sampleRate of a session, or None before its first chunk"""
+        stream_format = self._state(session_id).format
+        if stream_format is None and self._legacy_chunk_files(session_id):
+            stream_format = {"codec": DEFAULT_CODEC, "sampleRate": DEFAULT_SAMPLE_RATES[DEFAULT_CODEC]}
+        return dict(stream_format) if stream_format else None
+
+    def next_seq(self, session_id):
+        """Sequence number the session expects next"""
+        return self._state(session_id).next_seq
+
+    def append(self, session_id, data):
+        """
+        Append a chunk to a session as its next chunk
+
+        Args:
+            session_id: ID of the streaming session
+            data: Chunk bytes in the session's codec
+
+        Returns:
+            Total length of the session in stored units (samples for PCM)
+
+        Raises:
+            ValueError: If the data is not a whole number of samples
+        """
+        return self.append_chunk(session_id, data)["length"]
+
+    def append_chunk(self, session_id, data, seq=None):
+        """
+        Append a sequenced chunk to a session
+
+        A chunk that is already stored is acknowledged without writing it
+        again, so clients can resend anything that was not acknowledged.
+        Sessions that were never negotiated take float32 PCM.
+
+        Args:
+            session_id: ID of the streaming session
+            data: Chunk bytes in the session's codec
+            seq: Sequence number of the chunk, or None for the next one
+
+        Returns:
+            Dictionary of the chunk's seq, the session's nextSeq and total
+            length, and whether the chunk was a duplicate
+
+        Raises:
+            SequenceGap: If chunks before seq are missing, including a
+                session whose first chunk is not chunk 0
+            ValueError: If the data is not a whole number of samples, or a
+                duplicate differs in length from the stored chunk
+        """
+        state, length = self._validate(session_id, data, seq)
+        with state.lock:
+            if self._is_stored(session_id, state, seq, length):
+                return {"seq": seq, "nextSeq": state.next_seq, "length": state.length, "duplicate": True}
+            if seq is None:
+                seq = state.next_seq
+
+            record = np.array([(seq, state.length, length)], dtype=INDEX_RECORD)
+            # The index exists before any audio, so audio without a record is never taken for unsequenced audio
+            with open(self.index_path(session_id), 'ab') as index_file:
+                with open(self.audio_path(session_id), 'ab') as f:
+                    f.write(data)
+                index_file.write(record.tobytes())
+
+            if state.first_seq is None:
+                state.first_seq = seq
+            state.next_seq = seq + 1
+            state.length += length
+            return {"seq": seq, "nextSeq": state.next_seq, "length": state.length, "duplicate": False}
+
+    def _validate(self, session_id, data, seq):
+        if seq is not None and seq < 0:
+            raise ValueError(f"Invalid chunk sequence number: {seq}")
+
+        codec = CHUNK_CODECS[self.negotiate(session_id)["codec"]]
+        itemsize = codec.dtype.itemsize
+        if len(data) % itemsize:
+            raise ValueError(f"Chunk size {len(data)} is not a multiple of {itemsize} bytes")
+        state = self._state(session_id)
+        # The decoder only notices a bad stream some chunks later, the header can be checked now
+        if state.length == 0 and seq in (None, state.next_seq) and not data.startswith(codec.magic):
+            raise ValueError(f"Stream does not start with a {codec.container} header")
+        return state, len(data) // itemsize
+
+    def _is_stored(self, session_id, state, seq, length):
+        if seq is None or seq == state.next_seq:
+            return False
+        # A session starts at chunk 0, so anything later than the next chunk leaves a gap
+        if seq > state.next_seq:
+            raise SequenceGap(session_id, state.next_seq, seq)
+        stored = self._chunk_record(session_id, state, seq)
+        if stored is None:
+            raise ValueError(f"Chunk {seq} of session {session_id} precedes its first stored chunk")
+        if stored["length"] != length:
+            raise ValueError(f"Chunk {seq} of session {session_id} was stored with a different length")
+        return True
+
+    def check_chunk(self, session_id, data, seq=None):
+        """
+        Check a chunk before it is appended, without storing it
+
+        Lets a caller that serializes a session's chunks act on a chunk
+        (e.g. decode it) before append_chunk() stores it.
+
+        Args:
+            session_id: ID of the streaming session
+            data: Chunk bytes in the session's codec
+            seq: Sequence number of the chunk, or None for the next one
+
+        Returns:
+            True if the chunk is already stored
+
+        Raises:
+            SequenceGap: If chunks before seq are missing
+            ValueError: If append_chunk() would refuse the chunk
+        """
+        state, length = self._validate(session_id, data, seq)
+        with state.lock:
+            return self._is_stored(session_id, state, seq, length)
+
+    def load_chunk(self, session_id, seq):
+        """
+        Read one stored chunk through the offset index
+
+        Args:
+            session_id: ID of the streaming session
+            seq: Sequence number of the chunk
+
+        Returns:
+            1D array of the chunk as stored (samples for PCM, bytes for
+            encoded audio), or None if it is not stored
+        """
+        state = self._state(session_id)
+        with state.lock:
+            record = self._chunk_record(session_id, state, seq)
+        if record is None:
+            return None
+
+        dtype = CHUNK_CODECS[state.format["codec"]].dtype
+        with open(self.audio_path(session_id), 'rb') as f:
+            f.seek(int(record["start"]) * dtype.itemsize)
+            return np.frombuffer(f.read(int(record["length"]) * dtype.itemsize), dtype=dtype)
+
+    def _stored_bytes(self, state):
+        return state.length * CHUNK_CODECS[state.format["codec"]].dtype.itemsize if state.format else 0
+
+    def read_stored(self, session_id):
+        """
+        Read a session's stored chunks back as one byte string
+
+        Args:
+            session_id: ID of the streaming session
+
+        Returns:
+            Bytes in the session's codec, as they were received
+        """
+        state = self._state(session_id)
+        size = self._stored_bytes(state)
+        if size == 0:
+            return b""
+        with open(self.audio_path(session_id), 'rb') as f:
+            return f.read(size)
+
+    def digest(self, session_id):
+        """SHA-256 hex digest of a session's stored chunks"""
+        state = self._state(session_id)
+        if state.format is None:
+            files = [(path, os.path.getsize(path)) for path in self._legacy_chunk_files(session_id)]
+        else:
+            files = [(self.audio_path(session_id), self._stored_bytes(state))]
+
+        digest = hashlib.sha256()
+        for path, size in files:
+            if not size:
+                continue
+            with open(path, 'rb') as f:
+                while size > 0:
+                    block = f.read(min(DECODER_READ_BYTES, size))
+                    digest.update(block)
+                    size -= len(block)
+        return digest.hexdigest()
+
+    def num_samples(self, session_id):
+        """Samples stored for a PCM session, None for encoded audio which has to be decoded first"""
+        if self.stream_format(session_id) is not None:
+            state = self._state(session_id)
+            return None if CHUNK_CODECS[state.format["codec"]].container else state.length
+        size = sum(os.path.getsize(chunk_file) for chunk_file in self._legacy_chunk_files(session_id))
+        return size // np.dtype(SAMPLE_DTYPE).itemsize
+
+    def stats(self, session_id):
+        """
+        Summarize what is stored for a session
+
+        Args:
+            session_id: ID of the streaming session
+
+        Returns:
+            Dictionary of codec, sampleRate, chunks and storedBytes
+        """
+        state = self._state(session_id)
+        stream_format = state.format or {"codec": None, "sampleRate": None}
+        chunks = state.next_seq - state.first_seq if state.first_seq is not None else 0
+        return {**stream_format, "chunks": chunks, "storedBytes": self._stored_bytes(state)}
+
+    def load(self, session_id):
+        """
+        Get a session's audio as float32 samples
+
+        float32 sessions are mapped into memory, int16 sessions are
+        converted and encoded sessions are decoded. Sessions recorded as
+        separate chunk files are assembled into one array instead.
+
+        Args:
+            session_id: ID of the streaming session
+
+        Returns:
+            1D float32 array at the session's sample rate (read-only memory
+            map for float32 sessions, empty array if no audio)
+        """
+        # Settles any interrupted append before the file is read
+        state = self._state(session_id)
+        if state.format is None:
+            chunk_files = self._legacy_chunk_files(session_id)
+            if chunk_files:
+                return assemble_chunk_files(chunk_files)
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+
+        if state.length == 0:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        codec = CHUNK_CODECS[state.format["codec"]]
+        path = self.audio_path(session_id)
+        if codec.container:
+            audio, _ = decode_file(
+                path, state.format["sampleRate"], partial(StreamingDecoder, input_format=codec.container)
+            )
+            return audio
+        return pcm_to_float(np.memmap(path, dtype=codec.dtype, mode='r', shape=(state.length,)))
+
+    def delete(self, session_id):
+        """
+        Remove a session and its audio
+
+        Args:
+            session_id: ID of the streaming session
+        """
+        session_dir = self.session_dir(session_id)
+        with self._states_lock:
+            self._states.pop(session_id, None)
+        shutil.rmtree(session_dir, ignore_errors=True)
+
+    def _last_write(self, session_dir):
+        with os.scandir(session_dir) as entries:
+            return max((entry.stat().st_mtime for entry in entries), default=os.stat(session_dir).st_mtime)
+
+    def expire_idle(self, idle_seconds, keep=()):
+        """
+        Remove sessions that have not been written to for a while
+
+        Streamed audio is PHI, so sessions abandoned without being completed
+        are not left on disk, nor their state in memory.
+
+        Args:
+            idle_seconds: Seconds since a session's last write before it is removed
+            keep: IDs of sessions to keep regardless, e.g. ones still streaming
+
+        Returns:
+            List of the removed session IDs
+        """
+        cutoff = time.time() - idle_seconds
+        expired = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_dir() and SESSION_ID_PATTERN.match(entry.name) and entry.name not in keep:
+                    if self._last_write(entry.path) < cutoff:
+                        expired.append(entry.name)
+        for session_id in expired:
+            logger.info(f"Removing audio of idle streaming session {session_id}")
+            self.delete(session_id)
+
+        # States looked up for sessions that never stored anything
+        with self._states_lock:
+            for session_id in list(self._states):
+                if session_id not in keep and not os.path.isdir(os.path.join(self.root, session_id)):
+                    del self._states[session_id]
+        return expired
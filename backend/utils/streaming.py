@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+import os
+import time
+import asyncio
+import logging
+import numpy as np
+from functools import partial
+from utils.audio_processing import (
+    prepare_for_whisper, speech_regions, BlockNoiseReducer, speech_filter_bank, PROCESSING_SAMPLE_RATE, VAD_ENABLED
+)
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+STREAM_SAMPLE_RATE = 44100  # Rate of raw float32 PCM chunks from clients that don't negotiate a format
+STREAM_WINDOW_SECONDS = float(os.environ.get("STREAM_WINDOW_SECONDS", 30))  # Whisper decodes 30 s at a time
+STREAM_CUT_SEARCH_SECONDS = 3.0  # How far back from the window end to look for a pause to cut at
+STREAM_SESSION_IDLE_SECONDS = 3600  # Sessions with no chunks for this long are dropped
+STREAM_SWEEP_SECONDS = 10  # Least time between scans for idle sessions
+
+def find_quiet_cut(audio_data, sample_rate, search_seconds=STREAM_CUT_SEARCH_SECONDS, frame_seconds=0.02):
+    """
+    Find the quietest point near the end of a window so words aren't split
+
+    Args:
+        audio_data: 1D numpy array of audio data
+        sample_rate: sampling rate of audio data
+        search_seconds: length of the tail to search
+        frame_seconds: length of the frames compared
+
+    Returns:
+        Sample index to cut the window at
+    """
+    frame = max(1, int(frame_seconds * sample_rate))
+    search_start = max(0, len(audio_data) - int(search_seconds * sample_rate))
+    tail = audio_data[search_start:]
+    frames = len(tail) // frame
+    if frames < 2:
+        return len(audio_data)
+
+    energy = np.square(tail[:frames * frame].reshape(frames, frame)).mean(axis=1)
+    return search_start + int(np.argmin(energy)) * frame + frame // 2
+
+class StreamingSession:
+    """
+    Incremental transcription state for one live recording
+
+    Chunks are buffered until a full window is available. Each window is cut
+    at a pause, denoised and transcribed in the background, so completing the
+    session only has to transcribe the final partial window. Chunks in other
+    formats than float32 PCM are turned into audio by the session's decoder.
+    """
+
+    def __init__(self, session_id, transcribe, sample_rate=STREAM_SAMPLE_RATE, window_seconds=STREAM_WINDOW_SECONDS,
+                 decoder_factory=None):
+        """
+        Args:
+            session_id: ID of the streaming session
+            transcribe: Async callable taking (16 kHz audio, prompt text) and returning text
+            sample_rate: sampling rate of incoming chunks, after decoding
+            window_seconds: length of audio transcribed at a time
+            decoder_factory: Optional callable returning a decoder with decode(data),
+                finish() and abort(), for chunks that are not raw float32 PCM
+        """
+        self.session_id = session_id
+        self.sample_rate = sample_rate
+        self.window_samples = int(window_seconds * sample_rate)
+        self.segments = []
+        self.finished = False
+        self.received_bytes = 0
+        self.received_samples = 0
+        self.processed_samples = 0
+        self.speech_samples = 0
+        self.last_activity = time.monotonic()
+        self._transcribe = transcribe
+        self._buffer = []
+        self._buffered_samples = 0
+        self._lock = asyncio.Lock()
+        self._changed = asyncio.Condition()
+        self._task = None
+        self.decoder = decoder_factory() if decoder_factory else None
+        # Held by callers across storing and decoding a chunk, so chunks reach the decoder in order
+        self.receive_lock = asyncio.Lock()
+        # Windows are cut at pauses, so only the noise profile carries across them
+        self._noise_reducer = BlockNoiseReducer(PROCESSING_SAMPLE_RATE, stationary=True)
+        # Windows are contiguous, so the bandpass state carries over without edge transients
+        self._band_filter = speech_filter_bank.stream(PROCESSING_SAMPLE_RATE)
+
+    @property
+    def transcript(self):
+        """Text transcribed so far"""
+        return " ".join(segment["text"] for segment in self.segments if segment["text"])
+
+    def add_chunk(self, chunk):
+        """
+        Buffer a chunk of audio and start transcribing if a window is ready
+
+        Args:
+            chunk: 1D float32 numpy array of audio data
+        """
+        if self.finished:
+            raise RuntimeError(f"Session {self.session_id} is already complete")
+
+        self._buffer.append(chunk)
+        self._buffered_samples += len(chunk)
+        self.received_samples += len(chunk)
+        self.last_activity = time.monotonic()
+
+        if self._buffered_samples >= self.window_samples and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._process_ready_windows())
+
+    async def receive(self, data):
+        """
+        Decode a chunk as received and buffer its audio
+
+        Args:
+            data: Chunk bytes, raw float32 PCM if the session has no decoder
+        """
+        if self.finished:
+            raise RuntimeError(f"Session {self.session_id} is already complete")
+
+        self.received_bytes += len(data)
+        if self.decoder is None:
+            audio = np.frombuffer(data, dtype=np.float32)
+        else:
+            # Feeding an external decoder can block, keep it off the event loop
+            audio = await asyncio.get_running_loop().run_in_executor(None, self.decoder.decode, data)
+        if len(audio):
+            self.add_chunk(audio)
+
+    def _take_window(self, final=False):
+        audio = np.concatenate(self._buffer) if len(self._buffer) > 1 else self._buffer[0]
+        if final:
+            cut = len(audio)
+        else:
+            cut = find_quiet_cut(audio[:self.window_samples], self.sample_rate)
+
+        remainder = audio[cut:]
+        self._buffer = [remainder] if len(remainder) else []
+        self._buffered_samples = len(remainder)
+        return audio[:cut]
+
+    async def _transcribe_window(self, window):
+        start = self.processed_samples / self.sample_rate
+        loop = asyncio.get_running_loop()
+
+        # Whisper pads every window to 30 s, so only windows with no speech at all save decode time
+        speech_samples = len(window)
+        if VAD_ENABLED:
+            regions = await loop.run_in_executor(None, speech_regions, window, self.sample_rate)
+            speech_samples = sum(end - region_start for region_start, end in regions)
+
+        text = ""
+        if speech_samples:
+            prepared = await loop.run_in_executor(
+                None, partial(
+                    prepare_for_whisper, window, self.sample_rate,
+                    noise_reducer=self._noise_reducer, band_filter=self._band_filter
+                )
+            )
+
+            # The previous text keeps Whisper consistent across window boundaries
+            text = (await self._transcribe(prepared, self.transcript[-200:])).strip()
+
+        self.processed_samples += len(window)
+        self.speech_samples += speech_samples
+        self.segments.append({
+            "start": start,
+            "end": self.processed_samples / self.sample_rate,
+            "text": text
+        })
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _run_window(self, final=False):
+        window = self._take_window(final)
+        try:
+            await self._transcribe_window(window)
+        except Exception:
+            # Put the audio back so a later attempt can transcribe it
+            self._buffer.insert(0, window)
+            self._buffered_samples += len(window)
+            raise
+
+    async def _process_ready_windows(self):
+        try:
+            async with self._lock:
+                while self._buffered_samples >= self.window_samples:
+                    await self._run_window()
+        except Exception as e:
+            # finalize() retries whatever is still buffered
+            logger.error(f"Streaming transcription error in session {self.session_id}: {str(e)}")
+
+    async def finalize(self):
+        """
+        Transcribe any remaining audio and close the session
+
+        Returns:
+            Full transcript text
+        """
+        async with self._lock:
+            if self.decoder is not None:
+                # Audio the decoder was still holding back
+                tail = await asyncio.get_running_loop().run_in_executor(None, self.decoder.finish)
+                self.decoder = None
+                if len(tail):
+                    self.add_chunk(tail)
+            while self._buffered_samples >= self.window_samples:
+                await self._run_window()
+            if self._buffered_samples:
+                await self._run_window(final=True)
+            self.finished = True
+
+        async with self._changed:
+            self._changed.notify_all()
+        return self.transcript
+
+    async def wait_for_segments(self, known, timeout=None):
+        """
+        Wait until more than `known` segments exist or the session finishes
+
+        Args:
+            known: Number of segments the caller has already seen
+            timeout: Optional timeout in seconds
+
+        Returns:
+            List of new segments
+        """
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: len(self.segments) > known or self.finished),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                pass
+        return self.segments[known:]
+
+    def close(self):
+        """Stop the session's decoder, for sessions dropped without being finalized"""
+        if self.decoder is not None:
+            self.decoder.abort()
+            self.decoder = None
+
+    def speech_stats(self):
+        """
+        Summarize how much of the transcribed audio was speech
+
+        Returns:
+            Dictionary of speech statistics
+        """
+        return {
+            "speechSeconds": self.speech_samples / self.sample_rate,
+            "totalSeconds": self.processed_samples / self.sample_rate,
+            "speechRatio": self.speech_samples / self.processed_samples if self.processed_samples else 0.0
+        }
+
+    def status(self):
+        """
+        Summarize the session's progress
+
+        Returns:
+            Dictionary of transcription progress
+        """
+        return {
+            "receivedSeconds": self.received_samples / self.sample_rate,
+            "transcribedSeconds": self.processed_samples / self.sample_rate,
+            "partialTranscript": self.transcript,
+            "segments": len(self.segments),
+            "finished": self.finished
+        }
+
+class StreamingSessionManager:
+    """Registry of live streaming sessions"""
+
+    def __init__(self, transcribe, idle_seconds=STREAM_SESSION_IDLE_SECONDS, on_sweep=None, **session_options):
+        """
+        Args:
+            transcribe: Async callable shared by all sessions, see StreamingSession
+            idle_seconds: Seconds without chunks before a session is dropped
+            on_sweep: Callable taking idle_seconds and the set of live session
+                IDs, run after each scan for idle sessions, e.g. to remove
+                their stored audio
+            **session_options: Extra keyword arguments for StreamingSession
+        """
+        self._transcribe = transcribe
+        self.idle_seconds = idle_seconds
+        self._on_sweep = on_sweep
+        self._session_options = session_options
+        self._sessions = {}
+        self._last_sweep = time.monotonic()
+
+    def get(self, session_id):
+        return self._sessions.get(session_id)
+
+    def get_or_create(self, session_id, **options):
+        """
+        Get a live session, creating it on the first chunk
+
+        Args:
+            session_id: ID of the streaming session
+            **options: Keyword arguments for StreamingSession, used only if it is created
+
+        Returns:
+            StreamingSession
+        """
+        self.expire_idle()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = StreamingSession(session_id, self._transcribe, **{**self._session_options, **options})
+            self._sessions[session_id] = session
+        return session
+
+    def pop(self, session_id):
+        return self._sessions.pop(session_id, None)
+
+    def expire_idle(self, force=False):
+        """
+        Drop sessions that stopped receiving chunks without being completed
+
+        Called for every chunk, so the sessions are only scanned every
+        STREAM_SWEEP_SECONDS unless forced.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_sweep < STREAM_SWEEP_SECONDS:
+            return
+        self._last_sweep = now
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_activity > self.idle_seconds:
+                logger.info(f"Dropping idle streaming session {session_id}")
+                del self._sessions[session_id]
+                session.close()
+        if self._on_sweep is not None:
+            self._on_sweep(self.idle_seconds, set(self._sessions))
+
+    def buffered_seconds(self):
+        """Audio received by live sessions and not yet transcribed, in seconds"""
+        return sum(session._buffered_samples / session.sample_rate for session in self._sessions.values())
+
+    def __len__(self):
+        return len(self._sessions)
@@ -1,118 +1,485 @@
 #!/usr/bin/env python3
+import os
 import re
-import spacy
-from transformers import pipeline
+import json
+import time
+import queue
+import threading
 import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from utils.models import model_registry
+from utils.metrics import metrics, timed
+from utils.audit import configure_logging
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Try to load medical-specific NLP model, fallback to standard model
-try:
-    nlp = spacy.load("en_core_med_sm")  # This would be a medical-specific model
-    logger.info("Loaded medical NLP model")
-except:
-    nlp = spacy.load("en_core_web_sm")
-    logger.info("Loaded standard NLP model (fallback)")
-
-# In a real implementation, would use a fine-tuned medical summarization model
-# In a real implementation, would use a fine-tuned medical summarization model
-try:
-    # Check if we have internet connection first
-    import requests
-    response = requests.head("https://huggingface.co", timeout=5)
-    
-    # Only try to load medical model if we have connection
-    if response.status_code == 200:
-        summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-6-6")
-        logger.info("Loaded medical summarization model")
-    else:
-        raise ConnectionError("Connection error")
-except Exception as e:
-    logger.warning(f"Could not load online model: {str(e)}")
-    
-    # Create a simple extractive summarizer as fallback
-    logger.info("Using simple extractive summarization as fallback")
-    
-    # Define a simple extractive summarizer function that will be used instead
-    class SimpleExtractiveSum:
-        def __call__(self, text, **kwargs):
-            # Extract first few sentences as simple summary (up to max_length words)
-            max_length = kwargs.get('max_length', 100)
-            sentences = text.split('.')
-            summary = '.'.join(sentences[:5]) + '.'
-            # Limit to max length words
-            words = summary.split()
-            if len(words) > max_length:
-                summary = ' '.join(words[:max_length])
-            return [{'summary_text': summary}]
-    
-    summarizer = SimpleExtractiveSum()
-
-def preprocess_transcript(text):
+# spaCy components each profile leaves out; the summary only needs entities and sentences
+NLP_PROFILES = {
+    "full": {"exclude": [], "sentences": None},
+    "fast": {"exclude": ["tagger", "parser", "lemmatizer", "attribute_ruler"], "sentences": "senter"},
+    "minimal": {"exclude": ["tagger", "parser", "lemmatizer", "attribute_ruler", "senter"], "sentences": "sentencizer"},
+}
+NLP_PROFILE = os.environ.get("NLP_PROFILE", "fast")
+
+def load_nlp_pipeline(name, profile=NLP_PROFILE):
     """
-    Preprocess transcript text for better summarization
+    Load a spaCy pipeline with only the components a profile needs
+    
+    The "fast" profile swaps the dependency parser for the statistical
+    sentence recognizer, "minimal" uses rule-based sentence splitting.
     
     Args:
-        text: Transcript text
+        name: Name or path of the spaCy pipeline
+        profile: One of NLP_PROFILES
         
     Returns:
-        Preprocessed text
+        spaCy Language object
+    """
+    import spacy
+    
+    if profile not in NLP_PROFILES:
+        raise ValueError(f"Unknown NLP profile: {profile}")
+    settings = NLP_PROFILES[profile]
+    
+    nlp = spacy.load(name, exclude=settings["exclude"])
+    if settings["sentences"] == "senter" and "senter" in nlp.disabled:
+        nlp.enable_pipe("senter")
+    if "senter" not in nlp.pipe_names and "parser" not in nlp.pipe_names and "sentencizer" not in nlp.pipe_names:
+        # No statistical sentence boundaries left, split on punctuation
+        nlp.add_pipe("sentencizer", first=True)
+    return nlp
+
+def load_nlp():
+    """Load the medical NLP model, falling back to the standard model"""
+    try:
+        nlp = load_nlp_pipeline("en_core_med_sm")  # This would be a medical-specific model
+        logger.info(f"Loaded medical NLP model ({NLP_PROFILE} profile)")
+    except OSError:
+        nlp = load_nlp_pipeline("en_core_web_sm")
+        logger.info(f"Loaded standard NLP model (fallback, {NLP_PROFILE} profile)")
+    return nlp
+
+# Summarizer model resolution, never touches the network unless downloads are allowed
+SUMMARIZER_MODEL = os.environ.get("SUMMARIZER_MODEL", "sshleifer/distilbart-cnn-6-6")
+# Commit hash of the model on the Hub. Unset, the copy already in the model directory or cache is used
+# and nothing is downloaded, since a branch such as "main" can change under a running deployment
+SUMMARIZER_REVISION = os.environ.get("SUMMARIZER_REVISION")
+COMMIT_HASH_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+SUMMARIZER_MODEL_DIR = os.environ.get(
+    "SUMMARIZER_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "summarizer")
+)
+SUMMARIZER_ALLOW_DOWNLOAD = os.environ.get("SUMMARIZER_ALLOW_DOWNLOAD", "").lower() in ("1", "true", "yes")
+
+# Long transcripts are summarized chunk by chunk, then the summaries are summarized
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", 900))  # DistilBART reads at most 1024 tokens
+SUMMARY_BATCH_SIZE = int(os.environ.get("SUMMARY_BATCH_SIZE", 4))  # Chunks summarized per model call
+SUMMARY_CHUNK_MAX_LENGTH = 150  # Token limit of each intermediate chunk summary
+SUMMARY_MIN_WORDS = 20  # Shorter texts are returned as they are, there is nothing to condense
+NO_SPEECH_SUMMARY = "No speech detected in the recording."
+
+SUMMARIZER_BACKEND = metrics.gauge(
+    "summarizer_backend", "Summarizer in use, always 1", ["backend", "model", "revision"]
+)
+
+# Documents from concurrent requests are collected into batches for NER and summarization
+NLP_BATCH_WINDOW_MS = float(os.environ.get("NLP_BATCH_WINDOW_MS", 50))  # How long a batch waits for more documents
+NLP_MAX_BATCH = int(os.environ.get("NLP_MAX_BATCH", 8))  # Largest batch run at once
+NLP_BATCHING = os.environ.get("NLP_BATCHING", "true").lower() in ("1", "true", "yes")
+NLP_BATCH_TIMEOUT = float(os.environ.get("NLP_BATCH_TIMEOUT", 300))  # Longest a caller waits for its batched results
+
+class SimpleExtractiveSum:
+    """Fallback summarizer that keeps the first few sentences"""
+    
+    info = {"backend": "extractive", "model": None, "revision": None, "source": None}
+    max_input_tokens = SUMMARY_CHUNK_TOKENS
+    
+    def count_tokens(self, text):
+        return len(text.split())
+    
+    def __call__(self, text, **kwargs):
+        if isinstance(text, list):
+            return [self(item, **kwargs)[0] for item in text]
+        
+        # Extract first few sentences as simple summary (up to max_length words)
+        max_length = kwargs.get('max_length', 100)
+        sentences = text.split('.')
+        summary = '.'.join(sentences[:5]) + '.'
+        # Limit to max length words
+        words = summary.split()
+        if len(words) > max_length:
+            summary = ' '.join(words[:max_length])
+        return [{'summary_text': summary}]
+
+class TransformersSummarizer:
+    """Summarization pipeline together with where its model was resolved from"""
+    
+    def __init__(self, pipeline, model, revision, source):
+        self.pipeline = pipeline
+        self.info = {"backend": "transformers", "model": model, "revision": revision, "source": source}
+        # Leave room for special tokens within the model's input limit
+        self.max_input_tokens = min(SUMMARY_CHUNK_TOKENS, pipeline.tokenizer.model_max_length - 16)
+    
+    def count_tokens(self, text):
+        return len(self.pipeline.tokenizer.tokenize(text))
+    
+    def __call__(self, text, **kwargs):
+        return self.pipeline(text, truncation=True, **kwargs)
+
+def summarizer_model_sources(model_name=SUMMARIZER_MODEL, revision=SUMMARIZER_REVISION,
+                             model_dir=SUMMARIZER_MODEL_DIR, allow_download=SUMMARIZER_ALLOW_DOWNLOAD):
     """
-    # Remove filler words
-    fillers = ["um", "uh", "like", "you know", "sort of", "kind of", "I mean"]
-    for filler in fillers:
-        text = re.sub(r'\b' + filler + r'\b', '', text, flags=re.IGNORECASE)
+    List the places the summarization model may be loaded from, in order
     
-    # Fix multiple spaces
-    text = re.sub(r'\s+', ' ', text)
+    A model directory (e.g. from `huggingface-cli download --local-dir`) is
+    preferred, then the local Hugging Face cache at the pinned revision, and
+    only then a download if explicitly allowed and the revision is a commit
+    hash.
     
-    # Fix punctuation
-    text = re.sub(r'\s+([.,;:!?])', r'\1', text)
+    Args:
+        model_name: Hugging Face model ID
+        revision: Commit hash of the model, or None for whichever copy is cached
+        model_dir: Directory holding a saved copy of the model
+        allow_download: Fall back to downloading from the Hub
+        
+    Returns:
+        List of (source name, from_pretrained keyword arguments)
+    """
+    sources = []
+    if model_dir and os.path.exists(os.path.join(model_dir, "config.json")):
+        sources.append(("local_dir", {"pretrained_model_name_or_path": model_dir, "local_files_only": True}))
+    
+    sources.append(("cache", {"pretrained_model_name_or_path": model_name, "revision": revision, "local_files_only": True}))
+    
+    if allow_download:
+        if revision and COMMIT_HASH_PATTERN.match(revision):
+            sources.append(("download", {"pretrained_model_name_or_path": model_name, "revision": revision}))
+        else:
+            logger.warning(f"Not downloading {model_name}: revision {revision!r} is not a commit hash")
+    return sources
+
+def load_summarizer():
+    """Load the summarization model, falling back to extractive summarization"""
+    # In a real implementation, would use a fine-tuned medical summarization model
+    try:
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline
+        
+        for source, kwargs in summarizer_model_sources():
+            try:
+                tokenizer = AutoTokenizer.from_pretrained(**kwargs)
+                model = AutoModelForSeq2SeqLM.from_pretrained(**kwargs)
+            except OSError as e:
+                logger.info(f"Summarization model not available from {source}: {str(e)}")
+                continue
+            
+            summarizer = pipeline("summarization", model=model, tokenizer=tokenizer)
+            # The commit actually loaded, also when the revision was left to the cache
+            revision = getattr(model.config, "_commit_hash", None) or SUMMARIZER_REVISION
+            logger.info(f"Loaded summarization model {SUMMARIZER_MODEL}@{revision} from {source}")
+            return _report_backend(TransformersSummarizer(summarizer, SUMMARIZER_MODEL, revision, source))
+        
+        raise FileNotFoundError(
+            f"{SUMMARIZER_MODEL}@{SUMMARIZER_REVISION} is not in {SUMMARIZER_MODEL_DIR} or the local cache "
+            f"and SUMMARIZER_ALLOW_DOWNLOAD is off"
+        )
+    except Exception as e:
+        logger.warning(f"Could not load summarization model: {str(e)}")
+        
+        # Create a simple extractive summarizer as fallback
+        logger.warning("Using simple extractive summarization as fallback")
+        return _report_backend(SimpleExtractiveSum())
+
+def _report_backend(summarizer):
+    info = summarizer.info
+    SUMMARIZER_BACKEND.set(1, backend=info["backend"], model=info["model"] or "", revision=info["revision"] or "")
+    return summarizer
+
+def summarizer_info():
+    """
+    Describe the active summarizer backend without forcing it to load
+    
+    Returns:
+        Dictionary with backend, model, revision and source, or None if the
+        summarizer has not loaded yet
+    """
+    if model_registry.status()["summarizer"]["state"] != "ready":
+        return None
+    return model_registry.get("summarizer").info
+
+# Models load on first use or during the API's background warm-up
+model_registry.register("nlp", load_nlp)
+model_registry.register("summarizer", load_summarizer)
+
+# Words dropped from transcripts before summarization, overridable per clinic or specialty
+DEFAULT_FILLERS = ["um", "uh", "like", "you know", "sort of", "kind of", "I mean"]
+TRANSCRIPT_LEXICON = os.environ.get("TRANSCRIPT_LEXICON")  # JSON file with "fillers" and "replacements"
+
+def _trie_pattern(words):
+    """
+    Build a regex alternation that shares common prefixes
+
+    A flat alternation tries every word at every position, the trie only
+    follows branches that match, so hundreds of entries cost about the same
+    as a handful.
+
+    Args:
+        words: Words or phrases to match (matched case-insensitively)
+
+    Returns:
+        Regex source string
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word.lower():
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            # A shorter word ends here, longer matches are tried first
+            return "(?:" + pattern + ")?"
+        return pattern
+
+    return build(trie)
+
+class TranscriptPreprocessor:
+    """
+    Single-pass transcript cleanup
+
+    Filler removal, term replacement, whitespace collapsing and spacing
+    before punctuation are done by one compiled pattern in one pass over the
+    text. Runs of whitespace and fillers are matched together and replaced
+    by a single space, or by nothing at the start or end of the text or
+    before punctuation. Only runs that change are matched, so ordinary
+    text between them is copied without calling back into Python.
+    """
+
+    PUNCTUATION = ".,;:!?"
+
+    def __init__(self, fillers=DEFAULT_FILLERS, replacements=None):
+        """
+        Args:
+            fillers: Words and phrases to remove
+            replacements: Optional dictionary of words or phrases to their normalized form
+        """
+        self.fillers = list(fillers)
+        self.replacements = {key.lower(): value for key, value in (replacements or {}).items()}
+
+        # Single spaces between words are left alone so they never reach Python
+        gap = r"\A\s+|\s+(?=[.,;:!?]|\Z)|\s\s+|[^\S ]"
+        if self.fillers:
+            gap = r"(?:\s*\b" + _trie_pattern(self.fillers) + r"\b)+\s*|" + gap
+        pattern = "(?P<gap>" + gap + ")"
+        if self.replacements:
+            pattern += r"|\b(?P<term>" + _trie_pattern(self.replacements) + r")\b"
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load a lexicon from a JSON file
+
+        Args:
+            path: File with optional "fillers" list and "replacements" object
+
+        Returns:
+            TranscriptPreprocessor
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            lexicon = json.load(f)
+        return cls(lexicon.get("fillers", DEFAULT_FILLERS), lexicon.get("replacements"))
+
+    def _replace(self, match):
+        term = match.group("term") if self.replacements else None
+        if term is not None:
+            return self.replacements[term.lower()]
+
+        text = match.string
+        end = match.end()
+        if match.start() == 0 or end == len(text) or text[end] in self.PUNCTUATION:
+            return ""
+        # A filler glued to other text ("well,um,yes") leaves no space behind
+        return " " if any(char.isspace() for char in match.group("gap")) else ""
+
+    def __call__(self, text):
+        return self.pattern.sub(self._replace, text)
+
+def load_transcript_preprocessor(path=TRANSCRIPT_LEXICON):
+    """Build the preprocessor from the configured lexicon, or the default fillers"""
+    if path:
+        preprocessor = TranscriptPreprocessor.from_file(path)
+        logger.info(f"Loaded transcript lexicon from {path} ({len(preprocessor.fillers)} fillers, "
+                    f"{len(preprocessor.replacements)} replacements)")
+        return preprocessor
+    return TranscriptPreprocessor()
+
+# Compiled once at import
+transcript_preprocessor = load_transcript_preprocessor()
+
+def preprocess_transcript(text, preprocessor=None):
+    """
+    Preprocess transcript text for better summarization
     
-    return text.strip()
+    Args:
+        text: Transcript text
+        preprocessor: Optional TranscriptPreprocessor (defaults to the configured lexicon)
+        
+    Returns:
+        Preprocessed text
+    """
+    return (preprocessor or transcript_preprocessor)(text)
+
+# Medical entity types and their categories
+TERM_CATEGORIES = ["diagnoses", "symptoms", "medications", "procedures", "measurements", "test_results", "other"]
+ENTITY_CATEGORIES = {
+    "DISEASE": "diagnoses",
+    "SYMPTOM": "symptoms",
+    "MEDICATION": "medications",
+    "PROCEDURE": "procedures",
+    "TREATMENT": "procedures",
+    "MEASUREMENT": "measurements",
+    "TEST_RESULT": "test_results",
+    "ANATOMY": "other",
+    "CHEMICAL": "other",
+    "TIME": "other"
+}
+
+def normalize_term(text):
+    """Fold case and whitespace so repeated mentions share one key"""
+    return " ".join(text.split()).casefold()
+
+class Term:
+    """One distinct term with its first surface form, mention count and first offset"""
+    __slots__ = ("text", "count", "offset")
+
+    def __init__(self, text, offset):
+        self.text = text
+        self.count = 0
+        self.offset = offset
+
+    def to_dict(self):
+        return {"text": self.text, "count": self.count, "offset": self.offset}
+
+class TermSet:
+    """
+    Insertion-ordered set of terms keyed by their normalized form
+
+    Adding is a single dictionary lookup, so aggregating n entities is O(n)
+    however many of them repeat.
+    """
+
+    def __init__(self):
+        self._terms = {}
+
+    def add(self, text, key=None, offset=None):
+        """
+        Count a mention of a term
+
+        Args:
+            text: Surface form of the mention
+            key: Optional normalized key (defaults to the case-folded text)
+            offset: Optional character offset of the mention
+        """
+        key = normalize_term(text) if key is None else key
+        term = self._terms.get(key)
+        if term is None:
+            term = self._terms[key] = Term(text, offset)
+        term.count += 1
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __bool__(self):
+        return bool(self._terms)
+
+    def __iter__(self):
+        return iter(self._terms.values())
+
+    def __contains__(self, text):
+        return normalize_term(text) in self._terms
+
+    def ranked(self, limit=None):
+        """
+        Terms by mention count, ties in order of first mention
+
+        Args:
+            limit: Optional maximum number of terms
+
+        Returns:
+            List of Term
+        """
+        # Stable sort over distinct terms only, insertion order breaks ties
+        terms = sorted(self._terms.values(), key=lambda term: -term.count)
+        return terms if limit is None else terms[:limit]
+
+class MedicalTerms:
+    """Terms found in a transcript, one TermSet per category"""
+
+    def __init__(self):
+        self.categories = {category: TermSet() for category in TERM_CATEGORIES}
+
+    def __getitem__(self, category):
+        # Ranked term texts, the shape callers used before counts were kept
+        return [term.text for term in self.categories[category].ranked()]
+
+    def add(self, category, text, key=None, offset=None):
+        self.categories[category].add(text, key, offset)
+
+    def to_dict(self, limit=None):
+        """
+        Ranked terms per category for API responses
+
+        Args:
+            limit: Optional maximum number of terms per category
+
+        Returns:
+            Dictionary of category to list of {"text", "count", "offset"}
+        """
+        return {
+            category: [term.to_dict() for term in terms.ranked(limit)]
+            for category, terms in self.categories.items()
+        }
 
 def extract_medical_terms(entities):
     """
     Extract important medical terms from NER results
     
+    Mentions are grouped by their lemma (when the pipeline has a
+    lemmatizer) or text, folded for case and whitespace.
+    
     Args:
-        entities: List of entity dictionaries from NER
+        entities: List of entity dictionaries or spaCy entity spans from NER
         
     Returns:
-        Dictionary of categorized medical terms
-    """
-    medical_categories = {
-        "diagnoses": [],
-        "symptoms": [],
-        "medications": [],
-        "procedures": [],
-        "measurements": [],
-        "test_results": [],
-        "other": []
-    }
-    
-    # Medical entity types and their categories
-    entity_categories = {
-        "DISEASE": "diagnoses",
-        "SYMPTOM": "symptoms",
-        "MEDICATION": "medications",
-        "PROCEDURE": "procedures",
-        "TREATMENT": "procedures",
-        "MEASUREMENT": "measurements",
-        "TEST_RESULT": "test_results",
-        "ANATOMY": "other",
-        "CHEMICAL": "other",
-        "TIME": "other"
-    }
+        MedicalTerms
+    """
+    medical_terms = MedicalTerms()
     
     for entity in entities:
-        category = entity_categories.get(entity["label"], "other")
-        if entity["text"] not in medical_categories[category]:
-            medical_categories[category].append(entity["text"])
+        # spaCy entity spans are read directly, no intermediate dictionaries
+        if isinstance(entity, dict):
+            text, label = entity["text"], entity["label"]
+            lemma, offset = entity.get("lemma"), entity.get("start")
+        else:
+            text, label = entity.text, entity.label_
+            lemma, offset = entity.lemma_, entity.start_char
+        # Without a lemmatizer spaCy leaves lemmas empty
+        key = normalize_term(lemma or "") or normalize_term(text)
+        medical_terms.add(ENTITY_CATEGORIES.get(label, "other"), text, key, offset)
     
-    return medical_categories
+    return medical_terms
+
+def _term_lines(terms):
+    return "  - " + "\n  - ".join(
+        term.text if term.count == 1 else f"{term.text} ({term.count})" for term in terms
+    )
 
 def structure_summary(summarized_text, medical_terms):
     """
@@ -120,7 +487,7 @@ def structure_summary(summarized_text, medical_terms):
     
     Args:
         summarized_text: Raw summarized text
-        medical_terms: Dictionary of categorized medical terms
+        medical_terms: MedicalTerms, listed by how often each term was mentioned
         
     Returns:
         Structured summary text
@@ -138,30 +505,18 @@ def structure_summary(summarized_text, medical_terms):
     # Add key medical information
     sections.append("KEY MEDICAL INFORMATION:")
     
-    if medical_terms["diagnoses"]:
-        sections.append("Diagnoses:")
-        sections.append("  - " + "\n  - ".join(medical_terms["diagnoses"]))
-        sections.append("")
-    
-    if medical_terms["symptoms"]:
-        sections.append("Symptoms:")
-        sections.append("  - " + "\n  - ".join(medical_terms["symptoms"]))
-        sections.append("")
-    
-    if medical_terms["medications"]:
-        sections.append("Medications:")
-        sections.append("  - " + "\n  - ".join(medical_terms["medications"]))
-        sections.append("")
-    
-    if medical_terms["procedures"]:
-        sections.append("Procedures/Treatments:")
-        sections.append("  - " + "\n  - ".join(medical_terms["procedures"]))
-        sections.append("")
-    
-    if medical_terms["test_results"]:
-        sections.append("Test Results:")
-        sections.append("  - " + "\n  - ".join(medical_terms["test_results"]))
-        sections.append("")
+    for category, heading in (
+        ("diagnoses", "Diagnoses:"),
+        ("symptoms", "Symptoms:"),
+        ("medications", "Medications:"),
+        ("procedures", "Procedures/Treatments:"),
+        ("test_results", "Test Results:")
+    ):
+        terms = medical_terms.categories[category].ranked()
+        if terms:
+            sections.append(heading)
+            sections.append(_term_lines(terms))
+            sections.append("")
     
     # Add disclaimer
     sections.append("=" * 25)
@@ -169,54 +524,361 @@ def structure_summary(summarized_text, medical_terms):
     
     return "\n".join(sections)
 
-def generate_medical_summary(transcript, entities=None):
+class MicroBatcher:
     """
-    Generate a structured medical summary from a transcript
+    Collects work items from concurrent callers and processes them in batches
+
+    A background thread waits for the first item, keeps collecting for up to
+    max_wait seconds or until max_batch items are queued, then runs the whole
+    batch at once and hands each caller its own result. Every future of a
+    batch is resolved, with an error if the batch failed or returned the
+    wrong number of results, and items whose callers timed out before their
+    batch started are skipped.
+    """
+
+    def __init__(self, process_batch, max_batch=NLP_MAX_BATCH, max_wait=NLP_BATCH_WINDOW_MS / 1000, name="batcher"):
+        """
+        Args:
+            process_batch: Callable taking a list of items and returning a list of results in order
+            max_batch: Largest number of items processed together
+            max_wait: Seconds to wait for more items after the first arrives
+            name: Name of the worker thread
+        """
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        """
+        Queue an item for the next batch
+
+        Args:
+            item: Work item passed to process_batch
+
+        Returns:
+            concurrent.futures.Future resolving to the item's result
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def results(self, futures, timeout=NLP_BATCH_TIMEOUT):
+        """
+        Wait for the results of submitted items
+
+        Args:
+            futures: Futures from submit()
+            timeout: Seconds to wait for all of them together
+
+        Returns:
+            List of results in the order of futures
+
+        Raises:
+            concurrent.futures.TimeoutError: If the results are not ready in
+                time, the items still queued are then cancelled
+        """
+        deadline = time.monotonic() + timeout
+        try:
+            return [future.result(max(0, deadline - time.monotonic())) for future in futures]
+        except FutureTimeoutError:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def __call__(self, item, timeout=NLP_BATCH_TIMEOUT):
+        return self.results([self.submit(item)], timeout)[0]
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Cancelled futures belong to callers that stopped waiting
+            batch = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = list(self.process_batch([item for item, _ in batch]))
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name} got {len(results)} results for a batch of {len(batch)}")
+                self.batches += 1
+                self.items += len(batch)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                # Even if the thread itself is going down, no caller is left waiting
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"{self.name} stopped before finishing the batch"))
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avgBatchSize": self.items / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize()
+        }
+
+def _ner_batch(texts):
+    return list(model_registry.get("nlp").pipe(texts, batch_size=len(texts)))
+
+def _summarize_batch(requests):
+    # Requests with the same generation settings share one model call
+    results = [None] * len(requests)
+    groups = {}
+    for index, (text, options) in enumerate(requests):
+        groups.setdefault(tuple(sorted(options.items())), []).append(index)
+
+    summarizer = model_registry.get("summarizer")
+    for options, indices in groups.items():
+        summaries = summarizer([requests[i][0] for i in indices], batch_size=len(indices), **dict(options))
+        for index, summary in zip(indices, summaries):
+            results[index] = summary
+    return results
+
+ner_batcher = MicroBatcher(_ner_batch, name="ner-batcher")
+summary_batcher = MicroBatcher(_summarize_batch, name="summary-batcher")
+
+class BatchingSummarizer:
+    """Summarizer interface that sends every input through summary_batcher"""
+
+    def __init__(self, summarizer, batcher=summary_batcher):
+        self.summarizer = summarizer
+        self.batcher = batcher
+        self.max_input_tokens = summarizer.max_input_tokens
+
+    def count_tokens(self, text):
+        return self.summarizer.count_tokens(text)
+
+    def __call__(self, text, **kwargs):
+        texts = text if isinstance(text, list) else [text]
+        return self.batcher.results([self.batcher.submit((item, kwargs)) for item in texts])
+
+def split_sentences(text, doc=None):
+    """
+    Split text into sentences
+    
+    Args:
+        text: Text to split
+        doc: Optional spaCy Doc of the text, reused if it has sentence boundaries
+        
+    Returns:
+        List of sentence strings
+    """
+    if doc is not None and doc.has_annotation("SENT_START"):
+        return [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+    return [sentence for sentence in re.split(r'(?<=[.!?])\s+', text) if sentence]
+
+def chunk_sentences(sentences, max_tokens, count_tokens):
+    """
+    Group consecutive sentences into chunks that fit the summarizer's input
+    
+    Sentences too long on their own are split on word boundaries.
+    
+    Args:
+        sentences: List of sentence strings
+        max_tokens: Token budget of each chunk
+        count_tokens: Callable returning the number of tokens in a string
+        
+    Returns:
+        List of chunk strings
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    
+    for sentence in sentences:
+        tokens = count_tokens(sentence)
+        if tokens > max_tokens:
+            # Approximate split for run-on sentences, e.g. unpunctuated transcripts
+            words = sentence.split()
+            step = max(1, len(words) * max_tokens // tokens)
+            pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            pieces = [sentence]
+        
+        for piece in pieces:
+            piece_tokens = tokens if len(pieces) == 1 else count_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append(" ".join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+def _summary_text(result):
+    # Pipelines return a dict per input, or a one-item list of dicts
+    while isinstance(result, list):
+        result = result[0]
+    return result['summary_text']
+
+def summarize_long_text(text, summarizer, doc=None, batch_size=SUMMARY_BATCH_SIZE):
+    """
+    Summarize text of any length with chunked map-reduce
+    
+    The text is split on sentence boundaries into chunks that fit the model.
+    Chunks are summarized in batches and their summaries are chunked and
+    summarized again until one chunk remains. Each level shrinks the text,
+    so total work grows linearly with the transcript and every part of it
+    reaches the final summary.
+    
+    Args:
+        text: Text to summarize
+        summarizer: Summarizer with count_tokens() and max_input_tokens
+        doc: Optional spaCy Doc of the text for sentence boundaries
+        batch_size: Chunks summarized per model call (None for all at once)
+        
+    Returns:
+        Summary text
+    """
+    max_tokens = summarizer.max_input_tokens
+    chunks = chunk_sentences(split_sentences(text, doc), max_tokens, summarizer.count_tokens)
+    
+    while len(chunks) > 1:
+        max_length = min(SUMMARY_CHUNK_MAX_LENGTH, max_tokens // 2)
+        step = batch_size or len(chunks)
+        summaries = []
+        for start in range(0, len(chunks), step):
+            results = summarizer(
+                chunks[start:start + step],
+                max_length=max_length,
+                min_length=min(30, max_length // 2),
+                do_sample=False
+            )
+            summaries.extend(_summary_text(result) for result in results)
+        
+        reduced = chunk_sentences(summaries, max_tokens, summarizer.count_tokens)
+        if len(reduced) >= len(chunks):
+            # Summaries didn't shrink (e.g. degenerate model output), stop reducing
+            reduced = [" ".join(summaries)]
+        chunks = reduced
+    
+    final_text = chunks[0] if chunks else text
+    if len(final_text.split()) < SUMMARY_MIN_WORDS:
+        # Half of a few words leaves the model no room for a summary
+        return final_text
+    
+    max_length = min(1024, len(final_text.split()) // 2)
+    min_length = min(50, max_length // 2)
+    
+    summarized = summarizer(
+        final_text, 
+        max_length=max_length, 
+        min_length=min_length, 
+        do_sample=False
+    )
+    return _summary_text(summarized)
+
+def summary_config():
+    """
+    Settings that determine the summary and terms produced for a transcript
+    
+    Loads the NLP and summarization models if they are not loaded yet, since
+    a fallback model gives different results.
+    
+    Returns:
+        Dictionary of model identities and text processing parameters
+    """
+    nlp = model_registry.get("nlp")
+    return {
+        "nlp": [nlp.meta.get("name"), nlp.meta.get("version"), NLP_PROFILE],
+        "summarizer": model_registry.get("summarizer").info,
+        "lexicon": [transcript_preprocessor.fillers, transcript_preprocessor.replacements],
+        "chunks": [SUMMARY_CHUNK_TOKENS, SUMMARY_CHUNK_MAX_LENGTH, SUMMARY_MIN_WORDS]
+    }
+
+def summarize_visit(transcript, entities=None, on_stage=None):
+    """
+    Summarize a transcript and collect its medical terms
+    
+    NER and summarization are batched with other concurrent requests unless
+    NLP_BATCHING is off.
     
     Args:
         transcript: Text transcript of doctor-patient conversation
         entities: Optional pre-extracted medical entities
+        on_stage: Optional callback called with 'ner' and 'summarize' as each step starts
         
     Returns:
-        Structured summary text
+        Tuple of (structured summary text, MedicalTerms)
     """
-    try:
-        # Preprocess transcript
+    # Preprocess transcript
+    with timed("preprocess"):
         preprocessed_text = preprocess_transcript(transcript)
-        
-        # Extract entities if not provided
+    
+    # A silent recording has nothing to tag or summarize
+    if not re.search(r"\w", preprocessed_text):
+        return NO_SPEECH_SUMMARY, MedicalTerms()
+    
+    # Extract entities if not provided
+    if on_stage:
+        on_stage("ner")
+    doc = None
+    with timed("ner"):
         if entities is None:
-            doc = nlp(preprocessed_text)
-            entities = []
-            for ent in doc.ents:
-                entities.append({
-                    "text": ent.text,
-                    "label": ent.label_,
-                    "start": ent.start_char,
-                    "end": ent.end_char
-                })
+            doc = ner_batcher(preprocessed_text) if NLP_BATCHING else model_registry.get("nlp")(preprocessed_text)
+            # The same Doc supplies the entities here and the sentences for summarization
+            entities = doc.ents
         
         # Categorize medical terms
         medical_terms = extract_medical_terms(entities)
+    
+    # Generate summary
+    if on_stage:
+        on_stage("summarize")
+    summarizer = model_registry.get("summarizer")
+    with timed("summarize"):
+        if NLP_BATCHING:
+            # The batcher sizes the model calls, so submit every chunk at once
+            summarized_text = summarize_long_text(preprocessed_text, BatchingSummarizer(summarizer), doc=doc, batch_size=None)
+        else:
+            summarized_text = summarize_long_text(preprocessed_text, summarizer, doc=doc)
+    
+    # Structure the summary
+    return structure_summary(summarized_text, medical_terms), medical_terms
+
+def generate_medical_summary(transcript, entities=None, on_stage=None):
+    """
+    Generate a structured medical summary from a transcript
+    
+    Args:
+        transcript: Text transcript of doctor-patient conversation
+        entities: Optional pre-extracted medical entities
+        on_stage: Optional callback called with 'ner' and 'summarize' as each step starts
         
-        # Generate summary
-        max_length = min(1024, len(preprocessed_text.split()) // 2)
-        min_length = min(50, max_length // 2)
-        
-        summarized = summarizer(
-            preprocessed_text, 
-            max_length=max_length, 
-            min_length=min_length, 
-            do_sample=False
-        )
-        
-        summarized_text = summarized[0]['summary_text']
-        
-        # Structure the summary
-        structured_summary = structure_summary(summarized_text, medical_terms)
-        
-        return structured_summary
+    Returns:
+        Structured summary text
+    """
+    try:
+        return summarize_visit(transcript, entities, on_stage)[0]
     
     except Exception as e:
         logger.error(f"Error generating summary: {str(e)}")
-        return f"Error generating summary: {str(e)}"
\ No newline at end of file
+        return f"Error generating summary: {str(e)}"
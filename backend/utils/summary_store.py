@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+import os
+import json
+import uuid
+import sqlite3
+import datetime
+import threading
+import logging
+from utils.hipaa_compliance import encrypt_data, decrypt_data, SERVICE_USER
+from utils.audit import audit_log
+from utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SEGMENT_BYTES = int(os.environ.get("SUMMARY_SEGMENT_BYTES", 64 * 1024 * 1024))  # Size a segment is closed at
+
+class SummaryStore:
+    """
+    Encrypted visit summaries packed into segment files and indexed in SQLite
+
+    Each summary is encrypted with encrypt_data and appended to the current
+    segment; the index maps its ID to the segment, offset and length and
+    orders a patient's visits by date. Fetching a summary or a page of a
+    patient's history is an index lookup plus one read per summary, however
+    many visits are stored. Bytes appended by a write that never reached the
+    index are unreferenced and ignored.
+    """
+
+    def __init__(self, directory, segment_bytes=SUMMARY_SEGMENT_BYTES):
+        """
+        Args:
+            directory: Directory holding the segments and the index
+            segment_bytes: Size at which a new segment is started
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                summary_id TEXT NOT NULL UNIQUE,
+                patient_id TEXT NOT NULL,
+                visit_date TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS summaries_patient ON summaries (patient_id, visit_date, seq)"
+        )
+        self._conn.commit()
+
+        segments = sorted(
+            int(name[10:16]) for name in os.listdir(directory)
+            if name.startswith("summaries-") and name.endswith(".seg")
+        )
+        self._segment = segments[-1] if segments else 1
+        self._file = open(self._segment_path(self._segment), "ab")
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"summaries-{segment:06d}.seg")
+
+    def _metadata(self, row):
+        return {
+            "summaryId": row["summary_id"],
+            "patientId": row["patient_id"],
+            "visitDate": row["visit_date"],
+            "createdAt": row["created_at"],
+            "size": row["size"]
+        }
+
+    def _read(self, row):
+        with open(self._segment_path(row["segment"]), "rb") as f:
+            f.seek(row["offset"])
+            encrypted = f.read(row["size"])
+        return json.loads(decrypt_data(encrypted))
+
+    def put(self, patient_id, visit_date, summary, medical_terms=None, user=None):
+        """
+        Encrypt and store a visit summary
+
+        Args:
+            patient_id: ID of the patient
+            visit_date: Date of the visit, ISO format so dates sort correctly
+            summary: Summary text
+            medical_terms: Optional medical terms returned with the summary
+            user: Optional user responsible for the write, for the audit trail
+
+        Returns:
+            ID of the stored summary
+        """
+        summary_id = str(uuid.uuid4())
+        encrypted = encrypt_data(json.dumps({"summary": summary, "medicalTerms": medical_terms or {}}))
+
+        with self._lock, timed("disk_write"):
+            if self._file.tell() >= self.segment_bytes:
+                self._file.close()
+                self._segment += 1
+                self._file = open(self._segment_path(self._segment), "ab")
+
+            offset = self._file.tell()
+            self._file.write(encrypted)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            self._conn.execute(
+                "INSERT INTO summaries (summary_id, patient_id, visit_date, created_at, segment, offset, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (summary_id, patient_id, visit_date or "", datetime.datetime.now().isoformat(),
+                 self._segment, offset, len(encrypted))
+            )
+            self._conn.commit()
+
+        audit_log.record("store_summary", patient_id, summary_id=summary_id, user=user or SERVICE_USER)
+        logger.info(f"Summary stored for patient: {patient_id}")
+        return summary_id
+
+    def patient_id(self, summary_id):
+        """
+        Look up whose summary an ID refers to, without reading the summary
+
+        Args:
+            summary_id: ID returned by put()
+
+        Returns:
+            ID of the patient, or None if not found
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT patient_id FROM summaries WHERE summary_id = ?", (summary_id,)
+            ).fetchone()
+        return row["patient_id"] if row is not None else None
+
+    def get(self, summary_id, user=None):
+        """
+        Fetch and decrypt a summary
+
+        Args:
+            summary_id: ID returned by put()
+            user: Optional user reading the summary, for the audit trail
+
+        Returns:
+            Dictionary of metadata, summary and medical terms, or None if not found
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM summaries WHERE summary_id = ?", (summary_id,)).fetchone()
+        if row is None:
+            return None
+
+        summary = self._metadata(row)
+        summary.update(self._read(row))
+        audit_log.record("read_summary", row["patient_id"], summary_id=summary_id, user=user or SERVICE_USER)
+        return summary
+
+    def history(self, patient_id, limit=20, before=None, include_summaries=False, user=None):
+        """
+        Page through a patient's visits, most recent first
+
+        Args:
+            patient_id: ID of the patient
+            limit: Maximum number of visits in the page
+            before: Optional summary ID, only visits listed after it are returned
+            include_summaries: Decrypt and include each summary, not only its metadata
+            user: Optional user reading the summaries, for the audit trail
+
+        Returns:
+            Tuple of (list of visit dictionaries, summary ID to pass as before for the next page or None)
+        """
+        query = "SELECT * FROM summaries WHERE patient_id = ?"
+        params = [patient_id]
+        if before is not None:
+            # Keyset pagination, so deep pages cost the same as the first
+            query += " AND (visit_date, seq) < (SELECT visit_date, seq FROM summaries WHERE summary_id = ?)"
+            params.append(before)
+        query += " ORDER BY visit_date DESC, seq DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        visits = []
+        for row in rows[:limit]:
+            visit = self._metadata(row)
+            if include_summaries:
+                visit.update(self._read(row))
+            visits.append(visit)
+        if include_summaries and visits:
+            audit_log.record("read_summaries", patient_id, summary_ids=[visit["summaryId"] for visit in visits],
+                             user=user or SERVICE_USER)
+
+        next_cursor = visits[-1]["summaryId"] if len(rows) > limit else None
+        return visits, next_cursor
+
+    def count(self, patient_id=None):
+        with self._lock:
+            if patient_id is None:
+                return self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM summaries WHERE patient_id = ?", (patient_id,)
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._conn.close()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+import os
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from utils.metrics import metrics, record_stage, max_rss_bytes, MAX_RSS_BYTES, RTF_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "tiny")  # Use tiny model for demo, medical fine-tuned in production
+TRANSCRIPTION_WORKERS = int(os.environ.get("TRANSCRIPTION_WORKERS", 1))
+TRANSCRIPTION_QUEUE_SIZE = int(os.environ.get("TRANSCRIPTION_QUEUE_SIZE", 4))
+QUEUE_POLL_INTERVAL = 0.5  # Seconds between capacity checks for waiting submitters
+WHISPER_SAMPLE_RATE = 16000  # Rate of array input, for the real-time factor
+WARM_UP_TIMEOUT = float(os.environ.get("TRANSCRIPTION_WARM_UP_TIMEOUT", 600))  # Seconds to wait for every worker
+WARM_UP_HOLD_SECONDS = 0.1  # Readiness checks keep a worker busy briefly so the others pick up theirs
+
+WHISPER_RTF = metrics.histogram(
+    "whisper_real_time_factor", "Whisper decode seconds per second of speech", buckets=RTF_BUCKETS
+)
+
+# Whisper model owned by the current worker process
+_worker_model = None
+
+def _init_worker(model_name):
+    """
+    Load the Whisper model once per worker process
+
+    Args:
+        model_name: Name of the Whisper model to load
+    """
+    global _worker_model
+    import whisper
+
+    logger.info(f"Loading Whisper model '{model_name}' in worker {os.getpid()}")
+    _worker_model = whisper.load_model(model_name)
+
+def _transcribe_in_worker(audio, options):
+    """
+    Transcribe audio with the worker's model
+
+    Args:
+        audio: Path to an audio file or a 16 kHz float32 numpy array
+        options: Keyword arguments for model.transcribe()
+
+    Returns:
+        Tuple of (transcription result, wall-clock start time, decode seconds, worker peak memory in bytes)
+    """
+    started_at = time.time()
+    result = _worker_model.transcribe(audio, **options)
+    return result, started_at, time.time() - started_at, max_rss_bytes()
+
+def _worker_ready(hold=0.0):
+    """
+    Report whether this worker has its model loaded
+
+    Args:
+        hold: Seconds to stay busy, so other idle workers take the next checks
+
+    Returns:
+        Tuple of (worker identity, whether the model is loaded)
+    """
+    time.sleep(hold)
+    return (os.getpid(), threading.get_ident()), _worker_model is not None
+
+class QueueFullError(Exception):
+    """Raised when the transcription queue cannot accept another job"""
+
+class TranscriptionExecutor:
+    """
+    Pool of Whisper worker processes behind a bounded job queue
+
+    Jobs are awaited from async request handlers without blocking the event
+    loop. Once every worker is busy and the queue holds max_queue jobs,
+    further submissions fail fast with QueueFullError. If a worker dies
+    (e.g. killed for running out of memory) its job fails and the pool is
+    replaced on the next submission.
+    """
+
+    def __init__(self, model_name=WHISPER_MODEL, workers=TRANSCRIPTION_WORKERS, max_queue=TRANSCRIPTION_QUEUE_SIZE):
+        """
+        Args:
+            model_name: Name of the Whisper model each worker loads
+            workers: Number of worker processes
+            max_queue: Number of jobs allowed to wait for a free worker
+        """
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = None
+        self._pool_lock = threading.Lock()  # warm_up() and transcribe() can start the pool from different threads
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_decode = 0.0
+        self._max_decode = 0.0
+        self._worker_max_rss = 0
+
+    def _create_pool(self):
+        # Spawn rather than fork so workers don't inherit the server's threads
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_name,)
+        )
+
+    def start(self):
+        """
+        Start the worker processes
+
+        Returns:
+            The running pool
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                logger.info(f"Starting {self.workers} transcription worker(s) with queue size {self.max_queue}")
+                self._pool = self._create_pool()
+            return self._pool
+
+    def _discard_pool(self, pool):
+        """Shut down a broken pool so the next submission starts a new one"""
+        with self._pool_lock:
+            if self._pool is pool:
+                logger.error("Transcription worker died, restarting the worker pool")
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self, timeout=WARM_UP_TIMEOUT):
+        """
+        Start the workers and wait until each one has loaded the model
+
+        Readiness checks are submitted until every worker has answered one,
+        since a fast worker can take several checks meant for its siblings.
+
+        Args:
+            timeout: Seconds to wait for all workers
+
+        Returns:
+            The executor, so it can be registered as a model loader
+
+        Raises:
+            RuntimeError: If a worker has no model or not all workers answer in time
+        """
+        pool = self.start()
+        deadline = time.monotonic() + timeout
+        ready = set()
+        while len(ready) < self.workers:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Only {len(ready)} of {self.workers} transcription workers became ready")
+            futures = [pool.submit(_worker_ready, WARM_UP_HOLD_SECONDS) for _ in range(self.workers - len(ready))]
+            for future in futures:
+                try:
+                    worker, loaded = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FutureTimeoutError:
+                    break
+                except BrokenProcessPool:
+                    self._discard_pool(pool)
+                    raise RuntimeError("Transcription worker died while loading the model")
+                if not loaded:
+                    raise RuntimeError("Transcription worker has no model loaded")
+                ready.add(worker)
+        return self
+
+    def shutdown(self):
+        """Stop the worker processes, cancelling queued jobs"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def capacity(self):
+        """Maximum number of jobs running or queued at once"""
+        return self.workers + self.max_queue
+
+    async def transcribe(self, audio, wait=False, **options):
+        """
+        Transcribe audio in a worker process
+
+        Args:
+            audio: Path to an audio file or a 16 kHz float32 numpy array
+            wait: Wait for room in the queue instead of failing when it is full
+            **options: Keyword arguments for model.transcribe()
+
+        Returns:
+            Whisper transcription result dictionary
+
+        Raises:
+            QueueFullError: If the queue is full and wait is False
+        """
+        while self._pending >= self.capacity:
+            if not wait:
+                self._rejected += 1
+                raise QueueFullError(f"Transcription queue is full ({self._pending} jobs pending)")
+            await asyncio.sleep(QUEUE_POLL_INTERVAL)
+
+        pool = self.start()
+        self._pending += 1
+        submitted_at = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started_at, decode_time, worker_rss = await loop.run_in_executor(
+                pool, _transcribe_in_worker, audio, options
+            )
+        except BrokenProcessPool:
+            self._failed += 1
+            self._discard_pool(pool)
+            raise
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        wait_time = max(0.0, started_at - submitted_at)
+        self._completed += 1
+        self._total_wait += wait_time
+        self._max_wait = max(self._max_wait, wait_time)
+        self._total_decode += decode_time
+        self._max_decode = max(self._max_decode, decode_time)
+        
+        record_stage("transcribe_wait", wait_time)
+        record_stage("transcribe_decode", decode_time)
+        if not isinstance(audio, str) and len(audio):
+            WHISPER_RTF.observe(decode_time / (len(audio) / WHISPER_SAMPLE_RATE))
+        if worker_rss is not None:
+            self._worker_max_rss = max(self._worker_max_rss, worker_rss)
+            MAX_RSS_BYTES.set_max(worker_rss, process="transcription_worker")
+        return result
+
+    def stats(self):
+        """
+        Report queue and timing statistics for sizing the pool
+
+        Returns:
+            Dictionary of executor statistics
+        """
+        running = min(self._pending, self.workers)
+        completed = self._completed or 1
+        return {
+            "model": self.model_name,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": running,
+            "queue_depth": self._pending - running,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "avg_wait_seconds": self._total_wait / completed,
+            "max_wait_seconds": self._max_wait,
+            "avg_decode_seconds": self._total_decode / completed,
+            "max_decode_seconds": self._max_decode,
+            "worker_max_rss_bytes": self._worker_max_rss
+        }
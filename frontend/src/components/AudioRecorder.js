@@ -19,6 +19,13 @@ import PauseIcon from '@mui/icons-material/Pause';
 import PlayArrowIcon from '@mui/icons-material/PlayArrow';
 import UploadFileIcon from '@mui/icons-material/UploadFile';
 import axios from 'axios';
+import apiService from '../services/api';
+
+// Recordings stream to the server as the recorder's WebM/Opus chunks (a few KB per second);
+// browsers that can't record Opus send 16-bit PCM at 16 kHz instead
+const STREAM_MIME_TYPE = 'audio/webm;codecs=opus';
+const STREAM_TIMESLICE_MS = 1000;
+const STREAM_PCM_SAMPLE_RATE = 16000;
 
 const AudioRecorder = ({ onRecordingComplete }) => {
   const [isRecording, setIsRecording] = useState(false);
@@ -36,6 +43,11 @@ const AudioRecorder = ({ onRecordingComplete }) => {
   const timerRef = useRef(null);
   const audioRef = useRef(new Audio());
   const streamRef = useRef(null);
+  const sessionIdRef = useRef(null);
+  const audioStreamRef = useRef(null);
+  const audioContextRef = useRef(null);
+  const sendQueueRef = useRef(Promise.resolve());
+  const isPausedRef = useRef(false);
 
   const theme = useTheme();
   const isMobile = useMediaQuery(theme.breakpoints.down('sm'));
@@ -55,6 +67,11 @@ const AudioRecorder = ({ onRecordingComplete }) => {
         clearInterval(timerRef.current);
       }
       
+      if (audioContextRef.current) {
+        audioContextRef.current.close();
+        audioContextRef.current = null;
+      }
+      
       if (audioUrl) {
         URL.revokeObjectURL(audioUrl);
       }
@@ -101,23 +118,77 @@ const AudioRecorder = ({ onRecordingComplete }) => {
     return `${mins.toString().padStart(2, '0')}:${secs.toString().padStart(2, '0')}`;
   };
   
+  // Send the microphone audio to the server while recording, so it is transcribed as the visit goes on
+  const startLiveStream = (stream, streamOpus) => {
+    const sessionId = crypto.randomUUID();
+    const audioStream = apiService.openAudioStream(sessionId, {
+      codec: streamOpus ? 'opus' : 's16',
+      sampleRate: streamOpus ? undefined : STREAM_PCM_SAMPLE_RATE,
+      onError: message => console.error('Live stream error:', message)
+    });
+    
+    sessionIdRef.current = sessionId;
+    audioStreamRef.current = audioStream;
+    sendQueueRef.current = Promise.resolve();
+    if (streamOpus) {
+      // The recorder's own chunks are sent as they arrive
+      return;
+    }
+    
+    const context = new AudioContext({ sampleRate: STREAM_PCM_SAMPLE_RATE });
+    const source = context.createMediaStreamSource(stream);
+    const processor = context.createScriptProcessor(4096, 1, 1);
+    processor.onaudioprocess = (event) => {
+      if (!isPausedRef.current) {
+        const samples = event.inputBuffer.getChannelData(0);
+        const pcm = new Int16Array(samples.length);
+        for (let i = 0; i < samples.length; i++) {
+          pcm[i] = Math.max(-32768, Math.min(32767, Math.round(samples[i] * 32768)));
+        }
+        audioStream.send(pcm);
+      }
+    };
+    source.connect(processor);
+    processor.connect(context.destination);
+    audioContextRef.current = context;
+  };
+  
+  // Blobs are read asynchronously, so sends are chained to keep the chunks in order
+  const sendRecorderChunk = (blob) => {
+    const audioStream = audioStreamRef.current;
+    sendQueueRef.current = sendQueueRef.current
+      .then(() => blob.arrayBuffer())
+      .then(buffer => audioStream.send(buffer));
+  };
+  
+  const stopLiveStream = () => {
+    if (audioContextRef.current) {
+      audioContextRef.current.close();
+      audioContextRef.current = null;
+    }
+  };
+  
   const startRecording = async () => {
     try {
       setError('');
       const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
       streamRef.current = stream;
       
-      mediaRecorderRef.current = new MediaRecorder(stream);
+      const streamOpus = MediaRecorder.isTypeSupported(STREAM_MIME_TYPE);
+      mediaRecorderRef.current = new MediaRecorder(stream, streamOpus ? { mimeType: STREAM_MIME_TYPE } : undefined);
       audioChunksRef.current = [];
       
       mediaRecorderRef.current.ondataavailable = (event) => {
         if (event.data.size > 0) {
           audioChunksRef.current.push(event.data);
+          if (streamOpus) {
+            sendRecorderChunk(event.data);
+          }
         }
       };
       
       mediaRecorderRef.current.onstop = () => {
-        const audioBlob = new Blob(audioChunksRef.current, { type: 'audio/wav' });
+        const audioBlob = new Blob(audioChunksRef.current, { type: mediaRecorderRef.current.mimeType || 'audio/wav' });
         const audioUrl = URL.createObjectURL(audioBlob);
         setAudioBlob(audioBlob);
         setAudioUrl(audioUrl);
@@ -127,7 +198,9 @@ const AudioRecorder = ({ onRecordingComplete }) => {
         streamRef.current.getTracks().forEach(track => track.stop());
       };
       
-      mediaRecorderRef.current.start();
+      isPausedRef.current = false;
+      startLiveStream(stream, streamOpus);
+      mediaRecorderRef.current.start(streamOpus ? STREAM_TIMESLICE_MS : undefined);
       setIsRecording(true);
       setRecordingTime(0);
     } catch (err) {
@@ -139,6 +212,7 @@ const AudioRecorder = ({ onRecordingComplete }) => {
   const stopRecording = () => {
     if (mediaRecorderRef.current && mediaRecorderRef.current.state !== 'inactive') {
       mediaRecorderRef.current.stop();
+      stopLiveStream();
       setIsRecording(false);
       setIsPaused(false);
     }
@@ -148,10 +222,12 @@ const AudioRecorder = ({ onRecordingComplete }) => {
     if (isPaused) {
       // Resume recording
       mediaRecorderRef.current.resume();
+      isPausedRef.current = false;
       setIsPaused(false);
     } else {
       // Pause recording
       mediaRecorderRef.current.pause();
+      isPausedRef.current = true;
       setIsPaused(true);
     }
   };
@@ -174,6 +250,8 @@ const AudioRecorder = ({ onRecordingComplete }) => {
     setAudioBlob(null);
     setAudioUrl(null);
     setRecordingTime(0);
+    sessionIdRef.current = null;
+    audioStreamRef.current = null;
   };
   
   const processAudio = async () => {
@@ -183,6 +261,31 @@ const AudioRecorder = ({ onRecordingComplete }) => {
     setError('');
     
     try {
+      if (sessionIdRef.current) {
+        // Recorded here, the audio is already on the server unless the stream lost some of it
+        let streamed = false;
+        try {
+          await sendQueueRef.current;
+          const { rejected } = await audioStreamRef.current.close();
+          streamed = rejected.length === 0;
+        } catch (err) {
+          console.error('Live stream did not finish:', err);
+        }
+        
+        if (streamed) {
+          const response = await apiService.completeStream(sessionIdRef.current, {
+            patientId: 'DEMO123', // This would come from props/context in a real app
+            visitDate: new Date().toISOString().split('T')[0]
+          });
+          setIsProcessing(false);
+          onRecordingComplete(response.data);
+          return;
+        }
+        // The whole recording is still here, so upload it instead
+        sessionIdRef.current = null;
+        audioStreamRef.current = null;
+      }
+      
       const formData = new FormData();
       formData.append('audio', audioBlob);
       formData.append('patientId', 'DEMO123'); // This would come from props/context in a real app
@@ -208,7 +311,7 @@ const AudioRecorder = ({ onRecordingComplete }) => {
       }
     } catch (err) {
       console.error('Error processing audio:', err);
-      setError('Error processing audio: ' + (err.response?.data?.error || err.message));
+      setError('Error processing audio: ' + (err.response?.data?.error || err.detail || err.message));
       setIsProcessing(false);
       setUploadProgress(0);
     }
@@ -226,6 +329,8 @@ const AudioRecorder = ({ onRecordingComplete }) => {
     
     const reader = new FileReader();
     reader.onload = () => {
+      sessionIdRef.current = null;
+      audioStreamRef.current = null;
       const blob = new Blob([reader.result], { type: file.type });
       const url = URL.createObjectURL(blob);
       
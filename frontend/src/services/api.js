@@ -9,6 +9,9 @@ const api = axios.create({
   }
 });
 
+// How long closing a live audio stream waits for outstanding chunks to be acknowledged
+const STREAM_CLOSE_TIMEOUT_MS = 15000;
+
 // API service functions
 export const apiService = {
   // Health check
@@ -50,19 +53,149 @@ export const apiService = {
     return await api.get(`/summaries/${summaryId}`);
   },
   
+  // Get a page of a patient's visits, most recent first
+  getPatientSummaries: async (patientId, { limit = 20, before, includeSummaries = false } = {}) => {
+    return await api.get(`/patients/${patientId}/summaries`, {
+      params: { limit, before, include_summaries: includeSummaries }
+    });
+  },
+  
   // Delete a summary
   deleteSummary: async (summaryId) => {
     return await api.delete(`/summaries/${summaryId}`);
   },
   
-  // Stream audio chunks
-  streamAudioChunk: async (chunk, sessionId) => {
-    return await api.post('/stream-audio', chunk, {
-      headers: {
-        'Content-Type': 'application/octet-stream',
-        'X-Session-ID': sessionId
+  // Stream audio chunks ('f32' or 's16' PCM, or 'opus' WebM chunks from a MediaRecorder)
+  streamAudioChunk: async (chunk, sessionId, seq, { codec, sampleRate } = {}) => {
+    const headers = {
+      'Content-Type': 'application/octet-stream',
+      'X-Session-ID': sessionId
+    };
+    if (seq !== undefined) {
+      headers['X-Chunk-Seq'] = String(seq);
+    }
+    if (codec) {
+      headers['X-Chunk-Codec'] = codec;
+    }
+    if (sampleRate) {
+      headers['X-Sample-Rate'] = String(sampleRate);
+    }
+    return await api.post('/stream-audio', chunk, { headers });
+  },
+  
+  // Stream audio chunks over a WebSocket, resending anything not acknowledged after a reconnect
+  openAudioStream: (sessionId, { codec, sampleRate, onAck, onError } = {}) => {
+    const base = new URL(api.defaults.baseURL, window.location.href);
+    base.protocol = base.protocol === 'https:' ? 'wss:' : 'ws:';
+    const query = new URLSearchParams();
+    if (codec) query.set('codec', codec);
+    if (sampleRate) query.set('sampleRate', String(sampleRate));
+    const url = `${base.href.replace(/\/$/, '')}/stream-audio/${sessionId}/ws?${query}`;
+    
+    const unacked = new Map(); // seq -> frame
+    const rejected = []; // seqs the server refused, never resent
+    let nextSeq = 0;
+    let socket = null;
+    let closing = false;
+    let abandoned = false;
+    let drained = null;
+    
+    // Chunks are typed arrays of samples or ArrayBuffers of encoded audio
+    const frame = (seq, chunk) => {
+      const bytes = ArrayBuffer.isView(chunk)
+        ? new Uint8Array(chunk.buffer, chunk.byteOffset, chunk.byteLength)
+        : new Uint8Array(chunk);
+      const buffer = new ArrayBuffer(4 + bytes.byteLength);
+      new DataView(buffer).setUint32(0, seq, true);
+      new Uint8Array(buffer, 4).set(bytes);
+      return buffer;
+    };
+    
+    // The server has everything before `from`, resend the rest in order (once per gap)
+    let lastResend = null;
+    const resendFrom = from => {
+      [...unacked.keys()].filter(seq => seq < from).forEach(seq => unacked.delete(seq));
+      if (from === lastResend) return;
+      lastResend = from;
+      [...unacked.entries()].sort(([a], [b]) => a - b).forEach(([, data]) => socket.send(data));
+    };
+    
+    const checkDrained = () => {
+      if (drained && unacked.size === 0) {
+        socket.close();
+        drained({ rejected });
       }
+    };
+    
+    const connect = () => {
+      socket = new WebSocket(url);
+      socket.binaryType = 'arraybuffer';
+      socket.onmessage = event => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'ready') {
+          lastResend = null;
+          resendFrom(message.nextSeq);
+        } else if (message.type === 'ack') {
+          unacked.delete(message.seq);
+          if (onAck) onAck(message);
+        } else if (message.type === 'error' && message.code === 'gap') {
+          resendFrom(message.expectedSeq);
+        } else if (message.type === 'error') {
+          // Resending a chunk the server refused would only be refused again
+          if (message.seq !== undefined && unacked.delete(message.seq)) {
+            rejected.push(message.seq);
+          }
+          if (onError) onError(message);
+        }
+        checkDrained();
+      };
+      socket.onclose = () => {
+        if (!abandoned && (!closing || unacked.size > 0)) {
+          setTimeout(connect, 1000);
+        }
+      };
+    };
+    connect();
+    
+    return {
+      send: chunk => {
+        const seq = nextSeq++;
+        const data = frame(seq, chunk);
+        unacked.set(seq, data);
+        if (socket.readyState === WebSocket.OPEN) {
+          socket.send(data);
+        }
+      },
+      // Resolves with the rejected seqs once every other chunk has been acknowledged,
+      // rejects if that takes longer than timeoutMs
+      close: (timeoutMs = STREAM_CLOSE_TIMEOUT_MS) => new Promise((resolve, reject) => {
+        closing = true;
+        const timer = setTimeout(() => {
+          abandoned = true;
+          drained = null;
+          socket.close();
+          reject(new Error(`${unacked.size} audio chunk(s) were not acknowledged`));
+        }, timeoutMs);
+        drained = result => {
+          clearTimeout(timer);
+          resolve(result);
+        };
+        if (socket.readyState === WebSocket.OPEN) {
+          checkDrained();
+        }
+      })
+    };
+  },
+  
+  // Subscribe to partial transcripts for a live session (server-sent events)
+  subscribeTranscript: (sessionId, onSegment, onComplete) => {
+    const source = new EventSource(`${api.defaults.baseURL}/stream-audio/${sessionId}/transcript`);
+    source.onmessage = event => onSegment(JSON.parse(event.data));
+    source.addEventListener('complete', () => {
+      source.close();
+      if (onComplete) onComplete();
     });
+    return source;
   },
   
   // Complete audio stream processing